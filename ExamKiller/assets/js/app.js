@@ -178,23 +178,28 @@ async function handleFileUpload(file) {
     }, 200);
     
     try {
-        const paperData = {
-            title: fileName,
-            subject: subject,
-            course: course,
-            chapter: chapter || undefined,
-            difficulty: parseFloat(difficulty),
-            exam_date: examDate || undefined
-        };
+        const formData = new FormData();
+        formData.append('file', file);
+        formData.append('title', fileName);
+        formData.append('subject', subject);
+        formData.append('course', course);
+        if (chapter) formData.append('chapter', chapter);
+        formData.append('difficulty', difficulty);
+        if (examDate) formData.append('exam_date', examDate);
         
-        const result = await apiRequest('/papers/upload', {
+        // multipart 上传不能带 JSON 的 Content-Type，由浏览器自动生成 boundary
+        const response = await fetch(`${API_BASE_URL}/papers/upload/file`, {
             method: 'POST',
-            body: JSON.stringify(paperData)
+            body: formData
         });
+        const result = await response.json();
+        if (!response.ok) {
+            throw new Error(result.detail || '请求失败');
+        }
         
         if (result.success) {
             setTimeout(() => {
-                showToast('试卷上传并分析完成！', 'success');
+                showToast(result.deduplicated ? '该试卷已上传过，已直接载入分析结果' : '试卷上传并分析完成！', 'success');
                 loadPapers();
                 resetUploadForm();
             }, 1000);
@@ -326,6 +331,14 @@ function initVoiceRecord() {
     const recordBtn = document.getElementById('recordBtn');
     const recordStatus = document.getElementById('recordStatus');
     const voiceWave = document.getElementById('voiceWave');
+    let recorder = null;
+    
+    const resetRecordUI = (statusText) => {
+        isRecording = false;
+        recordBtn.classList.remove('recording');
+        if (recordStatus) recordStatus.textContent = statusText;
+        if (voiceWave) voiceWave.style.display = 'none';
+    };
     
     if (recordBtn) {
         recordBtn.addEventListener('click', async function() {
@@ -336,53 +349,98 @@ function initVoiceRecord() {
                 if (voiceWave) voiceWave.style.display = 'flex';
                 
                 try {
-                    const result = await apiRequest('/voice/transcribe', {
-                        method: 'POST'
-                    });
-                    
-                    setTimeout(() => {
-                        isRecording = false;
-                        this.classList.remove('recording');
-                        if (recordStatus) recordStatus.textContent = '录音完成！点击重新录音';
-                        if (voiceWave) voiceWave.style.display = 'none';
-                        
-                        const reviewText = document.getElementById('reviewText');
-                        if (reviewText && result.text) {
-                            reviewText.value = result.text;
+                    recorder = await startVoiceStream({
+                        onPartial: (text) => {
+                            if (recordStatus) recordStatus.textContent = `识别中：${text}`;
+                        },
+                        onDone: (result) => {
+                            resetRecordUI('录音完成！点击重新录音');
+                            showToast(`语音识别完成（实时率 ${result.rtf}）`, 'success');
+                        },
+                        onError: (message) => {
+                            resetRecordUI('点击开始录音');
+                            showToast(`语音识别失败：${message}`, 'error');
                         }
-                        showToast('语音识别完成！', 'success');
-                    }, 3000);
+                    });
                 } catch (error) {
-                    isRecording = false;
-                    this.classList.remove('recording');
-                    if (recordStatus) recordStatus.textContent = '点击开始录音';
-                    if (voiceWave) voiceWave.style.display = 'none';
-                    showToast('语音识别失败，使用模拟数据', 'warning');
-                    
-                    const reviewText = document.getElementById('reviewText');
-                    if (reviewText) {
-                        reviewText.value = `函数极限的定义：当x无限接近于x0时，f(x)无限接近于某个常数A，则称A为f(x)当x→x0时的极限。
-
-重要极限：
-1. lim(x→0) sinx/x = 1
-2. lim(x→∞) (1+1/x)^x = e
-
-极限的运算法则：
-- 和差的极限等于极限的和差
-- 积的极限等于极限的积
-- 商的极限等于极限的商（分母不为零）`;
-                    }
+                    resetRecordUI('点击开始录音');
+                    showToast(`无法开始录音：${error.message}`, 'error');
                 }
             } else {
-                isRecording = false;
-                this.classList.remove('recording');
-                if (recordStatus) recordStatus.textContent = '点击开始录音';
-                if (voiceWave) voiceWave.style.display = 'none';
+                if (recordStatus) recordStatus.textContent = '正在完成识别...';
+                if (recorder) recorder.stop();
+                recorder = null;
             }
         });
     }
 }
 
+// 麦克风音频以 Float32 PCM 分块经 WebSocket 发送，服务端边收边识别并推送部分结果
+async function startVoiceStream({ onPartial, onDone, onError }) {
+    const stream = await navigator.mediaDevices.getUserMedia({ audio: { channelCount: 1, echoCancellation: true } });
+    const audioContext = new (window.AudioContext || window.webkitAudioContext)();
+    const source = audioContext.createMediaStreamSource(stream);
+    const processor = audioContext.createScriptProcessor(4096, 1, 1);
+    const socket = new WebSocket(`${API_BASE_URL.replace(/^http/, 'ws')}/voice/stream`);
+    socket.binaryType = 'arraybuffer';
+    
+    const reviewText = document.getElementById('reviewText');
+    const baseText = reviewText ? reviewText.value : '';
+    let committed = '';
+    const render = (partial) => {
+        if (reviewText) reviewText.value = baseText + committed + partial;
+    };
+    
+    const release = () => {
+        processor.disconnect();
+        source.disconnect();
+        stream.getTracks().forEach(track => track.stop());
+        audioContext.close();
+    };
+    
+    socket.onopen = () => {
+        socket.send(JSON.stringify({ format: 'pcm_f32le', sample_rate: audioContext.sampleRate, channels: 1 }));
+        processor.onaudioprocess = (event) => {
+            if (socket.readyState === WebSocket.OPEN) {
+                socket.send(new Float32Array(event.inputBuffer.getChannelData(0)).buffer);
+            }
+        };
+        source.connect(processor);
+        processor.connect(audioContext.destination);
+    };
+    
+    socket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        if (message.type === 'partial') {
+            render(message.text);
+            onPartial(message.text);
+        } else if (message.type === 'final') {
+            committed += message.text;
+            render('');
+        } else if (message.type === 'done') {
+            render('');
+            onDone(message);
+        } else if (message.type === 'error') {
+            release();
+            onError(message.detail);
+        }
+    };
+    
+    socket.onerror = () => {
+        release();
+        onError('连接语音识别服务失败');
+    };
+    
+    return {
+        stop() {
+            release();
+            if (socket.readyState === WebSocket.OPEN) {
+                socket.send(JSON.stringify({ event: 'end' }));
+            }
+        }
+    };
+}
+
 function clearText() {
     const reviewText = document.getElementById('reviewText');
     if (reviewText) {
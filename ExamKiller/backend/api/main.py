@@ -1,39 +1,179 @@
 import os
 import json
-import uuid
+import time
+import asyncio
+import hashlib
+import socket
 from datetime import datetime
-from typing import List, Optional
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+from typing import Callable, Dict, List, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Depends, Request, Header, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
-import aiofiles
 import httpx
 from dotenv import load_dotenv
 
+from services.metrics import registry, stage, record_stage, start_trace, format_server_timing
+from services.profiler import JobProfiler, ProfilingMiddleware, list_profiles, load_profile
+from services.store import SQLiteStore, ResponseCache, JobQueue, new_id
+from services.incremental import split_chunks, chunk_key, merge_points
+from services.template_index import TemplateIndex
+from services.ai_generator import ExtractedKnowledge, Importance, KnowledgeExtractor, KnowledgeGraph, QuestionGenerator, StrategyEngine
+from services.paper_assembly import QuestionBank, PaperAssembler
+from services.paper_analyzer import PaperParser
+from services.uploads import UploadError, receive_upload
+from services.question_retrieval import QuestionRetriever
+from services.routing import ModelRouter
+from services.hedging import HedgePolicy, HedgeSignal
+from services.model_selection import ModelSelector, parse_chains
+from services.responses import CompressionMiddleware, FastJSONResponse, cached_json
+from services.static_assets import StaticAssets
+from services.speech import SpeechError, SpeechService
+from services.artifacts import ArtifactStore, text_key
+from services.graph_layout import GraphLayout
+from services.keywords import BUILTIN_KEYWORDS, keyword_registry
+from services.scheduling import ModelScheduler, SchedulerError
+from services.ingestion import paper_analysis
+from services.entity_resolution import KnowledgeResolver
+from services.graph_analytics import KnowledgeStats
+
 load_dotenv()
 
 QWEN_API_BASE = os.getenv("QWEN_API_BASE", "https://dashscope.aliyuncs.com/compatible-mode/v1")
 QWEN_API_KEY = os.getenv("QWEN_API_KEY", "sk-12835c34b4c744c59f1f24f3acef2b4d")
 QWEN_MODEL = os.getenv("QWEN_MODEL_NAME", "qwen-plus")
+QWEN_FAST_MODEL = os.getenv("QWEN_FAST_MODEL", "qwen-turbo")
+QWEN_LARGE_MODEL = os.getenv("QWEN_LARGE_MODEL", "qwen-max")
+QWEN_MAX_CONCURRENCY = int(os.getenv("QWEN_MAX_CONCURRENCY", "8"))
+QWEN_TEMPERATURE = 0.7
+# 模型调用调度：后台、批量类别各自最多占用的并发槽位，以及交互请求排队等待 p95 的目标（秒）
+MODEL_BACKGROUND_SLOTS = int(os.getenv("MODEL_BACKGROUND_SLOTS", str(max(1, QWEN_MAX_CONCURRENCY // 2))))
+MODEL_BULK_SLOTS = int(os.getenv("MODEL_BULK_SLOTS", str(max(1, QWEN_MAX_CONCURRENCY // 4))))
+INTERACTIVE_WAIT_TARGET = float(os.getenv("INTERACTIVE_WAIT_TARGET", "2.0"))
+# 未显式指定类别时各接口的默认优先级类别，其余接口为 interactive
+QWEN_ENDPOINT_PRIORITIES = {
+    "exports_generate": "bulk",
+}
+# 每个接口的模型链（首选在前），可用 QWEN_ENDPOINT_MODELS="knowledge_extract=qwen-turbo,qwen-plus;..." 覆盖
+QWEN_ENDPOINT_MODELS = parse_chains(os.getenv("QWEN_ENDPOINT_MODELS"), {
+    "default": [QWEN_MODEL, QWEN_FAST_MODEL],
+    "knowledge_extract": [QWEN_FAST_MODEL, QWEN_MODEL],
+    "questions_generate": [QWEN_MODEL, QWEN_FAST_MODEL],
+    "summary_generate": [QWEN_MODEL, QWEN_FAST_MODEL],
+    "exports_generate": [QWEN_LARGE_MODEL, QWEN_MODEL, QWEN_FAST_MODEL],
+})
+# 每个接口在整条模型链上的总延迟预算（秒）；首选模型最多使用其中 QWEN_PRIMARY_SHARE 的时间
+QWEN_LATENCY_BUDGETS = {
+    "knowledge_extract": float(os.getenv("QWEN_BUDGET_KNOWLEDGE", "30")),
+    "questions_generate": float(os.getenv("QWEN_BUDGET_QUESTIONS", "90")),
+    "summary_generate": float(os.getenv("QWEN_BUDGET_SUMMARY", "90")),
+    "exports_generate": float(os.getenv("QWEN_BUDGET_EXPORTS", "120")),
+}
+QWEN_PRIMARY_SHARE = float(os.getenv("QWEN_PRIMARY_SHARE", "0.6"))
+# 对冲请求：HEDGE_PERCENTILE 为触发对冲的首字节延迟分位数（如 0.95），0 表示关闭
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0"))
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.05"))
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+WORKERS = int(os.getenv("WORKERS", "1"))
+STORE_PATH = os.getenv("STORE_PATH", "./data/examkiller.db")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "600"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# 每个 worker 同时执行的派生结果预计算数，给前台请求留出模型并发
+ARTIFACT_CONCURRENCY = int(os.getenv("ARTIFACT_CONCURRENCY", "1"))
+# 每个 worker 保留增量更新的复习计划优化器个数
+STUDY_PLAN_CACHE_SIZE = int(os.getenv("STUDY_PLAN_CACHE_SIZE", "256"))
 
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+# 前端目录（index.html 与 assets/）与静态资源构建产物目录
+FRONTEND_DIR = os.getenv("FRONTEND_DIR", "..")
+STATIC_BUILD_DIR = os.getenv("STATIC_BUILD_DIR", "./data/static")
+# 本地离线语音识别模型目录（Vosk），以及同时进行的识别会话上限
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "./models/vosk-model-small-cn-0.22")
+VOICE_MAX_SESSIONS = int(os.getenv("VOICE_MAX_SESSIONS", "4"))
+# 知识点归一：名称相似度（字符二元组 Dice）阈值，以及全量压缩的间隔（秒，0 表示只在管理接口手动触发）
+KNOWLEDGE_MATCH_THRESHOLD = float(os.getenv("KNOWLEDGE_MATCH_THRESHOLD", "0.8"))
+KNOWLEDGE_COMPACT_INTERVAL = float(os.getenv("KNOWLEDGE_COMPACT_INTERVAL", "3600"))
+# 小于该字节数的响应不压缩
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-papers_db = {}
-questions_db = {}
-knowledge_db = {}
-users_db = {"demo": {"id": "demo", "name": "演示用户", "email": "demo@example.com"}}
+# 所有状态放在 SQLite(WAL) 共享存储中，多个 worker 进程看到的是同一份数据
+store = SQLiteStore(STORE_PATH)
+papers_db = store.collection("papers")
+# 上传文件按 SHA-256 索引到试卷，相同内容再次上传直接复用已有分析
+files_db = store.collection("files")
+questions_db = store.collection("questions")
+knowledge_db = store.collection("knowledge")
+users_db = store.collection("users")
+knowledge_chunks_db = store.collection("knowledge_chunks")
+answer_stats_db = store.collection("answer_stats")
+maintenance_db = store.collection("maintenance")
+users_db.setdefault("demo", {"id": "demo", "name": "演示用户", "email": "demo@example.com"})
+llm_cache = ResponseCache(store, LLM_CACHE_TTL)
+job_queue = JobQueue(store)
+artifact_store = ArtifactStore(store.collection("artifacts"), store.collection("artifact_sources"),
+                               store.collection("artifact_refs"), job_queue)
+template_index = TemplateIndex(store.collection("templates"))
+graph_layout = GraphLayout(store.collection("graph_layouts"))
+paper_parser = PaperParser()
+strategy_engine = StrategyEngine()
+knowledge_resolver = KnowledgeResolver(store, knowledge_db, store.collection("knowledge_redirects"), KNOWLEDGE_MATCH_THRESHOLD)
+question_bank = QuestionBank(knowledge_resolver.canonical_name)
+paper_assembler = PaperAssembler(question_bank)
+question_retriever = QuestionRetriever(paper_assembler, store.collection("served_questions"), store.collection("retrieval_stats"))
+rule_extractor = KnowledgeExtractor()
+knowledge_stats = KnowledgeStats(papers_db, questions_db, knowledge_resolver.canonical_name,
+                                 lambda: knowledge_resolver.version)
+rule_generator = QuestionGenerator()
+model_router = ModelRouter()
+static_assets = StaticAssets(FRONTEND_DIR, STATIC_BUILD_DIR)
+speech_service = SpeechService(VOSK_MODEL_PATH, VOICE_MAX_SESSIONS)
+WORKER_NAME = f"{socket.gethostname()}:{os.getpid()}"
+
+# 替代原先的全局信号量：按优先级类别和用户公平分配模型并发，并执行每用户并发数与每日 token 配额
+model_scheduler = ModelScheduler(
+    QWEN_MAX_CONCURRENCY, users_db, store.collection("model_usage"),
+    {"background": MODEL_BACKGROUND_SLOTS, "bulk": MODEL_BULK_SLOTS},
+    INTERACTIVE_WAIT_TARGET, QWEN_ENDPOINT_PRIORITIES
+)
+artifact_semaphore = asyncio.Semaphore(ARTIFACT_CONCURRENCY)
+# 对冲策略按模型分别统计首字节延迟
+hedge_policies = {}
+model_selector = ModelSelector(QWEN_ENDPOINT_MODELS, QWEN_LATENCY_BUDGETS, default_budget=120.0,
+                               primary_share=QWEN_PRIMARY_SHARE)
+http_client: Optional[httpx.AsyncClient] = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     os.makedirs(UPLOAD_DIR, exist_ok=True)
     os.makedirs("./data", exist_ok=True)
+    job_queue.requeue_stale(JOB_TIMEOUT)
+    llm_cache.purge_expired()
+    static_assets.build()
+    # 启动时物化知识点频次与共现图，之后每次查询只增量处理新写入
+    refresh_knowledge_stats()
+    global http_client
+    # 模型调用共用一个连接池，避免每次调用重新建立连接
+    http_client = httpx.AsyncClient(timeout=120.0)
+    worker_tasks = [asyncio.create_task(job_worker_loop()) for _ in range(JOB_CONCURRENCY)]
+    if KNOWLEDGE_COMPACT_INTERVAL > 0:
+        worker_tasks.append(asyncio.create_task(knowledge_compaction_loop()))
     yield
+    for task in worker_tasks:
+        task.cancel()
+    await http_client.aclose()
+    http_client = None
+    model_router.close()
 
-app = FastAPI(title="ExamKiller - 大学考试复习辅助平台", lifespan=lifespan)
+app = FastAPI(title="ExamKiller - 大学考试复习辅助平台", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -43,8 +183,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESS_MIN_BYTES)
+
+app.add_middleware(ProfilingMiddleware, admin_token=ADMIN_TOKEN)
+
 app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    # 请求头 X-Trace: 1 或查询参数 trace=1 时，在 Server-Timing 头中返回各阶段耗时
+    tracing = request.headers.get("x-trace") == "1" or request.query_params.get("trace") == "1"
+    trace = start_trace()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    registry.observe("http_request_seconds", elapsed, route=getattr(route, "path", "unmatched"), method=request.method)
+    if tracing:
+        response.headers["Server-Timing"] = format_server_timing(trace, elapsed)
+    return response
+
 class PaperUpload(BaseModel):
     title: str
     subject: str
@@ -67,48 +225,298 @@ class GenerationSettings(BaseModel):
 class QuestionGenerate(BaseModel):
     review_input: ReviewInput
     settings: GenerationSettings
+    user_id: str = "demo"
+    knowledge_points: List[str] = []
 
 class KnowledgeExtract(BaseModel):
     text: str
+    user_id: str = "demo"
+    # 课程名，对应 KEYWORD_DIR 下的自定义关键词词典
+    course: Optional[str] = None
 
 class ExportSettings(BaseModel):
     title: str
     template: str = "academic"
     content: str
+    user_id: str = "demo"
 
 class SummaryGenerate(BaseModel):
     text: str
     source_type: str = "text"
+    user_id: str = "demo"
 
-async def call_qwen_api(messages: List[dict], max_tokens: int = 2000) -> str:
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        response = await client.post(
-            f"{QWEN_API_BASE}/chat/completions",
-            headers={
-                "Authorization": f"Bearer {QWEN_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": QWEN_MODEL,
-                "messages": messages,
-                "max_tokens": max_tokens,
-                "temperature": 0.7
-            }
-        )
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
-
-@app.get("/")
-async def serve_frontend():
-    return FileResponse("../index.html")
+class PaperAssemble(BaseModel):
+    settings: GenerationSettings
+    knowledge_points: List[str] = []
+    total_score: Optional[float] = None
+    seed: Optional[int] = None
+
+class StudyPlanRequest(BaseModel):
+    user_id: str = "demo"
+    time_budget: float = 600
+    course: Optional[str] = None
+    # 指定试卷或复习文本来源时只针对其知识点制定计划，可直接使用预计算结果
+    source_id: Optional[str] = None
+
+class AnswerRecord(BaseModel):
+    knowledge_point: str
+    correct: bool
+
+class AnswerSubmit(BaseModel):
+    user_id: str = "demo"
+    answers: List[AnswerRecord]
+
+def llm_cache_key(model: str, messages: List[dict], max_tokens: int) -> str:
+    return hashlib.sha256(json.dumps([model, messages, max_tokens, QWEN_TEMPERATURE], ensure_ascii=False).encode()).hexdigest()
+
+async def call_qwen_api(messages: List[dict], max_tokens: int = 2000, endpoint: str = "default", cache: bool = True,
+                        accept: Optional[Callable[[str], bool]] = None) -> str:
+    # cache=False 用于出题、文档生成等每次都应得到新内容的调用：既不读也不写模型响应缓存；
+    # accept 用于校验响应，不合格（如无法解析）的响应照常返回但不写入缓存，重试时会重新请求模型
+    chain = model_selector.chain(endpoint)
+    if cache:
+        for model in chain:
+            cached = llm_cache.get(llm_cache_key(model, messages, max_tokens))
+            if cached is not None:
+                registry.inc("model_cache_total", model=model, result="hit")
+                return cached
+        registry.inc("model_cache_total", model=chain[0], result="miss")
+    user_id, priority = model_scheduler.current(endpoint)
+    model_scheduler.check_quota(user_id)
+    # 排队成本按 token 估算：提示词按字符数计，加上输出上限
+    cost = max_tokens + sum(len(m.get("content", "")) for m in messages)
+
+    # 在接口的延迟预算内沿模型链依次尝试：首选模型最多占用预算的一部分，最后一个模型用完剩余时间
+    deadline = time.perf_counter() + model_selector.budget(endpoint)
+    last_error: Exception = TimeoutError(f"{endpoint} 超出延迟预算")
+    for i, model in enumerate(chain):
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            break
+        timeout = remaining if i == len(chain) - 1 else remaining * QWEN_PRIMARY_SHARE
+        start = time.perf_counter()
+        try:
+            content, usage = await asyncio.wait_for(
+                _request_qwen(messages, max_tokens, model, user_id, priority, cost), timeout
+            )
+        except (asyncio.TimeoutError, httpx.HTTPError, KeyError, ValueError) as e:
+            model_selector.record(model, time.perf_counter() - start, False,
+                                  timed_out=isinstance(e, asyncio.TimeoutError))
+            # 只有链中还有下一个模型时才算一次切换
+            if i < len(chain) - 1:
+                registry.inc("model_fallback_total", endpoint=endpoint, model=model)
+            last_error = e
+            continue
+        model_selector.record(model, time.perf_counter() - start, True,
+                              usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+        model_scheduler.record_usage(user_id, usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0))
+        if cache and (accept is None or accept(content)):
+            llm_cache.set(llm_cache_key(model, messages, max_tokens), content)
+        return content
+    raise last_error
+
+async def _request_qwen(messages: List[dict], max_tokens: int, model: str, user_id: str, priority: str, cost: float):
+    if HEDGE_PERCENTILE <= 0:
+        return await _attempt_qwen(messages, max_tokens, model, HedgeSignal(), user_id, priority, cost)
+    policy = hedge_policies.setdefault(model, HedgePolicy(HEDGE_PERCENTILE, HEDGE_BUDGET))
+    return await policy.run(lambda signal: _attempt_qwen(messages, max_tokens, model, signal, user_id, priority, cost))
+
+async def _attempt_qwen(messages: List[dict], max_tokens: int, model: str, signal: HedgeSignal,
+                        user_id: str, priority: str, cost: float):
+    async with model_scheduler.slot(user_id, priority, cost):
+        start = time.perf_counter()
+        signal.started.set()
+        status = "ok"
+        client = http_client or httpx.AsyncClient(timeout=120.0)
+        try:
+            async with client.stream(
+                "POST",
+                f"{QWEN_API_BASE}/chat/completions",
+                headers={
+                    "Authorization": f"Bearer {QWEN_API_KEY}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "model": model,
+                    "messages": messages,
+                    "max_tokens": max_tokens,
+                    "temperature": QWEN_TEMPERATURE
+                }
+            ) as response:
+                ttfb = time.perf_counter() - start
+                registry.observe("model_ttfb_seconds", ttfb, model=model)
+                signal.first_byte.set()
+                if model in hedge_policies:
+                    hedge_policies[model].observe_ttfb(ttfb)
+                await response.aread()
+            response.raise_for_status()
+            data = response.json()
+        except asyncio.CancelledError:
+            # 对冲中落败的一方，或超出延迟预算被取消
+            status = "cancelled"
+            raise
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            if client is not http_client:
+                await client.aclose()
+            elapsed = time.perf_counter() - start
+            registry.observe("model_call_seconds", elapsed, model=model, status=status)
+            record_stage("model_call", elapsed)
+        usage = data.get("usage", {})
+        registry.inc("model_tokens_total", usage.get("prompt_tokens", 0), model=model, kind="prompt")
+        registry.inc("model_tokens_total", usage.get("completion_tokens", 0), model=model, kind="completion")
+        return data["choices"][0]["message"]["content"], usage
+
+@app.api_route("/", methods=["GET", "HEAD"])
+async def serve_frontend(request: Request):
+    response = static_assets.response("index.html", request.headers)
+    if response is None:
+        raise HTTPException(status_code=404, detail="前端页面不存在")
+    return response
+
+@app.api_route("/assets/{path:path}", methods=["GET", "HEAD"])
+async def serve_asset(path: str, request: Request):
+    response = static_assets.response(f"assets/{path}", request.headers)
+    if response is None:
+        raise HTTPException(status_code=404, detail="资源不存在")
+    return response
 
 @app.get("/api/health")
 async def health_check():
     return {"status": "ok", "message": "服务正常运行", "timestamp": datetime.now().isoformat()}
 
+@app.get("/api/metrics")
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/models/stats")
+async def get_model_stats():
+    # 各接口当前生效的模型链与每个模型的延迟、错误率、token 用量，用于调整模型分配
+    return model_selector.stats()
+
+@app.get("/api/models/scheduler")
+async def get_scheduler_stats(user_id: Optional[str] = None):
+    # 本 worker 各优先级类别的槽位、排队数与最近排队等待分位数；指定用户时附带其调度参数和今日 token 用量
+    stats = model_scheduler.stats()
+    if user_id is not None:
+        stats["user"] = {"user_id": user_id, "policy": model_scheduler.policy(user_id),
+                         "tokens_used_today": model_scheduler.tokens_used(user_id)}
+    return stats
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+
+@app.get("/api/admin/profiles", dependencies=[Depends(require_admin)])
+async def get_profiles(limit: int = 20):
+    return {"profiles": list_profiles(limit)}
+
+@app.get("/api/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def get_profile(profile_id: str):
+    content = load_profile(profile_id)
+    if content is None:
+        raise HTTPException(status_code=404, detail="性能剖析记录不存在")
+    return PlainTextResponse(content)
+
+@app.get("/api/admin/keywords", dependencies=[Depends(require_admin)])
+async def get_keyword_dictionaries():
+    return {
+        "builtin": BUILTIN_KEYWORDS,
+        "subjects": {
+            subject: {"version": keyword_registry.version(subject), "keywords": keyword_registry.load(subject)}
+            for subject in keyword_registry.subjects()
+        }
+    }
+
+@app.put("/api/admin/keywords/{subject}", dependencies=[Depends(require_admin)])
+async def put_keyword_dictionary(subject: str, keywords: Dict[str, List[str]]):
+    # 自定义词典在内置词典基础上追加关键词，所有 worker 在数秒内自动重新编译
+    try:
+        keyword_registry.save(subject, keywords)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "subject": subject, "version": keyword_registry.version(subject)}
+
+@app.get("/api/admin/knowledge/compaction", dependencies=[Depends(require_admin)])
+async def get_knowledge_compaction():
+    return {"knowledge_points": len(knowledge_db), "last": maintenance_db.get("knowledge_compaction")}
+
+@app.post("/api/admin/knowledge/compaction", dependencies=[Depends(require_admin)])
+async def run_knowledge_compaction():
+    # 立即全量压缩：合并相似知识点并返回规模变化（合并前后知识点数、比较的名称对数等）
+    return await asyncio.to_thread(compact_knowledge)
+
 @app.post("/api/papers/upload")
-async def upload_paper(paper: PaperUpload, background_tasks: BackgroundTasks):
-    paper_id = str(uuid.uuid4())
+async def upload_paper(paper: PaperUpload):
+    with stage("upload"):
+        return _store_uploaded_paper(paper, new_id())
+
+@app.post("/api/papers/upload/file")
+async def upload_paper_file(request: Request):
+    # multipart 字段：file（试卷文件）及 title/subject/course/chapter/difficulty/exam_date
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + 64 * 1024:
+        raise HTTPException(status_code=413, detail=f"文件超过大小上限 {MAX_UPLOAD_BYTES} 字节")
+    with stage("upload"):
+        try:
+            upload = await receive_upload(
+                request.stream(), request.headers.get("content-type", ""), UPLOAD_DIR,
+                MAX_UPLOAD_BYTES, paper_parser.supported_formats
+            )
+        except UploadError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    duplicate = _find_duplicate(upload.sha256)
+    if duplicate is not None:
+        return _duplicate_response(duplicate)
+
+    fields = upload.fields
+    try:
+        paper = PaperUpload(
+            title=fields.get("title") or upload.filename,
+            subject=fields.get("subject", ""),
+            course=fields.get("course", ""),
+            chapter=fields.get("chapter") or None,
+            difficulty=float(fields.get("difficulty") or 3.0),
+            exam_date=fields.get("exam_date") or None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    paper_id = new_id()
+    file_info = {"paper_id": paper_id, "sha256": upload.sha256, "path": upload.path,
+                 "size": upload.size, "filename": upload.filename}
+    claimed = files_db.setdefault(upload.sha256, file_info)
+    if claimed["paper_id"] != paper_id:
+        # 相同内容被并发上传：以先登记的为准；先登记的试卷已删除时改由本次上传接管
+        duplicate = papers_db.get(claimed["paper_id"])
+        if duplicate is not None:
+            return _duplicate_response(duplicate)
+        files_db[upload.sha256] = file_info
+    registry.inc("upload_dedup_total", result="new")
+    with stage("upload"):
+        return _store_uploaded_paper(paper, paper_id, file_info)
+
+def _find_duplicate(sha256: str) -> Optional[dict]:
+    existing = files_db.get(sha256)
+    if existing is None:
+        return None
+    return papers_db.get(existing["paper_id"])
+
+def _duplicate_response(paper: dict) -> dict:
+    registry.inc("upload_dedup_total", result="duplicate")
+    return {
+        "success": True,
+        "paper_id": paper["id"],
+        "deduplicated": True,
+        "status": paper["status"],
+        "analysis": paper["analysis"],
+        "message": "相同文件已上传过，直接返回已有分析结果"
+    }
+
+def _store_uploaded_paper(paper: PaperUpload, paper_id: str, file_info: Optional[dict] = None) -> dict:
     paper_data = {
         "id": paper_id,
         "title": paper.title,
@@ -120,13 +528,40 @@ async def upload_paper(paper: PaperUpload, background_tasks: BackgroundTasks):
         "status": "uploaded",
         "created_at": datetime.now().isoformat(),
         "questions": [],
-        "analysis": None
+        "analysis": None,
+        "file": file_info
     }
-    papers_db[paper_id] = paper_data
-    background_tasks.add_task(analyze_paper_background, paper_id, paper.title)
-    return {"success": True, "paper_id": paper_id, "message": "试卷上传成功"}
-
-async def analyze_paper_background(paper_id: str, title: str):
+    payload = {"paper_id": paper_id, "title": paper.title}
+    if file_info is not None:
+        payload["file_path"] = file_info["path"]
+    with stage("storage_write"):
+        papers_db[paper_id] = paper_data
+        job_queue.enqueue("analyze_paper", payload)
+    return {"success": True, "paper_id": paper_id, "deduplicated": False, "message": "试卷上传成功"}
+
+def analyze_paper_file(file_path: str, subject: Optional[str] = None) -> dict:
+    # 解析 -> 版面模板索引抽题（命中已知模板时跳过通用检测）-> 规则提取知识点
+    structure = paper_parser.parse(file_path)
+    text = "\n".join(block.content for page in structure.pages for block in page.blocks)
+    layout_info = structure.layouts[0] if structure.layouts else {}
+    return paper_analysis(text, layout_info, len(structure.pages), template_index, rule_extractor, subject)
+
+async def analyze_paper_background(paper_id: str, title: str, file_path: Optional[str] = None):
+    if file_path is not None:
+        try:
+            course = (papers_db.get(paper_id) or {}).get("course")
+            analysis_result = await asyncio.to_thread(analyze_paper_file, file_path, course)
+            questions = analysis_result.pop("questions")
+            text = analysis_result.pop("text")
+            with stage("storage_write"):
+                paper = papers_db.update(paper_id, analysis=analysis_result, questions=questions, status="analyzed")
+            if paper is not None and text.strip():
+                # 分析完成钩子：低优先级排队预计算摘要、图谱、计划和练习题
+                artifact_store.schedule(paper_id, text, {"user_id": "demo", "course": paper.get("course")})
+        except Exception as e:
+            print(f"分析失败: {e}")
+            papers_db.update(paper_id, status="failed")
+        return
     try:
         await asyncio.sleep(2)
         analysis_result = {
@@ -136,17 +571,95 @@ async def analyze_paper_background(paper_id: str, title: str):
             "subject": "高等数学",
             "course": "微积分"
         }
-        if paper_id in papers_db:
-            papers_db[paper_id]["analysis"] = analysis_result
-            papers_db[paper_id]["status"] = "analyzed"
+        with stage("storage_write"):
+            papers_db.update(paper_id, analysis=analysis_result, status="analyzed")
     except Exception as e:
         print(f"分析失败: {e}")
 
-import asyncio
+async def precompute_artifact(source_id: str, kind: str):
+    source = artifact_store.source(source_id)
+    if source is None:
+        return
+    async with artifact_semaphore:
+        # 等待期间来源可能已被删除，或同一内容的其他来源已算出结果
+        if artifact_store.source(source_id) is None or artifact_store.get(kind, source["text_key"]) is not None:
+            return
+        try:
+            with model_scheduler.bound(source["context"].get("user_id", "demo"), "background"):
+                data = await ARTIFACT_BUILDERS[kind](source)
+        except Exception:
+            registry.inc("artifact_total", kind=kind, result="failed")
+            raise
+    with stage("storage_write"):
+        artifact_store.put(source_id, kind, data)
+
+job_profiler = JobProfiler()
+
+JOB_HANDLERS = {
+    "analyze_paper": analyze_paper_background,
+    "precompute_artifact": precompute_artifact,
+}
+
+async def job_worker_loop():
+    # 每个 worker 进程都从共享队列领取任务，任务不会因进程不同而丢失或重复执行
+    while True:
+        job = job_queue.claim(WORKER_NAME)
+        if job is None:
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            continue
+        try:
+            async with job_profiler.profile(job["kind"]):
+                await JOB_HANDLERS[job["kind"]](**job["payload"])
+            job_queue.complete(job["id"])
+        except Exception as e:
+            print(f"任务执行失败: {e}")
+            job_queue.fail(job["id"], str(e), retry=job["attempts"] < JOB_MAX_ATTEMPTS)
+
+# 本进程最后一次按规范名称重建索引时所依据的知识点压缩完成时间
+knowledge_names_state = {"compacted_at": None}
+
+def sync_knowledge_names():
+    # 同步其他 worker 新写入的知识点；知识点压缩（可能由其他 worker 执行）后，依赖规范名称的索引需要重建
+    knowledge_resolver.sync()
+    compacted_at = (maintenance_db.get("knowledge_compaction") or {}).get("finished_at")
+    if compacted_at != knowledge_names_state["compacted_at"]:
+        knowledge_names_state["compacted_at"] = compacted_at
+        question_bank.reindex()
+
+def compact_knowledge() -> dict:
+    with stage("knowledge_compact"):
+        report = knowledge_resolver.compact()
+    maintenance_db["knowledge_compaction"] = {"finished_at": datetime.now().isoformat(), "report": report}
+    return report
+
+async def knowledge_compaction_loop():
+    # 多个 worker 中每个周期只有一个执行：在共享存储中原子地领取本周期
+    while True:
+        await asyncio.sleep(KNOWLEDGE_COMPACT_INTERVAL)
+
+        now = time.time()
+
+        def claim(lease: dict) -> dict:
+            if now - lease.get("claimed_at", 0) >= KNOWLEDGE_COMPACT_INTERVAL:
+                lease.update(claimed_at=now, worker=WORKER_NAME)
+            return lease
+
+        lease = maintenance_db.modify("knowledge_compaction_lease", claim)
+        if lease["claimed_at"] != now or lease["worker"] != WORKER_NAME:
+            continue
+        try:
+            report = await asyncio.to_thread(compact_knowledge)
+            print(f"知识点压缩: {report['points_before']} -> {report['points_after']}")
+        except Exception as e:
+            print(f"知识点压缩失败: {e}")
+
+@app.get("/api/templates/stats")
+async def get_template_stats():
+    return template_index.stats()
 
 @app.get("/api/papers")
-async def list_papers():
-    return {"papers": list(papers_db.values())}
+async def list_papers(request: Request):
+    return cached_json(request, {"papers": list(papers_db.values())})
 
 @app.get("/api/papers/{paper_id}")
 async def get_paper(paper_id: str):
@@ -158,16 +671,24 @@ async def get_paper(paper_id: str):
 async def delete_paper(paper_id: str):
     if paper_id not in papers_db:
         raise HTTPException(status_code=404, detail="试卷不存在")
-    del papers_db[paper_id]
+    paper = papers_db[paper_id]
+    with stage("storage_write"):
+        del papers_db[paper_id]
+        artifact_store.cancel(paper_id)
+        knowledge_stats.remove("papers", paper_id)
+        file_info = paper.get("file")
+        if file_info and files_db.get(file_info["sha256"], {}).get("paper_id") == paper_id:
+            del files_db[file_info["sha256"]]
+            # 批量导入的试卷（external）引用归档目录中的原文件，不删除
+            if not file_info.get("external") and os.path.exists(file_info["path"]):
+                os.remove(file_info["path"])
     return {"success": True, "message": "删除成功"}
 
-@app.post("/api/knowledge/extract")
-async def extract_knowledge(input_data: KnowledgeExtract):
-    try:
-        prompt = f"""请从以下复习内容中提取知识点，并按重要性分级（核心/重要/一般）。返回JSON格式：
+async def extract_chunk_knowledge(chunk: str) -> Optional[List[dict]]:
+    prompt = f"""请从以下复习内容中提取知识点，并按重要性分级（核心/重要/一般）。返回JSON格式：
 
 复习内容：
-{input_data.text}
+{chunk}
 
 请提取所有专业术语、概念、定理、公式等知识点。
 
@@ -185,55 +706,124 @@ JSON格式：
 
 只返回JSON，不要其他内容。"""
 
-        result = await call_qwen_api([
-            {"role": "system", "content": "你是一个专业的学科知识提取助手，擅长从文本中提取结构化的知识点。"},
-            {"role": "user", "content": prompt}
-        ], max_tokens=2000)
+    result = await call_qwen_api([
+        {"role": "system", "content": "你是一个专业的学科知识提取助手，擅长从文本中提取结构化的知识点。"},
+        {"role": "user", "content": prompt}
+    ], max_tokens=2000, endpoint="knowledge_extract")
 
-        try:
+    try:
+        with stage("json_parse"):
             json_start = result.find('{')
             json_end = result.rfind('}') + 1
             json_str = result[json_start:json_end]
             data = json.loads(json_str)
-        except:
-            data = {"knowledge_points": [], "cross_domain": []}
-
-        extracted = []
-        for i, kp in enumerate(data.get("knowledge_points", [])):
-            kp_id = str(uuid.uuid4())
-            kp_data = {
-                "id": kp_id,
-                "name": kp.get("name", f"知识点{i+1}"),
-                "importance": kp.get("importance", "normal"),
-                "description": kp.get("description", ""),
-                "cross_domain": data.get("cross_domain", [])
-            }
-            knowledge_db[kp_id] = kp_data
-            extracted.append(kp_data)
+    except:
+        # 解析失败的块不写入分块缓存，下次提交时重新提取
+        return None
+
+    extracted = []
+    for i, kp in enumerate(data.get("knowledge_points", [])):
+        kp_id = new_id()
+        kp_data = {
+            "id": kp_id,
+            "name": kp.get("name", f"知识点{i+1}"),
+            "importance": kp.get("importance", "normal"),
+            "description": kp.get("description", ""),
+            "cross_domain": data.get("cross_domain", [])
+        }
+        with stage("storage_write"):
+            kp_data = knowledge_resolver.add(kp_data, kp_id)
+        extracted.append(kp_data)
+    return extracted
+
+def user_tier(user_id: str) -> str:
+    return users_db.get(user_id, {}).get("tier", "free")
+
+def rule_chunk_knowledge(chunk: str, course: Optional[str] = None) -> List[dict]:
+    extracted = []
+    for point in rule_extractor.extract(chunk, subject=course):
+        kp_id = new_id()
+        kp_data = {
+            "id": kp_id,
+            "name": point.name,
+            "importance": point.importance.value,
+            "description": point.description,
+            "cross_domain": point.cross_domain
+        }
+        with stage("storage_write"):
+            kp_data = knowledge_resolver.add(kp_data, kp_id)
+        extracted.append(kp_data)
+    return extracted
+
+async def extract_routed_chunk(chunk: str, decision, course: Optional[str] = None) -> Optional[List[dict]]:
+    start = time.perf_counter()
+    if decision.route == "rules":
+        points = rule_chunk_knowledge(chunk, course)
+    else:
+        points = await extract_chunk_knowledge(chunk)
+    model_router.record(decision, time.perf_counter() - start, len(points or []),
+                        sum(len(p["name"]) + len(p["description"]) for p in points or []))
+    return points
 
-        return {"success": True, "knowledge_points": extracted}
+@app.post("/api/knowledge/extract")
+async def extract_knowledge(input_data: KnowledgeExtract):
+    try:
+        # 按内容哈希分块，只有新增或修改过的块才会重新提取，其余块复用已存储的提取结果；
+        # 每块由路由决定走规则引擎还是模型，两种结果分开缓存；规则结果的缓存键带上该课程关键词词典的版本
+        course = input_data.course
+        chunks = split_chunks(input_data.text)
+        tier = user_tier(input_data.user_id)
+        decisions = [
+            model_router.route("knowledge", chunk, rule_extractor.rule_confidence(chunk, course), tier)
+            for chunk in chunks
+        ]
+        rules_mode = f"rules:{course or ''}:{keyword_registry.version(course)}"
+        keys = [
+            chunk_key(chunk, rules_mode if decision.route == "rules" else f"api:{QWEN_ENDPOINT_MODELS['knowledge_extract'][0]}")
+            for chunk, decision in zip(chunks, decisions)
+        ]
+        # 缓存的分块结果中的知识点可能已在压缩时被合并，换成规范知识点
+        chunk_results = [knowledge_chunks_db.get(key) for key in keys]
+        chunk_results = [knowledge_resolver.remap(result) if result else result for result in chunk_results]
+        missing = [i for i, result in enumerate(chunk_results) if result is None]
+        registry.inc("knowledge_chunks_total", len(chunks) - len(missing), result="hit")
+        registry.inc("knowledge_chunks_total", len(missing), result="miss")
+
+        with model_scheduler.bound(input_data.user_id):
+            fresh = await asyncio.gather(*(extract_routed_chunk(chunks[i], decisions[i], course) for i in missing))
+        for i, points in zip(missing, fresh):
+            chunk_results[i] = points or []
+            if points is not None:
+                with stage("storage_write"):
+                    knowledge_chunks_db[keys[i]] = points
+
+        extracted = merge_points(chunk_results)
+        # 复习文本提交后同样排队预计算摘要、图谱、计划和练习题，同一文本只排一次
+        source_id = f"text-{text_key(input_data.text)[:16]}"
+        if artifact_store.source(source_id) is None:
+            artifact_store.schedule(source_id, input_data.text, {"user_id": input_data.user_id, "course": course})
+        return {
+            "success": True,
+            "source_id": source_id,
+            "knowledge_points": extracted,
+            "chunks": len(chunks),
+            "reused_chunks": len(chunks) - len(missing),
+            "rule_chunks": sum(1 for decision in decisions if decision.route == "rules")
+        }
+    except SchedulerError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"知识点提取失败: {str(e)}")
 
-@app.post("/api/questions/generate")
-async def generate_questions(request: QuestionGenerate):
-    try:
-        settings = request.settings
-        review_text = request.review_input.text
-        
-        difficulty_map = []
-        difficulty_map.extend(["easy"] * settings.easy_ratio)
-        difficulty_map.extend(["medium"] * settings.medium_ratio)
-        difficulty_map.extend(["hard"] * settings.hard_ratio)
-        
-        prompt = f"""根据以下复习内容生成{settings.question_count}道练习题：
+async def generate_model_questions(review_text: str, question_types: List[str], shortfall: int, deficit: dict) -> dict:
+    prompt = f"""根据以下复习内容生成{shortfall}道练习题：
 
 复习内容：
 {review_text}
 
 要求：
-1. 题目类型包括：{', '.join(settings.question_types)}
-2. 难度分布：简单{settings.easy_ratio}%，中等{settings.medium_ratio}%，困难{settings.hard_ratio}%
+1. 题目类型包括：{', '.join(question_types)}
+2. 难度分布：简单{deficit['easy']}道，中等{deficit['medium']}道，困难{deficit['hard']}道
 3. 每道题包含：题目内容、正确答案、简要解析
 
 请生成题目并以JSON格式返回：
@@ -241,41 +831,88 @@ async def generate_questions(request: QuestionGenerate):
 {{
     "questions": [
         {{
-            "id": 1,
-            "content": "题目内容",
-            "type": "choice/fill/judge/essay",
-            "difficulty": "easy/medium/hard",
-            "score": 2,
-            "options": ["A. 选项1", "B. 选项2", "C. 选项3", "D. 选项4"],
-            "answer": "正确答案",
-            "explanation": "解析说明"
+    "id": 1,
+    "content": "题目内容",
+    "type": "choice/fill/judge/essay",
+    "difficulty": "easy/medium/hard",
+    "score": 2,
+    "options": ["A. 选项1", "B. 选项2", "C. 选项3", "D. 选项4"],
+    "answer": "正确答案",
+    "explanation": "解析说明",
+    "knowledge_point": "考查的知识点名称"
         }}
     ],
     "summary": {{
-        "total_count": {settings.question_count},
+        "total_count": {shortfall},
         "estimated_time": 30,
-        "difficulty_distribution": {{"easy": {int(settings.question_count * settings.easy_ratio / 100)}, "medium": {int(settings.question_count * settings.medium_ratio / 100)}, "hard": {int(settings.question_count * settings.hard_ratio / 100)}}}
+        "difficulty_distribution": {{"easy": {deficit['easy']}, "medium": {deficit['medium']}, "hard": {deficit['hard']}}}
     }}
 }}
 
 只返回JSON，不要其他内容。"""
 
-        result = await call_qwen_api([
-            {"role": "system", "content": "你是一个专业的出题老师，擅长根据复习内容生成高质量的练习题。"},
-            {"role": "user", "content": prompt}
-        ], max_tokens=4000)
+    result = await call_qwen_api([
+        {"role": "system", "content": "你是一个专业的出题老师，擅长根据复习内容生成高质量的练习题。"},
+        {"role": "user", "content": prompt}
+    ], max_tokens=4000, endpoint="questions_generate", cache=False)
 
-        try:
+    try:
+        with stage("json_parse"):
             json_start = result.find('{')
             json_end = result.rfind('}') + 1
             json_str = result[json_start:json_end]
             data = json.loads(json_str)
-        except:
-            data = {"questions": [], "summary": {"total_count": settings.question_count, "estimated_time": 30}}
+    except:
+        data = {"questions": [], "summary": {"total_count": shortfall, "estimated_time": 30}}
+    return data
+
+async def build_question_set(review_text: str, settings: GenerationSettings, user_id: str,
+                             requested_points: List[str], mark_served: bool = True) -> dict:
+    # 检索优先：先从题库按知识点、题型、难度取题（排除该用户已做过的），模型只补缺口
+    if requested_points:
+        rule_points = [
+            ExtractedKnowledge(name=name, importance=Importance.IMPORTANT, description="", cross_domain=[], related_points=[])
+            for name in requested_points
+        ]
+    else:
+        rule_points = rule_extractor.extract(review_text)
+    with stage("bank_sync"):
+        sync_knowledge_names()
+        question_bank.sync(questions_db)
+    # 题库按规范知识点名称索引：抽取出的名称（如“函数的极限”）先映射到规范名称再检索
+    knowledge_points = list(dict.fromkeys(knowledge_resolver.canonical_name(p.name) for p in rule_points))
+    with stage("retrieve"):
+        retrieval = question_retriever.retrieve(
+            user_id,
+            settings.question_count,
+            {"easy": settings.easy_ratio, "medium": settings.medium_ratio, "hard": settings.hard_ratio},
+            settings.question_types,
+            knowledge_points
+        )
+
+    generated_questions = []
+    summary = {}
+    shortfall = retrieval["shortfall"]
+    deficit = retrieval["deficit"]
+    if shortfall > 0:
+        # 缺口部分再按路由选择：简单题为主、题量少时直接用模板出题，否则调用模型
+        rules_settings = {
+            "question_count": shortfall,
+            "difficulty_ratio": {d: count / shortfall for d, count in deficit.items()}
+        }
+        decision = model_router.route(
+            "questions", review_text,
+            rule_generator.rule_confidence(rules_settings) if rule_points else 0.0,
+            user_tier(user_id)
+        )
+        start = time.perf_counter()
+        if decision.route == "rules":
+            data = {"questions": rule_generator.generate(rule_points, rules_settings)}
+        else:
+            data = await generate_model_questions(review_text, settings.question_types, shortfall, deficit)
 
-        generated_questions = []
         for q in data.get("questions", []):
-            q_id = str(uuid.uuid4())
+            q_id = new_id()
             q_data = {
                 "id": q_id,
                 "content": q.get("content", ""),
@@ -285,24 +922,90 @@ async def generate_questions(request: QuestionGenerate):
                 "options": q.get("options", []),
                 "answer": q.get("answer", ""),
                 "explanation": q.get("explanation", ""),
+                "knowledge_point": q.get("knowledge_point", ""),
                 "created_at": datetime.now().isoformat()
             }
-            questions_db[q_id] = q_data
+            with stage("storage_write"):
+                questions_db[q_id] = q_data
             generated_questions.append(q_data)
-
-        summary = data.get("summary", {"total_count": len(generated_questions), "estimated_time": len(generated_questions) * 2})
-        
-        return {
-            "success": True,
-            "questions": generated_questions,
-            "total_count": len(generated_questions),
-            "estimated_time": summary.get("estimated_time", len(generated_questions) * 2)
+        summary = data.get("summary", {})
+        model_router.record(decision, time.perf_counter() - start, len(generated_questions),
+                            sum(len(q["content"]) + len(q["answer"]) + len(q["explanation"]) for q in generated_questions))
+
+    questions = retrieval["questions"] + generated_questions
+    if mark_served:
+        question_retriever.mark_served(user_id, [q["id"] for q in questions])
+
+    return {
+        "questions": questions,
+        "total_count": len(questions),
+        "estimated_time": summary.get("estimated_time", len(questions) * 2),
+        "retrieval": {
+            "retrieved": len(retrieval["questions"]),
+            "generated": len(generated_questions),
+            "hit_ratio": retrieval["hit_ratio"],
+            "model_call_saved": retrieval["model_call_saved"]
         }
+    }
+
+@app.post("/api/questions/generate")
+async def generate_questions(request: QuestionGenerate):
+    try:
+        review_text = request.review_input.text
+        if not request.knowledge_points and request.settings == GenerationSettings():
+            # 默认设置下直接返回分析完成后预生成的练习题（其中的题该用户做过则重新生成）
+            data = artifact_store.get("practice", text_key(review_text))
+            if data is not None:
+                question_ids = [q["id"] for q in data["questions"]]
+                if not question_retriever.any_served(request.user_id, question_ids):
+                    question_retriever.mark_served(request.user_id, question_ids)
+                    registry.inc("artifact_served_total", kind="practice")
+                    return {"success": True, "precomputed": True, **data}
+        with model_scheduler.bound(request.user_id):
+            data = await build_question_set(review_text, request.settings, request.user_id, request.knowledge_points)
+        return {"success": True, "precomputed": False, **data}
+    except SchedulerError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"题目生成失败: {str(e)}")
 
+@app.get("/api/questions/retrieval/stats")
+async def get_retrieval_stats(user_id: Optional[str] = None):
+    return question_retriever.stats(user_id)
+
+@app.post("/api/papers/assemble")
+async def assemble_paper(request: PaperAssemble):
+    # 从题库组卷：满足总分、难度比例、题型和知识点覆盖，不调用模型
+    settings = request.settings
+    with stage("bank_sync"):
+        question_bank.sync(questions_db)
+    with stage("assemble"):
+        result = paper_assembler.assemble(
+            question_count=settings.question_count,
+            difficulty_ratio={"easy": settings.easy_ratio, "medium": settings.medium_ratio, "hard": settings.hard_ratio},
+            question_types=settings.question_types,
+            knowledge_points=request.knowledge_points or None,
+            total_score=request.total_score,
+            seed=request.seed
+        )
+    return {"success": True, "bank_size": len(question_bank), **result}
+
 @app.get("/api/knowledge/graph")
-async def get_knowledge_graph():
+async def get_knowledge_graph(request: Request, source_id: Optional[str] = None):
+    if source_id:
+        # 指定来源时返回该试卷或复习文本的图谱：优先用预计算结果，尚未生成则现在生成并保存
+        source = artifact_store.source(source_id)
+        if source is None:
+            raise HTTPException(status_code=404, detail="来源不存在")
+        graph = artifact_store.get_for_text("knowledge_graph", source["text"])
+        if graph is None:
+            try:
+                with model_scheduler.bound(source["context"].get("user_id", "demo")):
+                    graph = await build_knowledge_graph_artifact(source)
+            except SchedulerError as e:
+                raise HTTPException(status_code=e.status_code, detail=e.detail)
+            artifact_store.put(source_id, "knowledge_graph", graph)
+        return cached_json(request, graph)
     nodes = [
         {"id": "1", "name": "函数极限", "importance": "core", "x": 400, "y": 100},
         {"id": "2", "name": "极限定义", "importance": "important", "x": 250, "y": 200},
@@ -320,11 +1023,136 @@ async def get_knowledge_graph():
         {"source": "3", "target": "6"},
         {"source": "3", "target": "7"}
     ]
-    return {"nodes": nodes, "links": links}
+    return cached_json(request, {"nodes": nodes, "links": links})
+
+IMPORTANCE_VALUES = {importance.value for importance in Importance}
+
+def refresh_knowledge_stats():
+    with stage("knowledge_stats"):
+        knowledge_resolver.sync()
+        knowledge_stats.refresh()
+
+def to_extracted(points: List[dict]) -> List[ExtractedKnowledge]:
+    unique = {}
+    for kp in points:
+        unique.setdefault(kp["name"], ExtractedKnowledge(
+            name=kp["name"],
+            importance=Importance(kp["importance"]) if kp.get("importance") in IMPORTANCE_VALUES else Importance.NORMAL,
+            description=kp.get("description", ""),
+            cross_domain=kp.get("cross_domain", []),
+            related_points=[]
+        ))
+    return list(unique.values())
+
+def answered_count(user_id: str) -> int:
+    return sum(entry["total"] for entry in answer_stats_db.get(user_id, {}).values())
+
+# 每个计划（用户, 课程, 来源）保留一个优化器：本进程收到的新作答通过 record_answers 增量更新，
+# 新出现的知识点通过 add_points 追加；其他 worker 写入的作答、知识点统计变化或知识点被合并时才重建
+study_plans: Dict[Tuple[str, str, str], dict] = {}
+
+def plan_history(points: List[ExtractedKnowledge], user_id: str, course: Optional[str]) -> dict:
+    # 历年频次与共现图中心性按规范名称统计，来源中的知识点名称先映射到规范名称再查
+    frequency = knowledge_stats.frequency(course)
+    scores = knowledge_stats.centrality(course)
+    canonical = {p.name: knowledge_resolver.canonical_name(p.name) for p in points}
+    return {
+        "frequency": {name: frequency.get(target, 0) for name, target in canonical.items()},
+        "centrality": {name: scores.get(target, (0.0, 0.0))[0] for name, target in canonical.items()},
+        "answers": answer_stats_db.get(user_id, {})
+    }
+
+def study_plan_optimizer(points: List[ExtractedKnowledge], user_id: str, course: Optional[str], source_key: str):
+    refresh_knowledge_stats()
+    key = (user_id, course or "", source_key)
+    answered = answered_count(user_id)
+    entry = study_plans.pop(key, None)
+    names = {p.name for p in points}
+    if entry is None or entry["answered"] != answered or entry["stats_version"] != knowledge_stats.version \
+            or any(name not in names for name in entry["optimizer"].names):
+        entry = {"optimizer": strategy_engine.optimizer(points, plan_history(points, user_id, course)),
+                 "answered": answered, "stats_version": knowledge_stats.version}
+    else:
+        added = [p for p in points if p.name not in entry["optimizer"].index]
+        if added:
+            strategy_engine.add_points(entry["optimizer"], added, plan_history(added, user_id, course))
+    # 重新插入到末尾：超过上限时淘汰最久未使用的计划
+    study_plans[key] = entry
+    while len(study_plans) > STUDY_PLAN_CACHE_SIZE:
+        study_plans.pop(next(iter(study_plans)))
+    return entry["optimizer"], answered
+
+def build_study_plan(points: List[ExtractedKnowledge], user_id: str, course: Optional[str], time_budget: float,
+                     source_key: str = "all") -> dict:
+    with stage("strategy_optimize"):
+        optimizer, answered = study_plan_optimizer(points, user_id, course, source_key)
+        plan = strategy_engine.build_plan(optimizer, time_budget)
+    # answered 记录计算时的作答总数，之后有新的作答记录时预计算的计划即视为过期
+    return {"user_id": user_id, "course": course, "time_budget": time_budget, "answered": answered, "plan": plan}
+
+@app.post("/api/strategy/plan")
+async def generate_study_plan(request: StudyPlanRequest):
+    course = request.course
+    if request.source_id:
+        source = artifact_store.source(request.source_id)
+        if source is None:
+            raise HTTPException(status_code=404, detail="来源不存在")
+        course = course or source["context"].get("course")
+        stored = artifact_store.get("strategy", source["text_key"])
+        if stored is not None and stored["user_id"] == request.user_id and stored["time_budget"] == request.time_budget \
+                and stored["course"] == course and stored["answered"] == answered_count(request.user_id):
+            registry.inc("artifact_served_total", kind="strategy")
+            return {"success": True, "precomputed": True, "time_budget": request.time_budget, "plan": stored["plan"]}
+        points = source_points(source)
+        source_key = source["text_key"]
+    else:
+        points = to_extracted(list(knowledge_db.values()))
+        source_key = "all"
+    plan = build_study_plan(points, request.user_id, course, request.time_budget, source_key)
+    return {"success": True, "precomputed": False, "time_budget": request.time_budget, "plan": plan["plan"]}
+
+@app.post("/api/strategy/answers")
+async def submit_answers(request: AnswerSubmit):
+    before = {}
+
+    def accumulate(stats: dict) -> dict:
+        before["answered"] = sum(entry["total"] for entry in stats.values())
+        for record in request.answers:
+            entry = stats.setdefault(record.knowledge_point, {"correct": 0, "total": 0})
+            entry["total"] += 1
+            entry["correct"] += int(record.correct)
+        return stats
+
+    with stage("storage_write"):
+        answer_stats_db.modify(request.user_id, accumulate)
+    # 本进程保留的该用户计划若已包含此前的全部作答，直接把这批作答计入优化器，下次请求不必重建
+    names = [record.knowledge_point for record in request.answers]
+    correct = [record.correct for record in request.answers]
+    for (user_id, _, _), entry in study_plans.items():
+        if user_id == request.user_id and entry["answered"] == before["answered"]:
+            entry["optimizer"].record_answers(names, correct)
+            entry["answered"] += len(request.answers)
+    return {"success": True, "recorded": len(request.answers)}
 
 @app.get("/api/knowledge")
-async def list_knowledge():
-    return {"knowledge_points": list(knowledge_db.values())}
+async def list_knowledge(request: Request):
+    return cached_json(request, {"knowledge_points": list(knowledge_db.values())})
+
+@app.get("/api/knowledge/hot")
+async def get_hot_knowledge(request: Request, course: Optional[str] = None, year: Optional[str] = None,
+                            limit: int = 20, sort: str = "frequency"):
+    # 历年试卷高频与共现图中心性高的知识点：增量刷新物化结果后直接查询
+    if sort not in ("frequency", "pagerank"):
+        raise HTTPException(status_code=400, detail="sort 只能为 frequency 或 pagerank")
+    refresh_knowledge_stats()
+    return cached_json(request, {
+        "course": course,
+        "year": year,
+        "sort": sort,
+        "courses": knowledge_stats.courses(),
+        "years": knowledge_stats.years(course),
+        "knowledge_points": knowledge_stats.hot_topics(course, year, max(1, min(limit, 200)), sort),
+    })
 
 @app.post("/api/exports/generate")
 async def generate_document(settings: ExportSettings):
@@ -348,16 +1176,19 @@ async def generate_document(settings: ExportSettings):
 
 以Markdown格式返回，只返回内容本身。"""
 
-        result = await call_qwen_api([
-            {"role": "system", "content": "你是一个专业的学习资料整理专家，擅长将知识点整理成结构清晰、易于理解的复习文档。"},
-            {"role": "user", "content": prompt}
-        ], max_tokens=3000)
+        with model_scheduler.bound(settings.user_id):
+            result = await call_qwen_api([
+                {"role": "system", "content": "你是一个专业的学习资料整理专家，擅长将知识点整理成结构清晰、易于理解的复习文档。"},
+                {"role": "user", "content": prompt}
+            ], max_tokens=3000, endpoint="exports_generate", cache=False)
 
         return {
             "success": True,
             "document": result,
             "format": "markdown"
         }
+    except SchedulerError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文档生成失败: {str(e)}")
 
@@ -386,10 +1217,11 @@ async def download_document(settings: ExportSettings):
 
 以Markdown格式返回，只返回内容本身。"""
 
-        result = await call_qwen_api([
-            {"role": "system", "content": "你是一个专业的学习资料整理专家，擅长将知识点整理成结构清晰、易于理解的复习文档。"},
-            {"role": "user", "content": prompt}
-        ], max_tokens=3000)
+        with model_scheduler.bound(settings.user_id):
+            result = await call_qwen_api([
+                {"role": "system", "content": "你是一个专业的学习资料整理专家，擅长将知识点整理成结构清晰、易于理解的复习文档。"},
+                {"role": "user", "content": prompt}
+            ], max_tokens=3000, endpoint="exports_generate", cache=False)
 
         return Response(
             content=result,
@@ -398,72 +1230,153 @@ async def download_document(settings: ExportSettings):
                 "Content-Disposition": f"attachment; filename={settings.title}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
             }
         )
+    except SchedulerError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文档下载失败: {str(e)}")
 
-@app.post("/api/summary/generate")
-async def generate_summary(request: SummaryGenerate):
+def parse_summary_points(data: dict) -> List[ExtractedKnowledge]:
+    # points 每项为 [名称, 重要程度, 描述]，relations 每项为 [上位序号, 下位序号]（也接受知识点名称）
+    points = []
+    for item in data.get("points", []):
+        if isinstance(item, dict):
+            item = [item.get("name"), item.get("importance"), item.get("description", "")]
+        if not isinstance(item, list) or not item or not item[0]:
+            continue
+        name = str(item[0]).strip()
+        importance = item[1] if len(item) > 1 and item[1] in IMPORTANCE_VALUES else Importance.NORMAL.value
+        description = str(item[2]) if len(item) > 2 else ""
+        points.append(ExtractedKnowledge(name=name, importance=Importance(importance), description=description,
+                                         cross_domain=[], related_points=[]))
+
+    def resolve(ref):
+        if isinstance(ref, int) and 0 <= ref < len(points):
+            return points[ref]
+        return next((p for p in points if p.name == ref), None)
+
+    for relation in data.get("relations", []):
+        if not isinstance(relation, list) or len(relation) < 2:
+            continue
+        source, target = resolve(relation[0]), resolve(relation[1])
+        if source is not None and target is not None and source is not target and target.name not in source.related_points:
+            source.related_points.append(target.name)
+    return points
+
+def parse_summary_reply(result: str) -> List[ExtractedKnowledge]:
     try:
-        text = request.text
-        
-        prompt = f"""请根据以下内容生成一份知识摘要，包含知识图谱和表格形式的知识点整理：
+        with stage("json_parse"):
+            json_start = result.find('{')
+            json_end = result.rfind('}') + 1
+            data = json.loads(result[json_start:json_end])
+    except ValueError:
+        return []
+    return parse_summary_points(data) if isinstance(data, dict) else []
+
+async def summarize_text(text: str) -> dict:
+    # 模型只返回紧凑的知识点与关联关系（不含节点编号和坐标），图谱在本地构建并布局
+    prompt = f"""请从以下内容中提取核心知识点及其关联关系：
 
 内容：
 {text}
 
 要求：
-1. 提取核心知识点
-2. 生成知识图谱的节点和边关系
-3. 以表格形式整理知识点，包含名称、重要程度（核心/重要/一般）、简短描述
-4. 识别知识点之间的关联关系
+1. points 中每个知识点为 [名称, 重要程度, 简短描述]，重要程度取 core（核心）/important（重要）/normal（一般），描述不超过30字
+2. relations 中每项为 [序号, 序号]，序号为知识点在 points 中的位置（从0开始），前者为上位或前置知识点
+3. 不要输出其他字段
 
 返回格式：
-{{
-  "knowledge_points": [
-    {{
-      "id": "kp_1",
-      "name": "知识点名称",
-      "importance": "core/important/normal",
-      "description": "知识点描述",
-      "related_points": ["相关知识点1", "相关知识点2"]
-    }}
-  ],
-  "knowledge_graph": {{
-    "nodes": [
-      {{ "id": "node_1", "name": "知识点1", "importance": "core", "x": 100, "y": 100 }}
-    ],
-    "links": [
-      {{ "source": "node_1", "target": "node_2" }}
-    ]
-  }}
-}}
-
-只返回JSON格式，不要其他内容。"""
+{{"points": [["知识点名称", "core", "简短描述"]], "relations": [[0, 1]]}}
 
-        result = await call_qwen_api([
-            {"role": "system", "content": "你是一个专业的知识图谱构建专家，擅长从文本中提取结构化的知识点并构建知识网络。"},
-            {"role": "user", "content": prompt}
-        ], max_tokens=3000)
+只返回JSON，不要其他内容。"""
 
-        try:
-            json_start = result.find('{')
-            json_end = result.rfind('}') + 1
-            json_str = result[json_start:json_end]
-            data = json.loads(json_str)
-        except:
-            data = {
-                "knowledge_points": [],
-                "knowledge_graph": {"nodes": [], "links": []}
-            }
+    result = await call_qwen_api([
+        {"role": "system", "content": "你是一个专业的知识图谱构建专家，擅长从文本中提取结构化的知识点及其关联关系。"},
+        {"role": "user", "content": prompt}
+    ], max_tokens=1500, endpoint="summary_generate", accept=lambda content: bool(parse_summary_reply(content)))
+
+    points = parse_summary_reply(result)
+    if not points:
+        # 解析失败或没有知识点时不返回空摘要：预计算任务会因此失败重试，而不是把空结果永久保存
+        raise ValueError("模型返回的知识摘要无法解析")
+    graph = KnowledgeGraph()
+    for point in points:
+        graph.add_knowledge_point(point)
+    scores = graph.centrality()
+    return {
+        "knowledge_points": [
+            {"id": f"kp_{i + 1}", "name": p.name, "importance": p.importance.value,
+             "description": p.description, "related_points": p.related_points,
+             "pagerank": round(scores[p.name]["pagerank"], 4)}
+            for i, p in enumerate(points)
+        ],
+        "knowledge_graph": graph_layout.layout(graph)
+    }
 
-        return {
-            "success": True,
-            "knowledge_points": data.get("knowledge_points", []),
-            "knowledge_graph": data.get("knowledge_graph", {"nodes": [], "links": []})
-        }
+@app.post("/api/summary/generate")
+async def generate_summary(request: SummaryGenerate):
+    try:
+        # 试卷分析或复习文本提交后已在后台生成过摘要时直接返回
+        data = artifact_store.get_for_text("summary", request.text)
+        precomputed = data is not None
+        if data is None:
+            with model_scheduler.bound(request.user_id):
+                data = await summarize_text(request.text)
+        return FastJSONResponse({"success": True, "precomputed": precomputed, **data})
+    except SchedulerError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"知识摘要生成失败: {str(e)}")
 
+async def summary_for(source: dict) -> dict:
+    summary = artifact_store.get("summary", source["text_key"])
+    if summary is None:
+        # 摘要任务尚未完成：重新请求，相同文本的模型调用会命中缓存
+        summary = await summarize_text(source["text"])
+    return summary
+
+def source_points(source: dict) -> List[ExtractedKnowledge]:
+    summary = artifact_store.get("summary", source["text_key"])
+    if summary and summary["knowledge_points"]:
+        return to_extracted(summary["knowledge_points"])
+    return rule_extractor.extract(source["text"], subject=source["context"].get("course"))
+
+async def build_knowledge_graph_artifact(source: dict) -> dict:
+    graph = (await summary_for(source))["knowledge_graph"]
+    return {"nodes": graph.get("nodes", []), "links": graph.get("links", [])}
+
+async def build_strategy_artifact(source: dict) -> dict:
+    context = source["context"]
+    return build_study_plan(source_points(source), context.get("user_id", "demo"), context.get("course"), 600,
+                            source["text_key"])
+
+async def build_practice_artifact(source: dict) -> dict:
+    # 预生成的题不计入已下发，用户实际打开时才记录
+    return await build_question_set(source["text"], GenerationSettings(), source["context"].get("user_id", "demo"),
+                                    [], mark_served=False)
+
+async def build_summary_artifact(source: dict) -> dict:
+    return await summarize_text(source["text"])
+
+ARTIFACT_BUILDERS = {
+    "summary": build_summary_artifact,
+    "knowledge_graph": build_knowledge_graph_artifact,
+    "strategy": build_strategy_artifact,
+    "practice": build_practice_artifact,
+}
+
+@app.get("/api/artifacts/{source_id}")
+async def get_artifacts(source_id: str):
+    status = artifact_store.status(source_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="来源不存在")
+    return status
+
+@app.delete("/api/artifacts/{source_id}")
+async def delete_artifacts(source_id: str):
+    if artifact_store.source(source_id) is None:
+        raise HTTPException(status_code=404, detail="来源不存在")
+    return {"success": True, "cancelled_jobs": artifact_store.cancel(source_id)}
+
 @app.post("/api/questions/download")
 async def download_questions(questions: dict):
     try:
@@ -507,10 +1420,88 @@ async def download_questions(questions: dict):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"题目下载失败: {str(e)}")
 
+AUDIO_CONTENT_TYPES = {
+    "audio/wav": "wav", "audio/x-wav": "wav", "audio/wave": "wav", "audio/webm": "webm", "audio/ogg": "ogg",
+    "audio/mpeg": "mp3", "audio/mp4": "m4a", "audio/aac": "aac", "audio/flac": "flac",
+}
+
 @app.post("/api/voice/transcribe")
-async def voice_transcribe():
-    return {"text": "函数极限的定义：当x无限接近于x0时，f(x)无限接近于某个常数A，则称A为f(x)当x→x0时的极限。", "success": True}
+async def voice_transcribe(request: Request, format: Optional[str] = None, sample_rate: int = 16000, channels: int = 1):
+    # 整段上传：请求体边接收边识别；裸 PCM 需通过 format/sample_rate/channels 说明
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fmt = format or AUDIO_CONTENT_TYPES.get(content_type, "wav")
+    try:
+        session = await speech_service.open(fmt, sample_rate, channels)
+    except SpeechError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    # 客户端中途断开、管道破裂等任何原因没走到 finish 时，都要结束 ffmpeg 进程和读取任务
+    result = None
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                await session.feed(chunk)
+        result = await session.finish()
+    except SpeechError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    finally:
+        if result is None:
+            session.abort()
+        speech_service.release()
+    return {"success": True, **{key: value for key, value in result.items() if key != "type"}}
+
+@app.websocket("/api/voice/stream")
+async def voice_stream(websocket: WebSocket):
+    # 协议：先发一条 JSON 配置 {"format": "pcm_f32le", "sample_rate": 48000, "channels": 1}，
+    # 随后以二进制消息分块发送音频，最后发 {"event": "end"}。
+    # 服务端推送 partial（当前句的临时结果）、final（一句结束）和 done（全文与实时率）
+    await websocket.accept()
+    try:
+        config = await websocket.receive_json()
+        session = await speech_service.open(config.get("format", "pcm_s16le"),
+                                            int(config.get("sample_rate", 16000)), int(config.get("channels", 1)))
+    except (SpeechError, ValueError, TypeError, AttributeError) as e:
+        status = e.status_code if isinstance(e, SpeechError) else 400
+        await websocket.send_json({"type": "error", "status": status, "detail": getattr(e, "detail", "配置消息不合法")})
+        # 1013 表示服务端暂时过载，客户端可稍后重试
+        await websocket.close(code=1013 if status == 429 else 1003)
+        return
+
+    async def forward_events():
+        while True:
+            event = await session.events.get()
+            await websocket.send_json(event)
+            if event["type"] == "done":
+                return
+
+    sender = asyncio.create_task(forward_events())
+    finished = False
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                await session.feed(message["bytes"])
+            elif message.get("text") and json.loads(message["text"]).get("event") == "end":
+                await session.finish()
+                finished = True
+                await sender
+                await websocket.close()
+                break
+    except (WebSocketDisconnect, SpeechError, ValueError) as e:
+        if isinstance(e, SpeechError):
+            await websocket.send_json({"type": "error", "status": e.status_code, "detail": e.detail})
+            await websocket.close(code=1003)
+    finally:
+        # 断开、出错或发送失败等任何原因没走完 finish 时，结束 ffmpeg 进程和读取任务
+        if not finished:
+            session.abort()
+        sender.cancel()
+        speech_service.release()
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if WORKERS > 1:
+        uvicorn.run("api.main:app", host="0.0.0.0", port=8000, workers=WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
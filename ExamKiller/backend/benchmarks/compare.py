@@ -0,0 +1,56 @@
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, List, Tuple
+
+# 对比两次基准结果：python -m benchmarks.compare baseline.json current.json --threshold 0.1
+# 任一指标退化超过阈值时以非零状态退出，可直接用于 CI
+
+LOWER_IS_BETTER = {"mean", "p50", "p95", "p99"}
+HIGHER_IS_BETTER = {"throughput_rps"}
+
+def flatten(node, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from flatten(value, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(node, list):
+        for i, value in enumerate(node):
+            label = value.get("concurrency", i) if isinstance(value, dict) else i
+            yield from flatten(value, f"{prefix}[{label}]")
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        yield prefix, float(node)
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> List[Dict]:
+    base = dict(flatten(baseline["results"]))
+    rows = []
+    for path, value in flatten(current["results"]):
+        metric = path.rsplit(".", 1)[-1]
+        if metric not in LOWER_IS_BETTER | HIGHER_IS_BETTER or path not in base or base[path] == 0:
+            continue
+        change = (value - base[path]) / base[path]
+        regressed = change > threshold if metric in LOWER_IS_BETTER else change < -threshold
+        rows.append({"metric": path, "baseline": base[path], "current": value, "change": change, "regressed": regressed})
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="对比两次基准结果")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.1, help="允许的相对退化比例")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+
+    rows = compare(baseline, current, args.threshold)
+    for row in rows:
+        flag = "退化" if row["regressed"] else "    "
+        print(f"{flag} {row['metric']:60s} {row['baseline']:12.6f} -> {row['current']:12.6f} ({row['change']:+.1%})")
+    regressions = [row for row in rows if row["regressed"]]
+    print(f"\n共 {len(rows)} 项指标，{len(regressions)} 项退化超过 {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import random
+from typing import Dict, List
+
+import numpy as np
+
+# 确定性合成语料：同一 seed 在任何机器上生成完全相同的试卷与笔记，便于对比多次基准结果
+
+SUBJECTS = {
+    "高等数学": ["函数极限", "导数", "定积分", "不定积分", "数列极限", "级数收敛", "微分方程", "多元函数", "偏导数", "泰勒公式"],
+    "线性代数": ["矩阵", "行列式", "特征值", "线性方程组", "向量空间", "秩", "正交矩阵", "二次型"],
+    "大学物理": ["牛顿定律", "动能定理", "电磁感应", "光的干涉", "热力学第一定律", "量子化", "刚体转动"],
+    "数据结构": ["链表", "二叉树", "哈希表", "排序算法", "图的遍历", "动态规划", "堆", "栈与队列"],
+}
+
+NOTE_TEMPLATES = [
+    "{kp}的定义是理解本章的核心。",
+    "{kp}是指在一定条件下成立的基本概念。",
+    "重点掌握{kp}的性质及其应用。",
+    "{kp}定理必须掌握，考试经常考。",
+    "需要注意{kp}的适用条件，容易出错。",
+    "了解{kp}在{other}中的应用。",
+    "当条件满足时，{kp}可以用来求解{other}问题。",
+    "{kp}与{other}之间存在密切联系，常见题型为综合应用。",
+]
+
+CHOICE_STEMS = [
+    "下列关于{kp}的说法正确的是?",
+    "以下哪一项是{kp}的基本性质?",
+    "关于{kp}与{other}的关系，下列说法正确的是?",
+]
+FILL_STEMS = [
+    "{kp}的定义为____。",
+    "若已知{other}，则{kp}等于____。",
+]
+JUDGE_STEMS = [
+    "{kp}一定成立，对还是错?",
+    "{kp}与{other}是否等价?",
+]
+ESSAY_STEMS = [
+    "简述{kp}的定义并举例说明?",
+    "论述{kp}在{other}中的综合应用?",
+    "证明{kp}的相关性质，并计算一个具体例子。",
+]
+
+def _pick_points(rng: random.Random, subject: str, n: int) -> List[str]:
+    points = SUBJECTS[subject]
+    return [rng.choice(points) for _ in range(n)]
+
+def generate_notes(seed: int, paragraphs: int = 20, sentences_per_paragraph: int = 6, subject: str = None) -> str:
+    rng = random.Random(seed)
+    subject = subject or rng.choice(list(SUBJECTS))
+    lines = []
+    for p in range(paragraphs):
+        sentences = []
+        for _ in range(sentences_per_paragraph):
+            kp, other = _pick_points(rng, subject, 2)
+            sentences.append(rng.choice(NOTE_TEMPLATES).format(kp=kp, other=other))
+        lines.append(f"第{p + 1}节 " + "".join(sentences))
+    return "\n\n".join(lines)
+
+def generate_paper(seed: int, question_count: int = 30, subject: str = None) -> Dict:
+    rng = random.Random(seed)
+    subject = subject or rng.choice(list(SUBJECTS))
+    lines = [f"{subject}期末考试试卷（{2015 + seed % 10}年）", ""]
+    answers = []
+    for i in range(1, question_count + 1):
+        kp, other = _pick_points(rng, subject, 2)
+        kind = rng.choices(["choice", "fill", "judge", "essay"], weights=[5, 3, 1, 2])[0]
+        if kind == "choice":
+            lines.append(f"{i}. " + rng.choice(CHOICE_STEMS).format(kp=kp, other=other))
+            for letter in "ABCD":
+                lines.append(f"{letter}. {rng.choice(SUBJECTS[subject])}的第{rng.randint(1, 9)}种情形")
+            answer = rng.choice("ABCD")
+            lines.append(f"答案：{answer}")
+            answers.append(answer)
+        elif kind == "fill":
+            lines.append(f"{i}. " + rng.choice(FILL_STEMS).format(kp=kp, other=other))
+        elif kind == "judge":
+            lines.append(f"{i}. " + rng.choice(JUDGE_STEMS).format(kp=kp, other=other))
+        else:
+            lines.append(f"{i}. " + rng.choice(ESSAY_STEMS).format(kp=kp, other=other))
+        lines.append("")
+    return {
+        "title": lines[0],
+        "subject": subject,
+        "course": subject,
+        "text": "\n".join(lines),
+        "question_count": question_count,
+        "answers": answers,
+    }
+
+def generate_corpus(seed: int, papers: int = 10, notes: int = 10, question_count: int = 30) -> Dict[str, List]:
+    return {
+        "papers": [generate_paper(seed * 1000 + i, question_count) for i in range(papers)],
+        "notes": [generate_notes(seed * 1000 + i) for i in range(notes)],
+    }
+
+def generate_question_bank(seed: int, size: int) -> List[Dict]:
+    # 题库：题干、知识点、题型、难度、分值相互独立抽样，题干附带随机条件使内容各不相同
+    rng = random.Random(seed)
+    subjects = list(SUBJECTS)
+    stems = {"choice": CHOICE_STEMS, "fill": FILL_STEMS, "judge": JUDGE_STEMS, "essay": ESSAY_STEMS}
+    scores = {"choice": (2, 3), "fill": (3, 4), "judge": (1, 2), "essay": (6, 8, 10)}
+    conditions = "已知设若令当取对任意存在满足区间函数数列矩阵向量概率变量常数参数边界初值"
+    bank = []
+    for i in range(size):
+        subject = rng.choice(subjects)
+        kp, other = _pick_points(rng, subject, 2)
+        qtype = rng.choice(list(stems))
+        condition = "".join(rng.choice(conditions) for _ in range(12))
+        bank.append({
+            "id": f"q{seed}_{i}",
+            "content": condition + rng.choice(stems[qtype]).format(kp=kp, other=other),
+            "type": qtype,
+            "difficulty": rng.choice(["easy", "medium", "hard"]),
+            "score": rng.choice(scores[qtype]),
+            "knowledge_point": kp,
+            "course": subject,
+        })
+    return bank
+
+def generate_page_images(seed: int, pages: int = 100, columns: int = 2, height: int = 1754, width: int = 1240) -> List[np.ndarray]:
+    # 150dpi A4 灰度扫描页：固定页眉、分栏正文行、逐页变化的页码
+    rng = random.Random(seed)
+    images = []
+    for i in range(pages):
+        image = np.full((height, width), 255, dtype=np.uint8)
+        image[60:80, 200:width - 200] = 0
+        column_width = (width - 200) // columns
+        for c in range(columns):
+            x0 = 100 + c * column_width
+            x1 = x0 + column_width - 60
+            for y in range(200, height - 200, 30):
+                line_end = x0 + int((x1 - x0) * rng.uniform(0.6, 1.0))
+                image[y:y + 16, x0:line_end:3] = 0
+        offset = (i % 10) * 12
+        image[height - 100:height - 82, width // 2 - 20 + offset:width // 2 + offset] = 0
+        images.append(image)
+    return images
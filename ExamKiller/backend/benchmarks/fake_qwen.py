@@ -0,0 +1,169 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+from typing import Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from benchmarks.corpus import SUBJECTS
+
+# 本地模拟的 Qwen（OpenAI 兼容）服务：可配置首字节延迟分布、输出吞吐与错误注入
+# 使用方式：QWEN_API_BASE=http://127.0.0.1:9000/v1 启动后端即可全部指向本服务
+
+ALL_POINTS = sorted({kp for points in SUBJECTS.values() for kp in points}, key=len, reverse=True)
+
+config = {
+    "latency": 0.5,
+    "distribution": "fixed",
+    "tail_alpha": 1.5,
+    "tokens_per_second": 200.0,
+    "error_rate": 0.0,
+    "rate_limit_rate": 0.0,
+    "seed": 42,
+    # 按模型覆盖延迟与错误率，如 {"qwen-max": {"latency": 5.0, "error_rate": 0.5}}，用于验证模型降级链
+    "models": {},
+}
+stats = {"requests": 0, "errors": 0, "rate_limited": 0, "completion_tokens": 0}
+
+app = FastAPI(title="Fake Qwen")
+rng = random.Random(config["seed"])
+
+def sample_latency(model: str = None) -> float:
+    base = config["models"].get(model, {}).get("latency", config["latency"])
+    if config["distribution"] == "lognormal":
+        return rng.lognormvariate(0, 0.5) * base
+    if config["distribution"] == "pareto":
+        # 重尾分布：大部分请求接近 base，少数请求远超中位数，用于验证对冲请求
+        return base * rng.paretovariate(config["tail_alpha"])
+    return base
+
+def _points_in(text: str) -> List[str]:
+    found = []
+    for kp in ALL_POINTS:
+        if kp in text and kp not in found:
+            found.append(kp)
+    return found or ["函数极限", "导数"]
+
+def build_content(messages: List[Dict]) -> str:
+    prompt = "\n".join(m.get("content", "") for m in messages)
+    local = random.Random(hashlib.md5(prompt.encode()).hexdigest())
+    points = _points_in(prompt)
+    if "questions" in prompt:
+        match = re.search(r"(\d+)\s*道", prompt)
+        count = int(match.group(1)) if match else 5
+        questions = []
+        for i in range(count):
+            kp = points[i % len(points)]
+            questions.append({
+                "id": i + 1,
+                "content": f"下列关于{kp}的说法正确的是？（第{i + 1}题）",
+                "type": local.choice(["choice", "fill"]),
+                "difficulty": local.choice(["easy", "medium", "hard"]),
+                "score": 2,
+                "options": ["A. 选项1", "B. 选项2", "C. 选项3", "D. 选项4"],
+                "answer": local.choice("ABCD"),
+                "explanation": f"本题考查{kp}。",
+                "knowledge_point": kp,
+            })
+        return json.dumps({"questions": questions, "summary": {"total_count": count, "estimated_time": count * 2}}, ensure_ascii=False)
+    if '"relations"' in prompt:
+        # 知识摘要的紧凑格式：points 为 [名称, 重要程度, 描述]，relations 为知识点序号对
+        compact = [[kp, local.choice(["core", "important", "normal"]), f"{kp}的简短描述"] for kp in points]
+        relations = [[i, j] for i in range(len(points)) for j in range(i + 1, min(i + 3, len(points)))]
+        return json.dumps({"points": compact, "relations": relations}, ensure_ascii=False)
+    if "knowledge_points" in prompt:
+        kps = [{
+            "name": kp,
+            "importance": local.choice(["core", "important", "normal"]),
+            "description": f"{kp}的简短描述",
+            "related_points": [p for p in points if p != kp][:2],
+        } for kp in points]
+        return json.dumps({"knowledge_points": kps, "cross_domain": ["math"]}, ensure_ascii=False)
+    sections = "\n\n".join(f"## {kp}\n\n{kp}的概述、重点难点与典型例题。" for kp in points)
+    return f"# 复习资料\n\n{sections}"
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    model = body.get("model")
+    error_rate = config["models"].get(model, {}).get("error_rate", config["error_rate"])
+    roll = rng.random()
+    if roll < error_rate:
+        stats["errors"] += 1
+        await asyncio.sleep(sample_latency(model) / 2)
+        return JSONResponse({"error": {"message": "injected error"}}, status_code=500)
+    if roll < error_rate + config["rate_limit_rate"]:
+        stats["rate_limited"] += 1
+        return JSONResponse({"error": {"message": "rate limited"}}, status_code=429)
+
+    content = build_content(body.get("messages", []))
+    completion_tokens = min(len(content), body.get("max_tokens", 2048))
+    prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", []))
+    stats["completion_tokens"] += completion_tokens
+    await asyncio.sleep(sample_latency(model))
+
+    payload = json.dumps({
+        "id": "fake-" + hashlib.md5(content.encode()).hexdigest()[:12],
+        "model": body.get("model", "qwen-plus"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }, ensure_ascii=False).encode()
+
+    async def body_stream():
+        # 按输出吞吐分块发送，模拟生成阶段耗时
+        chunk_count = 8
+        step = max(1, len(payload) // chunk_count)
+        delay = completion_tokens / config["tokens_per_second"] / chunk_count if config["tokens_per_second"] else 0
+        for i in range(0, len(payload), step):
+            if delay:
+                await asyncio.sleep(delay)
+            yield payload[i:i + step]
+
+    return StreamingResponse(body_stream(), media_type="application/json")
+
+@app.get("/_stats")
+async def get_stats():
+    return {"config": config, "stats": stats}
+
+@app.post("/_config")
+async def update_config(updates: Dict):
+    config.update({k: v for k, v in updates.items() if k in config})
+    if "seed" in updates:
+        rng.seed(config["seed"])
+    return config
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 Qwen 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=config["latency"], help="首字节延迟基准（秒）")
+    parser.add_argument("--distribution", choices=["fixed", "lognormal", "pareto"], default=config["distribution"])
+    parser.add_argument("--tail-alpha", type=float, default=config["tail_alpha"])
+    parser.add_argument("--tokens-per-second", type=float, default=config["tokens_per_second"])
+    parser.add_argument("--error-rate", type=float, default=config["error_rate"])
+    parser.add_argument("--rate-limit-rate", type=float, default=config["rate_limit_rate"])
+    parser.add_argument("--seed", type=int, default=config["seed"])
+    args = parser.parse_args()
+
+    config.update({
+        "latency": args.latency,
+        "distribution": args.distribution,
+        "tail_alpha": args.tail_alpha,
+        "tokens_per_second": args.tokens_per_second,
+        "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+        "seed": args.seed,
+    })
+    rng.seed(args.seed)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
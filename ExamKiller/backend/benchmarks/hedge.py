@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.common import summarize, write_results
+from benchmarks.load import BACKEND_DIR, wait_until_ready
+from services.hedging import HedgePolicy, HedgeSignal
+
+# 对冲请求验证：模拟 Qwen 使用重尾（pareto）首字节延迟，对比开启/关闭对冲时的尾延迟与额外请求比例
+# python -m benchmarks.hedge --requests 400 --concurrency 8 --percentile 0.95 --budget 0.05
+
+MESSAGES = [{"role": "user", "content": "请简述导数的定义。"}]
+
+async def attempt(client: httpx.AsyncClient, signal: HedgeSignal, policy: Optional[HedgePolicy]) -> str:
+    # 与 api.main._attempt_qwen 相同的流式读取方式：收到响应头即视为首字节，并把 TTFB 样本交给对冲策略
+    signal.started.set()
+    start = time.perf_counter()
+    async with client.stream("POST", "/v1/chat/completions",
+                             json={"model": "qwen-plus", "messages": MESSAGES, "max_tokens": 64}) as response:
+        signal.first_byte.set()
+        if policy is not None:
+            policy.observe_ttfb(time.perf_counter() - start)
+        await response.aread()
+    response.raise_for_status()
+    return response.json()["choices"][0]["message"]["content"]
+
+async def run_mode(base_url: str, policy: Optional[HedgePolicy], total: int, concurrency: int) -> Dict:
+    latencies: List[float] = []
+    remaining = total
+    async with httpx.AsyncClient(base_url=base_url, timeout=300.0,
+                                 limits=httpx.Limits(max_connections=concurrency * 4)) as client:
+        before = (await client.get("/_stats")).json()["stats"]["requests"]
+
+        async def one() -> str:
+            if policy is None:
+                return await attempt(client, HedgeSignal(), None)
+            return await policy.run(lambda signal: attempt(client, signal, policy))
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                await one()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+        after = (await client.get("/_stats")).json()["stats"]["requests"]
+
+    stats = summarize(latencies)
+    stats.update({
+        "upstream_requests": after - before,
+        "extra_call_ratio": (after - before - total) / total if total else 0.0,
+        "wall_seconds": wall,
+    })
+    return stats
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="对冲请求尾延迟验证")
+    parser.add_argument("--fake-port", type=int, default=9010)
+    parser.add_argument("--latency", type=float, default=0.05, help="pareto 分布的尺度（秒）")
+    parser.add_argument("--tail-alpha", type=float, default=1.5)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--percentile", type=float, default=0.95)
+    parser.add_argument("--budget", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    fake = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_qwen", "--port", str(args.fake_port), "--latency", str(args.latency),
+         "--distribution", "pareto", "--tail-alpha", str(args.tail_alpha), "--tokens-per-second", "0",
+         "--seed", str(args.seed)],
+        cwd=BACKEND_DIR,
+    )
+    try:
+        base_url = f"http://127.0.0.1:{args.fake_port}"
+        wait_until_ready(f"{base_url}/_stats")
+        results = {}
+        for name, policy in (("baseline", None), ("hedged", HedgePolicy(args.percentile, args.budget))):
+            results[name] = asyncio.run(run_mode(base_url, policy, args.requests, args.concurrency))
+            stats = results[name]
+            print(f"{name:10s} p50={stats['p50'] * 1000:8.1f}ms p99={stats['p99'] * 1000:8.1f}ms "
+                  f"max={stats['max'] * 1000:8.1f}ms 额外请求={stats['extra_call_ratio'] * 100:5.2f}%")
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    write_results("hedge", {
+        "seed": args.seed,
+        "fake_qwen": {"latency": args.latency, "distribution": "pareto", "tail_alpha": args.tail_alpha},
+        "percentile": args.percentile,
+        "budget": args.budget,
+        "modes": results,
+    }, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import argparse
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+from benchmarks.common import summarize, write_results
+from benchmarks.corpus import generate_notes, generate_paper
+
+# 端到端压测：自动拉起模拟 Qwen 与后端服务，按递增并发逐个接口压测
+# python -m benchmarks.load --concurrency 1 4 16 --requests 40
+# 也可用 --target http://host:port 压测已运行的服务（此时不启动子进程）
+# 模型相关接口每个请求使用不同的复习文本，避免模型响应缓存、分块缓存和预计算结果让后续请求都变成缓存命中；
+# 自动启动的后端同时关闭模型响应缓存（LLM_CACHE_TTL=0）
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def build_endpoints(seed: int) -> Dict[str, Dict]:
+    paper = generate_paper(seed, question_count=20)
+
+    def notes(i: int) -> str:
+        return generate_notes(seed * 100003 + i, paragraphs=5)
+
+    return {
+        "health": {"method": "GET", "path": "/api/health"},
+        "papers_list": {"method": "GET", "path": "/api/papers"},
+        "papers_upload": {"method": "POST", "path": "/api/papers/upload",
+                          "json": {"title": paper["title"], "subject": paper["subject"], "course": paper["course"]}},
+        "knowledge_extract": {"method": "POST", "path": "/api/knowledge/extract", "json": lambda i: {"text": notes(i)}},
+        "knowledge_list": {"method": "GET", "path": "/api/knowledge"},
+        "knowledge_graph": {"method": "GET", "path": "/api/knowledge/graph"},
+        "questions_generate": {"method": "POST", "path": "/api/questions/generate",
+                               "json": lambda i: {"review_input": {"text": notes(i), "source_type": "text"},
+                                                  "settings": {"question_count": 10}}},
+        "summary_generate": {"method": "POST", "path": "/api/summary/generate", "json": lambda i: {"text": notes(i)}},
+        "exports_generate": {"method": "POST", "path": "/api/exports/generate",
+                             "json": lambda i: {"title": "复习资料", "template": "academic", "content": notes(i)}},
+    }
+
+async def run_level(client: httpx.AsyncClient, spec: Dict, concurrency: int, total: int, sequence: Iterator[int]) -> Dict:
+    latencies: List[float] = []
+    errors = 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            payload = spec.get("json")
+            if callable(payload):
+                payload = payload(next(sequence))
+            start = time.perf_counter()
+            try:
+                response = await client.request(spec["method"], spec["path"], json=payload)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    stats = summarize(latencies)
+    stats.update({"concurrency": concurrency, "errors": errors, "throughput_rps": len(latencies) / wall if wall else 0.0})
+    return stats
+
+async def run_all(target: str, endpoints: Dict[str, Dict], levels: List[int], total: int) -> Dict:
+    results = {}
+    limits = httpx.Limits(max_connections=max(levels) * 2)
+    async with httpx.AsyncClient(base_url=target, timeout=300.0, limits=limits) as client:
+        for name, spec in endpoints.items():
+            results[name] = []
+            # 同一接口在各并发级别间也不重复使用请求内容
+            sequence = itertools.count()
+            for level in levels:
+                stats = await run_level(client, spec, level, max(total, level), sequence)
+                print(f"{name:20s} 并发={level:<4d} p50={stats['p50'] * 1000:8.1f}ms "
+                      f"p99={stats['p99'] * 1000:8.1f}ms 吞吐={stats['throughput_rps']:7.1f}/s 错误={stats['errors']}")
+                results[name].append(stats)
+    return results
+
+def wait_until_ready(url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"服务未能在 {timeout} 秒内就绪: {url}")
+
+def start_services(args) -> List[subprocess.Popen]:
+    fake = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_qwen", "--port", str(args.fake_port),
+         "--latency", str(args.latency), "--distribution", args.distribution,
+         "--tokens-per-second", str(args.tokens_per_second), "--error-rate", str(args.error_rate),
+         "--seed", str(args.seed)],
+        cwd=BACKEND_DIR,
+    )
+    env = dict(os.environ, QWEN_API_BASE=f"http://127.0.0.1:{args.fake_port}/v1", LLM_CACHE_TTL="0")
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    wait_until_ready(f"http://127.0.0.1:{args.fake_port}/_stats")
+    wait_until_ready(f"http://127.0.0.1:{args.port}/api/health")
+    return [fake, backend]
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="ExamKiller 端到端压测")
+    parser.add_argument("--target", help="已运行服务的地址，不指定时自动启动模拟服务与后端")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--fake-port", type=int, default=9000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--requests", type=int, default=32, help="每个并发级别的请求数")
+    parser.add_argument("--endpoints", nargs="*")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--distribution", default="lognormal")
+    parser.add_argument("--tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    endpoints = build_endpoints(args.seed)
+    if args.endpoints:
+        endpoints = {name: spec for name, spec in endpoints.items() if name in args.endpoints}
+
+    processes = [] if args.target else start_services(args)
+    try:
+        target = args.target or f"http://127.0.0.1:{args.port}"
+        results = asyncio.run(run_all(target, endpoints, args.concurrency, args.requests))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    write_results("load", {
+        "seed": args.seed,
+        "fake_qwen": {"latency": args.latency, "distribution": args.distribution,
+                      "tokens_per_second": args.tokens_per_second, "error_rate": args.error_rate},
+        "endpoints": results,
+    }, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+import argparse
+import gc
+import json
+import os
+import random
+import re
+import tempfile
+import tracemalloc
+from dataclasses import fields, make_dataclass
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from benchmarks.common import measure, write_results
+from benchmarks.corpus import (
+    SUBJECTS, generate_corpus, generate_notes, generate_page_images, generate_paper, generate_question_bank
+)
+from services.ai_generator import KnowledgeExtractor, KnowledgeGraph, StrategyEngine, StudyPlanOptimizer
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from services.columnar import BlockBatch, QuestionBatch
+from services.graph_analytics import KnowledgeStats
+from services.graph_layout import GraphLayout
+from services.keywords import BUILTIN_KEYWORDS, KeywordAutomaton, ahocorasick
+from services.responses import FastJSONResponse, brotli, compress
+from services.paper_assembly import PaperAssembler, QuestionBank
+from services.paper_analyzer import (
+    ContentBlock, LayoutAnalyzer, Page, PaperMetadata, PaperSimilarity, PaperStructure, QuestionExtractor
+)
+from services.store import SQLiteStore
+
+# 微基准：python -m benchmarks.micro [--scale 2] [--only question_extract]
+
+BENCHMARKS: Dict[str, Callable] = {}
+
+def benchmark(name: str):
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+def paper_structure(paper: Dict) -> PaperStructure:
+    blocks = [
+        ContentBlock(block_type="text", content=line, position=(72.0, 72.0 + 14.0 * i), size=(450.0, 12.0), confidence=0.98)
+        for i, line in enumerate(paper["text"].split("\n")) if line
+    ]
+    pages = [Page(page_number=1, width=595.0, height=842.0, header=None, footer=None, columns=1, blocks=blocks)]
+    metadata = PaperMetadata(title=paper["title"], subject=paper["subject"], course=paper["course"], chapter=None,
+                             exam_date=None, difficulty=3.0, total_pages=1, question_count=paper["question_count"])
+    return PaperStructure(pages=pages, metadata=metadata)
+
+@benchmark("question_extract")
+def bench_question_extract(seed: int, scale: int) -> Dict:
+    paper = generate_paper(seed, question_count=50 * scale)
+    extractor = QuestionExtractor()
+    stats = measure(lambda: extractor.extract(paper["text"], {}))
+    stats["questions"] = len(extractor.extract(paper["text"], {}))
+    stats["chars"] = len(paper["text"])
+    return stats
+
+@benchmark("knowledge_rules")
+def bench_knowledge_rules(seed: int, scale: int) -> Dict:
+    notes = generate_notes(seed, paragraphs=20 * scale)
+    extractor = KnowledgeExtractor()
+    stats = measure(lambda: extractor._extract_with_rules(notes), repeat=5, warmup=1)
+    stats["points"] = len(extractor._extract_with_rules(notes))
+    stats["chars"] = len(notes)
+    return stats
+
+@benchmark("knowledge_graph")
+def bench_knowledge_graph(seed: int, scale: int) -> Dict:
+    extractor = KnowledgeExtractor()
+    points = extractor._extract_with_rules(generate_notes(seed, paragraphs=20 * scale))
+
+    def build():
+        graph = KnowledgeGraph()
+        for point in points:
+            graph.add_knowledge_point(point)
+        return graph
+
+    graph = build()
+    names = list(graph.nodes)
+    return {
+        "build": measure(build),
+        "get_related": measure(lambda: [graph.get_related(name, depth=3) for name in names]),
+        "nodes": len(graph.nodes),
+        "edges": sum(len(targets) for targets in graph.edges.values()),
+    }
+
+@benchmark("paper_similarity")
+def bench_paper_similarity(seed: int, scale: int) -> Dict:
+    corpus = generate_corpus(seed, papers=10 * scale, notes=0)
+    structures = [paper_structure(paper) for paper in corpus["papers"]]
+    similarity = PaperSimilarity()
+
+    def all_pairs():
+        for i in range(len(structures)):
+            for j in range(i + 1, len(structures)):
+                similarity.calculate_similarity(structures[i], structures[j])
+
+    stats = measure(all_pairs, repeat=5, warmup=1)
+    stats["papers"] = len(structures)
+    return stats
+
+@benchmark("layout_analyze")
+def bench_layout_analyze(seed: int, scale: int) -> Dict:
+    images = generate_page_images(seed, pages=100 * scale)
+    analyzer = LayoutAnalyzer()
+    stats = measure(lambda: analyzer.analyze_document(images), repeat=3, warmup=1)
+    stats["pages"] = len(images)
+    return stats
+
+@benchmark("study_plan")
+def bench_study_plan(seed: int, scale: int) -> Dict:
+    rng = np.random.default_rng(seed)
+    n = 10000 * scale
+    names = [f"知识点{i}" for i in range(n)]
+    optimizer = StudyPlanOptimizer(names, rng.choice([1.0, 2.0, 3.0], n), rng.integers(0, 20, n).astype(float))
+    engine = StrategyEngine()
+    answered = [names[i] for i in rng.integers(0, n, 200)]
+    return {
+        "points": n,
+        "allocate": measure(lambda: optimizer.allocate(60.0 * n / 10)),
+        "build_plan": measure(lambda: engine.build_plan(optimizer, 60.0 * n / 10), repeat=5),
+        "record_answers": measure(lambda: optimizer.record_answers(answered, [False] * len(answered))),
+    }
+
+@benchmark("paper_assembly")
+def bench_paper_assembly(seed: int, scale: int) -> Dict:
+    bank = QuestionBank()
+    questions = generate_question_bank(seed, 100000 * scale)
+    build = measure(lambda: QuestionBank().add_many(questions[:10000]), repeat=3, warmup=0)
+    bank.add_many(questions)
+    assembler = PaperAssembler(bank)
+    points = SUBJECTS["高等数学"]
+    result = assembler.assemble(30, {"easy": 30, "medium": 50, "hard": 20}, ["choice", "fill", "essay"], points, total_score=100, seed=seed)
+    return {
+        "bank_size": len(bank),
+        "index_build_per_10k": build,
+        "assemble": measure(lambda: assembler.assemble(
+            30, {"easy": 30, "medium": 50, "hard": 20}, ["choice", "fill", "essay"], points, total_score=100, seed=seed)),
+        "total_score": result["total_score"],
+        "shortfall": result["shortfall"],
+    }
+
+def allocated(build: Callable):
+    # 构建结果仍存活时新增的内存（tracemalloc 统计的 Python 与 numpy 分配）
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size
+
+def scan_pages(lines: List[str], pages: int, block_cls=ContentBlock) -> List[Page]:
+    per_page = max(1, len(lines) // pages)
+    result = []
+    for p in range(pages):
+        # decode 生成新的字符串对象，使每个块的文本都计入内存
+        blocks = [
+            block_cls(block_type="text", content=line.encode().decode(), position=(72.0, 72.0 + 14.0 * i),
+                      size=(450.0, 12.0), confidence=0.98)
+            for i, line in enumerate(lines[p * per_page:(p + 1) * per_page])
+        ]
+        result.append(Page(page_number=p + 1, width=595.0, height=842.0, header=None, footer=None, columns=1, blocks=blocks))
+    return result
+
+@benchmark("paper_memory")
+def bench_paper_memory(seed: int, scale: int) -> Dict:
+    # 500 页合成扫描件：未加 __slots__ 的旧数据类、slots 数据类、列式容器三种表示的每块内存与序列化开销
+    pages = 500 * scale
+    paper = generate_paper(seed, question_count=6500 * scale)
+    lines = [line for line in paper["text"].split("\n") if line]
+    legacy_block = make_dataclass("LegacyContentBlock", [(f.name, f.type) for f in fields(ContentBlock)])
+
+    legacy, legacy_bytes = allocated(lambda: scan_pages(lines, pages, legacy_block))
+    blocks = sum(len(page.blocks) for page in legacy)
+    del legacy
+    slotted, slotted_bytes = allocated(lambda: scan_pages(lines, pages))
+    batch, batch_bytes = allocated(lambda: BlockBatch.from_pages(slotted))
+
+    questions = QuestionExtractor().extract(paper["text"], {})
+    question_batch = QuestionBatch.from_questions(questions)
+    as_json = lambda: json.dumps([{f.name: getattr(b, f.name) for f in fields(ContentBlock)} for page in slotted for b in page.blocks],
+                                 ensure_ascii=False).encode("utf-8")
+    blob = batch.to_bytes()
+    question_blob = question_batch.to_bytes()
+    return {
+        "pages": pages,
+        "blocks": blocks,
+        "bytes_per_block": {
+            "dataclass": legacy_bytes / blocks,
+            "slots": slotted_bytes / blocks,
+            "columnar": batch_bytes / blocks,
+        },
+        "block_serialize": {
+            "columnar_bytes": len(blob),
+            "json_bytes": len(as_json()),
+            "to_bytes": measure(batch.to_bytes, repeat=10),
+            "from_bytes": measure(lambda: BlockBatch.from_bytes(blob), repeat=10),
+            "json_dumps": measure(as_json, repeat=3, warmup=1),
+            "from_pages": measure(lambda: BlockBatch.from_pages(slotted), repeat=3, warmup=1),
+        },
+        "questions": len(questions),
+        "question_batch_bytes": question_batch.nbytes,
+        "question_serialize": {
+            "columnar_bytes": len(question_blob),
+            "to_bytes": measure(question_batch.to_bytes, repeat=10),
+            "from_bytes": measure(lambda: QuestionBatch.from_bytes(question_blob), repeat=10),
+        },
+    }
+
+@benchmark("api_response")
+def bench_api_response(seed: int, scale: int) -> Dict:
+    # 1 万道题的列表接口：FastAPI 默认路径（jsonable_encoder + json）与 orjson 的序列化耗时，以及各编码下的传输字节数
+    content = {"questions": generate_question_bank(seed, 10000 * scale)}
+    body = FastJSONResponse(content).body
+    wire = {"identity": len(body), "gzip": len(compress("gzip", body))}
+    timings = {
+        "default_encoder": measure(lambda: JSONResponse(jsonable_encoder(content)), repeat=5, warmup=1),
+        "orjson": measure(lambda: FastJSONResponse(content), repeat=5, warmup=1),
+        "gzip": measure(lambda: compress("gzip", body), repeat=5, warmup=1),
+    }
+    if brotli is not None:
+        wire["br"] = len(compress("br", body))
+        timings["br"] = measure(lambda: compress("br", body), repeat=5, warmup=1)
+    return {"questions": len(content["questions"]), "default_bytes": len(JSONResponse(content).body),
+            "wire_bytes": wire, "serialize": timings}
+
+def estimate_tokens(text: str) -> int:
+    # 粗略估算：汉字约 1 token/字，其余字符约 4 字符/token
+    cjk = sum(1 for ch in text if "\u4e00" <= ch <= "\u9fff")
+    return cjk + (len(text) - cjk + 3) // 4
+
+@benchmark("summary_graph")
+def bench_summary_graph(seed: int, scale: int) -> Dict:
+    # 知识摘要的模型输出：旧格式（知识点 + 带编号和坐标的完整图谱）与紧凑格式（知识点 + 关联序号对）的体量，
+    # 以及本地布局的耗时（首次计算与命中缓存）
+    extractor = KnowledgeExtractor()
+    points = extractor._extract_with_rules(generate_notes(seed, paragraphs=4 * scale))[:30 * scale]
+    graph = KnowledgeGraph()
+    for point in points:
+        graph.add_knowledge_point(point)
+    names = list(graph.nodes)
+    index = {name: i for i, name in enumerate(names)}
+    links = graph.links()
+
+    legacy = {
+        "knowledge_points": [
+            {"id": f"kp_{i + 1}", "name": name, "importance": graph.nodes[name]["importance"],
+             "description": graph.nodes[name]["description"][:30],
+             "related_points": [t for t in graph.edges.get(name, []) if t in graph.nodes]}
+            for i, name in enumerate(names)
+        ],
+        "knowledge_graph": {
+            "nodes": [{"id": f"node_{i + 1}", "name": name, "importance": graph.nodes[name]["importance"],
+                       "x": 100 + i * 37 % 600, "y": 100 + i * 53 % 300} for i, name in enumerate(names)],
+            "links": [{"source": f"node_{index[s] + 1}", "target": f"node_{index[t] + 1}"} for s, t in links],
+        },
+    }
+    compact = {
+        "points": [[name, graph.nodes[name]["importance"], graph.nodes[name]["description"][:30]] for name in names],
+        "relations": [[index[s], index[t]] for s, t in links],
+    }
+    legacy_text = json.dumps(legacy, ensure_ascii=False)
+    compact_text = json.dumps(compact, ensure_ascii=False)
+
+    warm = GraphLayout({})
+    warm.layout(graph)
+    return {
+        "nodes": len(names),
+        "links": len(links),
+        "legacy": {"chars": len(legacy_text), "estimated_tokens": estimate_tokens(legacy_text)},
+        "compact": {"chars": len(compact_text), "estimated_tokens": estimate_tokens(compact_text)},
+        "token_ratio": round(estimate_tokens(compact_text) / estimate_tokens(legacy_text), 3),
+        "layout_cold": measure(lambda: GraphLayout({}).layout(graph)),
+        "layout_cached": measure(lambda: warm.layout(graph)),
+    }
+
+def synthetic_papers(rng: random.Random, count: int, start: int = 0) -> Dict[str, Dict]:
+    # 每门课程约 20 倍于基础知识点的词表，每份试卷抽 8 个知识点，考试年份 2010-2024
+    papers = {}
+    for i in range(start, start + count):
+        course = rng.choice(list(SUBJECTS))
+        vocabulary = [f"{name}{k}" for name in SUBJECTS[course] for k in range(20)]
+        papers[f"p{i}"] = {"id": f"p{i}", "course": course, "exam_date": str(rng.randint(2010, 2024)),
+                           "analysis": {"knowledge_points": rng.sample(vocabulary, 8)}}
+    return papers
+
+@benchmark("knowledge_stats")
+def bench_knowledge_stats(seed: int, scale: int) -> Dict:
+    # 历年知识点频次与共现图中心性：全量扫描统计（原 paper_frequency 的做法）、首次物化、
+    # 新增少量试卷后的增量刷新，以及物化后的热点查询
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteStore(os.path.join(tmp, "stats.db"))
+        papers, questions = store.collection("papers"), store.collection("questions")
+        papers.put_many(synthetic_papers(rng, 5000 * scale).items())
+
+        def full_scan():
+            frequency = {}
+            for paper in papers.values():
+                for name in paper["analysis"]["knowledge_points"]:
+                    frequency[name] = frequency.get(name, 0) + 1
+            return frequency
+
+        def materialize():
+            stats = KnowledgeStats(papers, questions)
+            stats.refresh()
+            stats.centrality()
+            return stats
+
+        stats = materialize()
+        added = iter(range(10 ** 6))
+
+        def incremental():
+            papers.put_many(synthetic_papers(rng, 20, 5000 * scale + 20 * next(added)).items())
+            stats.refresh()
+            stats.centrality("高等数学")
+
+        def uncached_query():
+            stats._cache.clear()
+            stats.graphs["高等数学"].dirty = True
+            return stats.hot_topics("高等数学", limit=20)
+
+        return {
+            "papers": 5000 * scale,
+            "nodes": sum(len(graph.names) for graph in stats.graphs.values()),
+            "edges": sum(len(graph.pairs) for graph in stats.graphs.values()),
+            "full_scan_frequency": measure(full_scan, repeat=5, warmup=1),
+            "materialize": measure(materialize, repeat=3, warmup=0),
+            "incremental_refresh_20": measure(incremental, repeat=10, warmup=1),
+            "hot_topics_recompute": measure(uncached_query, repeat=10, warmup=1),
+            "hot_topics_cached": measure(lambda: stats.hot_topics("高等数学", limit=20)),
+        }
+
+# 自动机之前的实现：每句依次跑各组正则，领域与难度逐个关键词做子串判断
+LEGACY_IMPORTANCE = [
+    ("core", [r'定义|概念|原理|定理|公式|重要|核心|关键', r'必须掌握|重点|主要|基本']),
+    ("important", [r'性质|应用|方法|技巧|常见', r'需要注意|容易出错|经常考']),
+    ("normal", [r'了解|知道|熟悉|参考']),
+]
+
+def legacy_classify(sentence: str, keywords: Dict[str, List[str]]) -> Dict:
+    importance = next((level for level, patterns in LEGACY_IMPORTANCE
+                       if any(re.search(pattern, sentence) for pattern in patterns)), None)
+    if importance is None:
+        importance = "important" if '如果' in sentence or '当' in sentence else "normal"
+    domains = [category.split(":")[1] for category, words in keywords.items()
+               if category.startswith("domain:") and any(word in sentence for word in words)]
+    hard = sum(1 for word in keywords["difficulty:hard"] if word in sentence)
+    easy = sum(1 for word in keywords["difficulty:easy"] if word in sentence)
+    return {"importance": importance, "domains": domains, "hard": hard, "easy": easy}
+
+def automaton_classify(automaton: KeywordAutomaton, text: str) -> List[Dict]:
+    sentences = re.split(r'[。！？；\n]', text)
+    results = []
+    for sentence, categories in zip(sentences, automaton.split_categories(text, '。！？；\n')):
+        if not sentence.strip():
+            continue
+        importance = next((level for level in ("core", "important", "normal") if f"importance:{level}" in categories),
+                          "important" if "condition" in categories else "normal")
+        results.append({
+            "importance": importance,
+            "domains": [c.split(":")[1] for c in automaton.category_order if c.startswith("domain:") and c in categories],
+            "hard": len(categories.get("difficulty:hard", ())),
+            "easy": len(categories.get("difficulty:easy", ())),
+        })
+    return results
+
+@benchmark("keyword_scan")
+def bench_keyword_scan(seed: int, scale: int) -> Dict:
+    # 大批量复习笔记的关键词分类（重要程度、领域、难度指示）：逐句正则/子串判断与整段一次自动机扫描的吞吐。
+    # large 为追加 2000 个学科自定义关键词后的词典，逐句判断的耗时随词典线性增长，自动机基本不变
+    notes = generate_notes(seed, paragraphs=400 * scale)
+    sentences = [s.strip() for s in re.split(r'[。！？；\n]', notes) if s.strip()]
+    megabytes = len(notes.encode("utf-8")) / 1e6
+    rng = np.random.default_rng(seed)
+    vocabulary = sorted(set(notes) - set("。！？；，：\n "))
+    custom = sorted({"".join(rng.choice(vocabulary, size=int(rng.integers(2, 5)))) for _ in range(2000)})
+
+    results = {"chars": len(notes), "sentences": len(sentences)}
+    for name, keywords in (("builtin", BUILTIN_KEYWORDS), ("large", {**BUILTIN_KEYWORDS, "domain:custom": custom})):
+        legacy = [legacy_classify(sentence, keywords) for sentence in sentences]
+        timings = {"legacy_per_sentence": measure(lambda: [legacy_classify(s, keywords) for s in sentences], repeat=5, warmup=1)}
+        agreement = {}
+        for backend, native in (("python", False), ("native", True)):
+            if native and ahocorasick is None:
+                continue
+            automaton = KeywordAutomaton(keywords, native=native)
+            agreement[backend] = sum(a == b for a, b in zip(legacy, automaton_classify(automaton, notes))) / len(sentences)
+            timings[f"automaton_{backend}"] = measure(lambda: automaton_classify(automaton, notes), repeat=5, warmup=1)
+            timings[f"build_{backend}"] = measure(lambda: KeywordAutomaton(keywords, native=native), repeat=3, warmup=1)
+        results[name] = {
+            "keywords": sum(len(words) for words in keywords.values()),
+            "agreement": agreement,
+            "timings": timings,
+            "throughput_mb_s": {k: round(megabytes / t["p50"], 2) for k, t in timings.items() if not k.startswith("build")},
+        }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="ExamKiller 微基准")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS))
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.only or sorted(BENCHMARKS):
+        print(f"运行 {name} ...")
+        results[name] = BENCHMARKS[name](args.seed, args.scale)
+    write_results("micro", {"seed": args.seed, "scale": args.scale, "benchmarks": results}, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,17 @@
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Set, Tuple
 from dataclasses import dataclass
 from enum import Enum
 import hashlib
 import re
 import requests
 import json
+import time
+
+import numpy as np
+
+from .graph_analytics import centrality
+from .keywords import KeywordRegistry, keyword_registry
+from .metrics import registry, stage, timed
 
 class Difficulty(Enum):
     EASY = "easy"
@@ -34,6 +41,8 @@ class QwenAPIClient:
             "max_tokens": 2048
         }
         
+        start = time.perf_counter()
+        status = "ok"
         try:
             response = requests.post(
                 self.base_url,
@@ -41,12 +50,20 @@ class QwenAPIClient:
                 json=payload,
                 timeout=30
             )
+            # requests 的 elapsed 为发出请求到解析完响应头的时间，即首字节时间
+            registry.observe("model_ttfb_seconds", response.elapsed.total_seconds(), model=self.model_name)
             response.raise_for_status()
             result = response.json()
+            usage = result.get("usage", {})
+            registry.inc("model_tokens_total", usage.get("prompt_tokens", 0), model=self.model_name, kind="prompt")
+            registry.inc("model_tokens_total", usage.get("completion_tokens", 0), model=self.model_name, kind="completion")
             return result["choices"][0]["message"]["content"]
         except Exception as e:
+            status = "error"
             print(f"Qwen API Error: {e}")
             return f"API调用失败: {str(e)}"
+        finally:
+            registry.observe("model_call_seconds", time.perf_counter() - start, model=self.model_name, status=status)
 
 @dataclass
 class ExtractedKnowledge:
@@ -56,47 +73,59 @@ class ExtractedKnowledge:
     cross_domain: List[str]
     related_points: List[str]
 
+NAME_PATTERNS = [
+    r'([^\s\d，。！？；:：]+(?:定义|概念|定理|法则|原理|性质))',
+    r'([^\s\d，。！？；:：]{2,10})(?:是指|是|指|称为)',
+    r'((?:第|一|二|三|四|五|六|七|八|九|十)+(?:章|节|部分|点|条|款))'
+]
+
+# 按顺序判断：先命中的类别决定重要程度，条件句（如果/当）视为重要，都未命中为一般
+IMPORTANCE_ORDER = [
+    ("importance:core", Importance.CORE),
+    ("importance:important", Importance.IMPORTANT),
+    ("importance:normal", Importance.NORMAL),
+    ("condition", Importance.IMPORTANT),
+]
+
+SENTENCE_SEPARATORS = '。！？；\n'
+
 class KnowledgeExtractor:
-    def __init__(self, model_path: str = None, qwen_client: QwenAPIClient = None):
-        self.important_patterns = {
-            Importance.CORE: [
-                r'定义|概念|原理|定理|公式|重要|核心|关键',
-                r'必须掌握|重点|主要|基本'
-            ],
-            Importance.IMPORTANT: [
-                r'性质|应用|方法|技巧|常见',
-                r'需要注意|容易出错|经常考'
-            ],
-            Importance.NORMAL: [
-                r'了解|知道|熟悉|参考'
-            ]
-        }
-        
-        self.domain_keywords = {
-            'math': ['极限', '导数', '积分', '函数', '数列', '级数', '矩阵'],
-            'physics': ['力', '能', '热', '光', '电磁', '量子'],
-            'chemistry': ['元素', '反应', '化学键', '溶液', '有机'],
-            'computer': ['算法', '数据结构', '网络', '数据库', '编程']
-        }
-        
+    def __init__(self, model_path: str = None, qwen_client: QwenAPIClient = None, keywords: KeywordRegistry = None):
+        # 重要程度与学科领域关键词由 keywords 编译成多模式自动机，可按学科加载自定义词典
+        self.keywords = keywords or keyword_registry
         self.qwen_client = qwen_client
     
-    def extract(self, text: str) -> List[ExtractedKnowledge]:
+    @timed("knowledge_extract")
+    def extract(self, text: str, subject: Optional[str] = None) -> List[ExtractedKnowledge]:
         if self.qwen_client:
             return self._extract_with_ai(text)
         else:
-            return self._extract_with_rules(text)
+            return self._extract_with_rules(text, subject)
+
+    def rule_confidence(self, text: str, subject: Optional[str] = None) -> float:
+        # 供 api 中的 ModelRouter 决定走规则引擎还是模型。规则引擎的把握：句子命中知识点命名模式与重要性关键词的比例，二者各占一半
+        sentences = self._sentence_categories(text, subject)
+        if not sentences:
+            return 1.0
+        hits = 0.0
+        for sentence, categories in sentences:
+            if any(re.search(pattern, sentence) for pattern in NAME_PATTERNS):
+                hits += 0.5
+            if any(category.startswith("importance:") for category in categories):
+                hits += 0.5
+        return hits / len(sentences)
     
-    def _extract_with_rules(self, text: str) -> List[ExtractedKnowledge]:
-        sentences = self._split_sentences(text)
+    def _extract_with_rules(self, text: str, subject: Optional[str] = None) -> List[ExtractedKnowledge]:
+        classified = self._sentence_categories(text, subject)
+        sentences = [sentence for sentence, _ in classified]
         knowledge_points = []
         
-        for sentence in sentences:
-            importance = self._classify_importance(sentence)
+        for sentence, categories in classified:
+            importance = self._importance_of(categories)
             if importance:
                 name = self._extract_name(sentence)
                 if name and len(name) >= 2:
-                    cross_domain = self._find_cross_domain(name)
+                    cross_domain = self._find_cross_domain(name, subject)
                     related = self._find_related(name, sentences)
                     
                     knowledge_points.append(ExtractedKnowledge(
@@ -124,7 +153,8 @@ class KnowledgeExtractor:
         response = self.qwen_client.call_api(messages)
         
         try:
-            result = json.loads(response)
+            with stage("json_parse"):
+                result = json.loads(response)
             extracted_points = []
             
             for point in result.get('knowledge_points', []):
@@ -144,31 +174,26 @@ class KnowledgeExtractor:
             print(f"AI提取结果解析失败: {e}")
             return self._extract_with_rules(text)
     
-    def _split_sentences(self, text: str) -> List[str]:
-        sentences = re.split(r'[。！？；\n]', text)
-        return [s.strip() for s in sentences if s.strip()]
-    
-    def _classify_importance(self, text: str) -> Optional[Importance]:
-        text_lower = text.lower()
-        
-        for importance, patterns in self.important_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, text):
-                    return importance
-        
-        if '如果' in text or '当' in text:
-            return Importance.IMPORTANT
-        
+    def _sentence_categories(self, text: str, subject: Optional[str] = None) -> List[Tuple[str, Dict[str, Set[str]]]]:
+        # 整段文本只扫描一次，自动机按句子分隔符把命中的关键词分到各句
+        segments = self.keywords.automaton(subject).split_categories(text, SENTENCE_SEPARATORS)
+        return [
+            (sentence.strip(), categories)
+            for sentence, categories in zip(re.split(f'[{SENTENCE_SEPARATORS}]', text), segments)
+            if sentence.strip()
+        ]
+
+    def _importance_of(self, categories: Dict[str, Set[str]]) -> Importance:
+        for category, importance in IMPORTANCE_ORDER:
+            if category in categories:
+                return importance
         return Importance.NORMAL
     
+    def _classify_importance(self, text: str, subject: Optional[str] = None) -> Optional[Importance]:
+        return self._importance_of(self.keywords.automaton(subject).categories(text))
+    
     def _extract_name(self, text: str) -> Optional[str]:
-        patterns = [
-            r'([^\s\d，。！？；:：]+(?:定义|概念|定理|法则|原理|性质))',
-            r'([^\s\d，。！？；:：]{2,10})(?:是指|是|指|称为)',
-            r'((?:第|一|二|三|四|五|六|七|八|九|十)+(?:章|节|部分|点|条|款))'
-        ]
-        
-        for pattern in patterns:
+        for pattern in NAME_PATTERNS:
             match = re.search(pattern, text)
             if match:
                 return match.group(1)
@@ -179,14 +204,13 @@ class KnowledgeExtractor:
         
         return None
     
-    def _find_cross_domain(self, name: str) -> List[str]:
-        cross_domains = []
-        
-        for domain, keywords in self.domain_keywords.items():
-            if any(kw in name for kw in keywords):
-                cross_domains.append(domain)
-        
-        return cross_domains
+    def _find_cross_domain(self, name: str, subject: Optional[str] = None) -> List[str]:
+        automaton = self.keywords.automaton(subject)
+        found = automaton.categories(name)
+        return [
+            category.split(":", 1)[1] for category in automaton.category_order
+            if category.startswith("domain:") and category in found
+        ]
     
     def _find_related(self, name: str, sentences: List[str]) -> List[str]:
         related = []
@@ -244,9 +268,16 @@ class KnowledgeGraph:
         
         return list(related)
     
-    def get_subtree(self, root: str) -> Dict:
+    def centrality(self) -> Dict[str, Dict[str, float]]:
+        # 每个知识点在关联图上的 PageRank 与度中心性
+        return centrality(list(self.nodes), self.links())
+
+    def get_subtree(self, root: str, _visited: Optional[set] = None) -> Dict:
         if root not in self.nodes:
             return {}
+        # 知识点之间常有互相关联（环）：每个节点只展开一次，得到以 root 为根的生成树
+        visited = _visited if _visited is not None else set()
+        visited.add(root)
         
         subtree = {
             'name': root,
@@ -256,12 +287,27 @@ class KnowledgeGraph:
         
         if root in self.edges:
             for child in self.edges[root]:
-                child_subtree = self.get_subtree(child)
+                if child in visited:
+                    continue
+                child_subtree = self.get_subtree(child, visited)
                 if child_subtree:
                     subtree['children'].append(child_subtree)
         
         return subtree
 
+    def links(self) -> List[Tuple[str, str]]:
+        # 两端都是已知知识点的边，互为关联的一对只保留一条
+        seen = set()
+        links = []
+        for source, targets in self.edges.items():
+            for target in targets:
+                pair = frozenset((source, target))
+                if source == target or target not in self.nodes or source not in self.nodes or pair in seen:
+                    continue
+                seen.add(pair)
+                links.append((source, target))
+        return links
+
 class QuestionGenerator:
     def __init__(self, model_path: str = None, qwen_client: QwenAPIClient = None):
         self.question_templates = {
@@ -297,6 +343,13 @@ class QuestionGenerator:
             return self._generate_with_ai(knowledge_points, settings)
         else:
             return self._generate_with_rules(knowledge_points, settings)
+
+    def rule_confidence(self, settings: Dict) -> float:
+        # 供 api 中的 ModelRouter 决定走规则引擎还是模型。模板题只适合考查定义、性质的简单题：简单题占比越高、题量越少，规则出题越够用
+        ratio = settings.get('difficulty_ratio', {'easy': 0.3, 'medium': 0.5, 'hard': 0.2})
+        easy_share = ratio.get('easy', 0) / (sum(ratio.values()) or 1)
+        small = 1.0 if settings.get('question_count', 20) <= 5 else 0.0
+        return 0.8 * easy_share + 0.2 * small
     
     def _generate_with_rules(self, knowledge_points: List[ExtractedKnowledge], settings: Dict) -> List[Dict]:
         questions = []
@@ -368,7 +421,8 @@ class QuestionGenerator:
         response = self.qwen_client.call_api(messages)
         
         try:
-            result = json.loads(response)
+            with stage("json_parse"):
+                result = json.loads(response)
             ai_questions = result.get('questions', [])
             
             for i, q in enumerate(ai_questions[:question_count]):
@@ -420,6 +474,93 @@ class QuestionGenerator:
     def _generate_explanation(self, knowledge: ExtractedKnowledge, difficulty: Difficulty) -> str:
         return f"本题考查{knowledge.name}的理解和应用，{knowledge.description}"
 
+IMPORTANCE_WEIGHTS = {
+    Importance.CORE: 3.0,
+    Importance.IMPORTANT: 2.0,
+    Importance.NORMAL: 1.0
+}
+
+class StudyPlanOptimizer:
+    # 在总时间预算下给每个知识点分配复习时间：最大化 Σ w_i·log(1 + t_i/τ)，
+    # 目标凹且约束线性，最优解为注水（water-filling）形式 t_i = max(0, w_i/λ - τ)，排序后一次向量化求出 λ
+    def __init__(
+        self,
+        names: List[str],
+        importance: np.ndarray,
+        frequency: Optional[np.ndarray] = None,
+        correct: Optional[np.ndarray] = None,
+        attempts: Optional[np.ndarray] = None,
+        centrality: Optional[np.ndarray] = None,
+        frequency_weight: float = 1.0,
+        error_weight: float = 2.0,
+        centrality_weight: float = 0.5,
+        saturation_minutes: float = 5.0
+    ):
+        n = len(names)
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.importance = np.asarray(importance, dtype=np.float64)
+        self.frequency = np.zeros(n) if frequency is None else np.asarray(frequency, dtype=np.float64)
+        self.correct = np.zeros(n) if correct is None else np.asarray(correct, dtype=np.float64)
+        self.attempts = np.zeros(n) if attempts is None else np.asarray(attempts, dtype=np.float64)
+        self.centrality = np.zeros(n) if centrality is None else np.asarray(centrality, dtype=np.float64)
+        self.frequency_weight = frequency_weight
+        self.error_weight = error_weight
+        self.centrality_weight = centrality_weight
+        self.saturation_minutes = saturation_minutes
+
+    def weights(self) -> np.ndarray:
+        # 频次与中心性按最大值归一；错误率用 (错+1)/(做+2) 平滑，没做过的题按 50% 估计
+        max_frequency = self.frequency.max() if len(self.frequency) and self.frequency.max() > 0 else 1.0
+        max_centrality = self.centrality.max() if len(self.centrality) and self.centrality.max() > 0 else 1.0
+        error_rate = (self.attempts - self.correct + 1.0) / (self.attempts + 2.0)
+        return (
+            self.importance
+            * (1.0 + self.frequency_weight * self.frequency / max_frequency)
+            * (1.0 + self.centrality_weight * self.centrality / max_centrality)
+            * (1.0 + self.error_weight * error_rate)
+        )
+
+    def allocate(self, time_budget: float) -> np.ndarray:
+        w = self.weights()
+        if len(w) == 0 or time_budget <= 0:
+            return np.zeros(len(w))
+        tau = self.saturation_minutes
+        order = np.argsort(-w)
+        sorted_w = w[order]
+        k = np.arange(1, len(w) + 1)
+        lam = np.cumsum(sorted_w) / (time_budget + k * tau)
+        # 激活集合为满足 w_k/λ_k > τ 的最大前缀
+        active = int(np.flatnonzero(sorted_w > lam * tau)[-1]) + 1
+        minutes = np.maximum(0.0, w / lam[active - 1] - tau)
+        return minutes
+
+    def record_answers(self, names: List[str], correct: List[bool]):
+        # 新答题记录到达时只更新计数数组，下一次 allocate 即反映最新错误率；不在计划中的知识点忽略
+        known = [(self.index[name], ok) for name, ok in zip(names, correct) if name in self.index]
+        idx = np.fromiter((i for i, _ in known), dtype=np.int64, count=len(known))
+        np.add.at(self.attempts, idx, 1.0)
+        np.add.at(self.correct, idx, np.fromiter((ok for _, ok in known), dtype=np.float64, count=len(known)))
+
+    def add_points(self, names: List[str], importance: List[float], frequency: Optional[List[float]] = None,
+                   centrality: Optional[List[float]] = None, correct: Optional[List[float]] = None,
+                   attempts: Optional[List[float]] = None):
+        new = []
+        for i, name in enumerate(names):
+            if name not in self.index:
+                self.index[name] = len(self.names)
+                self.names.append(name)
+                new.append(i)
+
+        def extra(values: Optional[List[float]]) -> np.ndarray:
+            return np.zeros(len(new)) if values is None else np.asarray(values, dtype=np.float64)[new]
+
+        self.importance = np.concatenate([self.importance, extra(importance)])
+        self.frequency = np.concatenate([self.frequency, extra(frequency)])
+        self.centrality = np.concatenate([self.centrality, extra(centrality)])
+        self.correct = np.concatenate([self.correct, extra(correct)])
+        self.attempts = np.concatenate([self.attempts, extra(attempts)])
+
 class StrategyEngine:
     def __init__(self):
         self.difficulty_weights = {
@@ -427,39 +568,80 @@ class StrategyEngine:
             'medium': {'choice': 0.4, 'fill': 0.4, 'essay': 0.2},
             'hard': {'choice': 0.3, 'fill': 0.4, 'essay': 0.3}
         }
+        self.minutes_per_question = {'easy': 2.0, 'medium': 3.0, 'hard': 5.0}
     
     def calculate_strategy(
         self,
         knowledge_points: List[ExtractedKnowledge],
-        historical_data: Optional[Dict] = None
+        historical_data: Optional[Dict] = None,
+        time_budget: Optional[float] = None
     ) -> Dict:
+        # historical_data: {"frequency": {名称: 历年试卷出现次数}, "centrality": {名称: 共现图上的 PageRank},
+        #                   "answers": {名称: {"correct": n, "total": n}}}
+        optimizer = self.optimizer(knowledge_points, historical_data)
+        if time_budget is None:
+            time_budget = sum(self._calculate_time(kp.importance) for kp in knowledge_points)
+        return self.build_plan(optimizer, time_budget)
+
+    def optimizer(self, knowledge_points: List[ExtractedKnowledge], historical_data: Optional[Dict] = None) -> StudyPlanOptimizer:
+        historical_data = historical_data or {}
+        frequency = historical_data.get('frequency', {})
+        centrality = historical_data.get('centrality', {})
+        answers = historical_data.get('answers', {})
+
+        names = [kp.name for kp in knowledge_points]
+        return StudyPlanOptimizer(
+            names,
+            np.fromiter((IMPORTANCE_WEIGHTS[kp.importance] for kp in knowledge_points), dtype=np.float64, count=len(names)),
+            frequency=np.fromiter((frequency.get(name, 0) for name in names), dtype=np.float64, count=len(names)),
+            correct=np.fromiter((answers.get(name, {}).get('correct', 0) for name in names), dtype=np.float64, count=len(names)),
+            attempts=np.fromiter((answers.get(name, {}).get('total', 0) for name in names), dtype=np.float64, count=len(names)),
+            centrality=np.fromiter((centrality.get(name, 0) for name in names), dtype=np.float64, count=len(names))
+        )
+
+    def add_points(self, optimizer: StudyPlanOptimizer, knowledge_points: List[ExtractedKnowledge],
+                   historical_data: Optional[Dict] = None):
+        # 已有计划中新出现的知识点追加到优化器末尾，不重建其余知识点的数组
+        historical_data = historical_data or {}
+        frequency = historical_data.get('frequency', {})
+        centrality = historical_data.get('centrality', {})
+        answers = historical_data.get('answers', {})
+        names = [kp.name for kp in knowledge_points]
+        optimizer.add_points(
+            names,
+            [IMPORTANCE_WEIGHTS[kp.importance] for kp in knowledge_points],
+            [frequency.get(name, 0) for name in names],
+            [centrality.get(name, 0) for name in names],
+            [answers.get(name, {}).get('correct', 0) for name in names],
+            [answers.get(name, {}).get('total', 0) for name in names]
+        )
+
+    def build_plan(self, optimizer: StudyPlanOptimizer, time_budget: float) -> Dict:
+        minutes = optimizer.allocate(time_budget)
+        weights = optimizer.weights()
+
+        # 难度按综合权重（重要程度 × 历年频次 × 中心性 × 错误率）的三分位决定，而不再只看重要程度：
+        # 常考或常错的一般知识点也会安排难题；再按难度的单题用时折算题量
+        if len(weights):
+            low, high = np.quantile(weights, [1 / 3, 2 / 3])
+        else:
+            low = high = 0.0
+        difficulty = np.where(weights >= high, 'hard', np.where(weights >= low, 'medium', 'easy'))
+        per_question = np.vectorize(self.minutes_per_question.get, otypes=[np.float64])(difficulty) if len(weights) else np.zeros(0)
+        counts = np.floor(minutes / np.maximum(per_question, 1e-9)).astype(np.int64)
+        rounded_minutes = np.round(minutes).astype(np.int64)
+
         strategy = {}
-        
-        for kp in knowledge_points:
-            if kp.importance == Importance.CORE:
-                difficulty = 'hard'
-            elif kp.importance == Importance.IMPORTANT:
-                difficulty = 'medium'
-            else:
-                difficulty = 'easy'
-            
-            strategy[kp.name] = {
-                'difficulty': difficulty,
-                'question_count': self._calculate_count(kp.importance),
-                'type_distribution': self.difficulty_weights[difficulty],
-                'time_allocation': self._calculate_time(kp.importance)
+        for i in np.flatnonzero(rounded_minutes > 0):
+            strategy[optimizer.names[i]] = {
+                'difficulty': str(difficulty[i]),
+                'question_count': int(counts[i]),
+                'type_distribution': self.difficulty_weights[str(difficulty[i])],
+                'time_allocation': int(rounded_minutes[i]),
+                'priority': round(float(weights[i]), 4)
             }
-        
         return strategy
     
-    def _calculate_count(self, importance: Importance) -> int:
-        counts = {
-            Importance.CORE: 5,
-            Importance.IMPORTANT: 3,
-            Importance.NORMAL: 1
-        }
-        return counts[importance]
-    
     def _calculate_time(self, importance: Importance) -> int:
         times = {
             Importance.CORE: 15,
@@ -0,0 +1,130 @@
+from typing import Dict, List, Optional
+from datetime import datetime
+import hashlib
+
+from .metrics import registry
+
+# 派生结果预计算：试卷或复习文本分析完成后，以低优先级排队生成摘要、知识图谱、复习计划和默认练习题，
+# 用户打开对应页面时直接从存储读取。结果按文本内容哈希存放，同一内容的多个来源共用一份；
+# 来源删除时取消尚未执行的任务，没有其他来源引用的结果一并删除
+
+ARTIFACT_KINDS = ("summary", "knowledge_graph", "strategy", "practice")
+# 数值越大越靠后：分析、上传等前台任务（priority 0）总是先执行
+ARTIFACT_PRIORITY = 10
+ARTIFACT_JOB = "precompute_artifact"
+
+registry.describe("artifact_total", "派生结果预计算次数（computed 已生成，cached 内容已有结果，cancelled 来源已删除，failed 失败）")
+registry.describe("artifact_served_total", "直接从预计算结果返回的请求次数")
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+class ArtifactStore:
+    def __init__(self, artifacts, sources, refs, job_queue, priority: int = ARTIFACT_PRIORITY):
+        # artifacts: "<kind>:<文本哈希>" -> 结果；sources: 来源 id -> 文本与上下文；refs: 文本哈希 -> 引用它的来源
+        self.artifacts = artifacts
+        self.sources = sources
+        self.refs = refs
+        self.job_queue = job_queue
+        self.priority = priority
+
+    def schedule(self, source_id: str, text: str, context: Optional[Dict] = None) -> List[str]:
+        key = text_key(text)
+        self.sources[source_id] = {
+            "source_id": source_id,
+            "text_key": key,
+            "text": text,
+            "context": context or {},
+            "created_at": datetime.now().isoformat(),
+        }
+
+        def add_ref(entry: Dict) -> Dict:
+            if source_id not in entry["sources"]:
+                entry["sources"].append(source_id)
+            return entry
+
+        self.refs.modify(key, add_ref, {"sources": []})
+        queued = []
+        for kind in ARTIFACT_KINDS:
+            if self.get(kind, key) is not None:
+                registry.inc("artifact_total", kind=kind, result="cached")
+                continue
+            self.job_queue.enqueue(ARTIFACT_JOB, {"source_id": source_id, "kind": kind}, self.priority)
+            queued.append(kind)
+        return queued
+
+    def source(self, source_id: str) -> Optional[Dict]:
+        return self.sources.get(source_id)
+
+    def get(self, kind: str, key: str) -> Optional[Dict]:
+        entry = self.artifacts.get(f"{kind}:{key}")
+        return entry["data"] if entry is not None else None
+
+    def get_for_text(self, kind: str, text: str) -> Optional[Dict]:
+        data = self.get(kind, text_key(text))
+        if data is not None:
+            registry.inc("artifact_served_total", kind=kind)
+        return data
+
+    def put(self, source_id: str, kind: str, data: Dict) -> bool:
+        # 计算期间来源可能已被删除：此时丢弃结果
+        source = self.source(source_id)
+        if source is None:
+            registry.inc("artifact_total", kind=kind, result="cancelled")
+            return False
+        key = f"{kind}:{source['text_key']}"
+        self.artifacts[key] = {
+            "kind": kind,
+            "data": data,
+            "source_id": source_id,
+            "created_at": datetime.now().isoformat(),
+        }
+        if self.source(source_id) is None:
+            # 写入的同时来源被删除
+            self._discard(key)
+            registry.inc("artifact_total", kind=kind, result="cancelled")
+            return False
+        registry.inc("artifact_total", kind=kind, result="computed")
+        return True
+
+    def status(self, source_id: str) -> Optional[Dict]:
+        source = self.source(source_id)
+        if source is None:
+            return None
+        artifacts = {kind: self.get(kind, source["text_key"]) for kind in ARTIFACT_KINDS}
+        return {
+            "source_id": source_id,
+            "created_at": source["created_at"],
+            "ready": [kind for kind, data in artifacts.items() if data is not None],
+            "pending": [kind for kind, data in artifacts.items() if data is None],
+            "artifacts": {kind: data for kind, data in artifacts.items() if data is not None},
+        }
+
+    def cancel(self, source_id: str) -> int:
+        source = self.source(source_id)
+        cancelled = self.job_queue.cancel(ARTIFACT_JOB, "source_id", source_id)
+        if source is None:
+            return cancelled
+        try:
+            del self.sources[source_id]
+        except KeyError:
+            return cancelled
+
+        def drop_ref(entry: Dict) -> Dict:
+            entry["sources"] = [s for s in entry["sources"] if s != source_id]
+            return entry
+
+        key = source["text_key"]
+        remaining = self.refs.modify(key, drop_ref, {"sources": []})["sources"]
+        if not remaining:
+            for kind in ARTIFACT_KINDS:
+                self._discard(f"{kind}:{key}")
+        if cancelled:
+            registry.inc("artifact_total", cancelled, kind="all", result="cancelled")
+        return cancelled
+
+    def _discard(self, key: str):
+        try:
+            del self.artifacts[key]
+        except KeyError:
+            pass
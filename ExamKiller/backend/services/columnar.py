@@ -0,0 +1,322 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import json
+import struct
+import sys
+
+import numpy as np
+
+from .paper_analyzer import ContentBlock, Difficulty, Page, Question, QuestionType
+
+# 列式批量容器：整份扫描试卷的内容块、题目按列存放在 numpy 数组里（坐标、置信度、分值等为平行数组），
+# 重复的短字符串（块类型、答案、知识点名）进字符串池只存编号，变长文本拼接成一个 UTF-8 缓冲区。
+# 序列化为「JSON 头 + 原始列缓冲区」，反序列化时数值列直接 np.frombuffer，不逐元素编解码
+
+MAGIC = b"EKC1"
+_PREFIX = struct.Struct("<4sI")
+_ALIGN = 8
+
+QUESTION_TYPES = list(QuestionType)
+_QUESTION_TYPE_CODES = {qtype: code for code, qtype in enumerate(QUESTION_TYPES)}
+
+class StringPool:
+    def __init__(self, values: Optional[Iterable[str]] = None):
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+        for value in values or []:
+            self.intern(value)
+
+    def intern(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            value = sys.intern(value)
+            self.values.append(value)
+            self._codes[value] = code
+        return code
+
+    def __getitem__(self, code: int) -> str:
+        return self.values[code]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+class TextColumn:
+    # 第 i 个字符串为 data[offsets[i]:offsets[i + 1]]；nulls 仅在列中出现 None 时才分配
+    def __init__(self, data: bytes, offsets: np.ndarray, nulls: Optional[np.ndarray] = None):
+        self.data = data
+        self.offsets = offsets
+        self.nulls = nulls
+
+    @classmethod
+    def build(cls, values: Iterable[Optional[str]]) -> 'TextColumn':
+        encoded, nulls = [], []
+        for value in values:
+            nulls.append(value is None)
+            encoded.append(b"" if value is None else value.encode("utf-8"))
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            np.cumsum([len(item) for item in encoded], out=offsets[1:])
+        return cls(b"".join(encoded), offsets, np.array(nulls, dtype=np.bool_) if any(nulls) else None)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        if self.nulls is not None and self.nulls[i]:
+            return None
+        return self.data[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    def slice(self, start: int, stop: int) -> List[Optional[str]]:
+        return [self[i] for i in range(start, stop)]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data) + self.offsets.nbytes + (self.nulls.nbytes if self.nulls is not None else 0)
+
+    def columns(self, name: str) -> Dict:
+        columns = {f"{name}.data": self.data, f"{name}.offsets": self.offsets}
+        if self.nulls is not None:
+            columns[f"{name}.nulls"] = self.nulls
+        return columns
+
+    @classmethod
+    def from_columns(cls, columns: Dict, name: str) -> 'TextColumn':
+        return cls(columns[f"{name}.data"], columns[f"{name}.offsets"], columns.get(f"{name}.nulls"))
+
+def _ragged_offsets(lengths: List[int]) -> np.ndarray:
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    if lengths:
+        np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+def pack_columns(kind: str, meta: Dict, columns: Dict) -> bytes:
+    # 数值列按 8 字节对齐依次写入，头部记录每列的名称、dtype、偏移与字节数
+    layout, chunks, position = [], [], 0
+    for name, column in columns.items():
+        raw = column if isinstance(column, bytes) else np.ascontiguousarray(column).tobytes()
+        dtype = "bytes" if isinstance(column, bytes) else column.dtype.str
+        layout.append([name, dtype, position, len(raw)])
+        padding = -len(raw) % _ALIGN
+        chunks.append(raw + b"\0" * padding)
+        position += len(raw) + padding
+    header = json.dumps({"kind": kind, "meta": meta, "columns": layout}, ensure_ascii=False).encode("utf-8")
+    header += b" " * (-(len(header) + _PREFIX.size) % _ALIGN)
+    return _PREFIX.pack(MAGIC, len(header)) + header + b"".join(chunks)
+
+def unpack_columns(data: bytes, kind: str) -> Tuple[Dict, Dict]:
+    magic, header_size = _PREFIX.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("不是列式批量数据")
+    header = json.loads(data[_PREFIX.size:_PREFIX.size + header_size])
+    if header["kind"] != kind:
+        raise ValueError(f"数据类型不匹配: 期望 {kind}，实际 {header['kind']}")
+    base = _PREFIX.size + header_size
+    columns = {}
+    for name, dtype, offset, size in header["columns"]:
+        start = base + offset
+        if dtype == "bytes":
+            columns[name] = bytes(data[start:start + size])
+        else:
+            # 只读视图，与原始缓冲区共享内存
+            columns[name] = np.frombuffer(data, dtype=np.dtype(dtype), count=size // np.dtype(dtype).itemsize, offset=start)
+    return header["meta"], columns
+
+class BlockBatch:
+    # 坐标与置信度以 float32 保存，相对误差约 1e-7，远小于 1pt
+    def __init__(self, page_number: np.ndarray, x: np.ndarray, y: np.ndarray, width: np.ndarray, height: np.ndarray,
+                 confidence: np.ndarray, block_type: np.ndarray, content: TextColumn, pool: StringPool,
+                 pages: Optional[Dict] = None):
+        self.page_number = page_number
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.confidence = confidence
+        self.block_type = block_type
+        self.content = content
+        self.pool = pool
+        # 页级信息（页码、尺寸、栏数、页眉页脚），用于还原 Page
+        self.pages = pages or {"page_number": np.zeros(0, dtype=np.int32), "width": np.zeros(0, dtype=np.float32),
+                               "height": np.zeros(0, dtype=np.float32), "columns": np.zeros(0, dtype=np.int16),
+                               "header": TextColumn.build([]), "footer": TextColumn.build([])}
+
+    @classmethod
+    def from_pages(cls, pages: Sequence[Page]) -> 'BlockBatch':
+        # 按页码稳定排序后写入，页码列有序，block_range 才能二分定位
+        pages = sorted(pages, key=lambda page: page.page_number)
+        pool = StringPool()
+        blocks = [(page.page_number, block) for page in pages for block in page.blocks]
+        page_number = np.array([number for number, _ in blocks], dtype=np.int32)
+        x = np.array([block.position[0] for _, block in blocks], dtype=np.float32)
+        y = np.array([block.position[1] for _, block in blocks], dtype=np.float32)
+        width = np.array([block.size[0] for _, block in blocks], dtype=np.float32)
+        height = np.array([block.size[1] for _, block in blocks], dtype=np.float32)
+        confidence = np.array([block.confidence for _, block in blocks], dtype=np.float32)
+        block_type = np.array([pool.intern(block.block_type) for _, block in blocks], dtype=np.uint16)
+        content = TextColumn.build(block.content for _, block in blocks)
+        page_info = {
+            "page_number": np.array([page.page_number for page in pages], dtype=np.int32),
+            "width": np.array([page.width for page in pages], dtype=np.float32),
+            "height": np.array([page.height for page in pages], dtype=np.float32),
+            "columns": np.array([page.columns for page in pages], dtype=np.int16),
+            "header": TextColumn.build(page.header for page in pages),
+            "footer": TextColumn.build(page.footer for page in pages),
+        }
+        return cls(page_number, x, y, width, height, confidence, block_type, content, pool, page_info)
+
+    def __len__(self) -> int:
+        return len(self.page_number)
+
+    def __getitem__(self, i: int) -> ContentBlock:
+        return ContentBlock(
+            block_type=self.pool[int(self.block_type[i])],
+            content=self.content[i],
+            position=(float(self.x[i]), float(self.y[i])),
+            size=(float(self.width[i]), float(self.height[i])),
+            confidence=float(self.confidence[i])
+        )
+
+    def __iter__(self) -> Iterator[ContentBlock]:
+        return (self[i] for i in range(len(self)))
+
+    def block_range(self, page_number: int) -> Tuple[int, int]:
+        # from_pages 按页码排序写入，页码列有序，可二分定位某一页的块
+        start = int(np.searchsorted(self.page_number, page_number, side="left"))
+        stop = int(np.searchsorted(self.page_number, page_number, side="right"))
+        return start, stop
+
+    def text(self) -> str:
+        # 按页码、页内顺序拼接全部块的文本，与逐块 "\n".join 的结果一致
+        return "\n".join(self.content.slice(0, len(self)))
+
+    def blocks_on(self, page_number: int) -> List[ContentBlock]:
+        start, stop = self.block_range(page_number)
+        return [self[i] for i in range(start, stop)]
+
+    def to_pages(self) -> List[Page]:
+        info = self.pages
+        return [
+            Page(
+                page_number=int(number),
+                width=float(info["width"][i]),
+                height=float(info["height"][i]),
+                header=info["header"][i],
+                footer=info["footer"][i],
+                columns=int(info["columns"][i]),
+                blocks=self.blocks_on(int(number))
+            )
+            for i, number in enumerate(info["page_number"])
+        ]
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.page_number, self.x, self.y, self.width, self.height, self.confidence, self.block_type)
+        pages = sum(v.nbytes for v in self.pages.values())
+        return sum(a.nbytes for a in arrays) + self.content.nbytes + pages + sum(len(v) for v in self.pool.values)
+
+    def to_bytes(self) -> bytes:
+        columns = {
+            "page_number": self.page_number, "x": self.x, "y": self.y, "width": self.width, "height": self.height,
+            "confidence": self.confidence, "block_type": self.block_type,
+            "pages.page_number": self.pages["page_number"], "pages.width": self.pages["width"],
+            "pages.height": self.pages["height"], "pages.columns": self.pages["columns"],
+        }
+        columns.update(self.content.columns("content"))
+        columns.update(self.pages["header"].columns("pages.header"))
+        columns.update(self.pages["footer"].columns("pages.footer"))
+        return pack_columns("blocks", {"pool": self.pool.values}, columns)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'BlockBatch':
+        meta, columns = unpack_columns(data, "blocks")
+        page_info = {
+            "page_number": columns["pages.page_number"], "width": columns["pages.width"],
+            "height": columns["pages.height"], "columns": columns["pages.columns"],
+            "header": TextColumn.from_columns(columns, "pages.header"),
+            "footer": TextColumn.from_columns(columns, "pages.footer"),
+        }
+        return cls(columns["page_number"], columns["x"], columns["y"], columns["width"], columns["height"],
+                   columns["confidence"], columns["block_type"], TextColumn.from_columns(columns, "content"),
+                   StringPool(meta["pool"]), page_info)
+
+class QuestionBatch:
+    def __init__(self, columns: Dict, pool: StringPool):
+        # columns: id/content/explanation/options 为 TextColumn，其余为 numpy 数组；
+        # options、knowledge_points 为变长列表，用 *_offsets 划分扁平列
+        self.columns = columns
+        self.pool = pool
+
+    @classmethod
+    def from_questions(cls, questions: Sequence[Question]) -> 'QuestionBatch':
+        pool = StringPool()
+        options, knowledge_points = [], []
+        for q in questions:
+            options.extend(q.options)
+            knowledge_points.extend(pool.intern(name) for name in q.knowledge_points)
+        columns = {
+            "id": TextColumn.build(q.id for q in questions),
+            "content": TextColumn.build(q.content for q in questions),
+            "question_type": np.array([_QUESTION_TYPE_CODES[q.question_type] for q in questions], dtype=np.uint8),
+            "difficulty": np.array([q.difficulty.value for q in questions], dtype=np.uint8),
+            "score": np.array([q.score for q in questions], dtype=np.float64),
+            "answer": np.array([pool.intern(q.answer) for q in questions], dtype=np.uint32),
+            "explanation": TextColumn.build(q.explanation for q in questions),
+            "options": TextColumn.build(options),
+            "options_offsets": _ragged_offsets([len(q.options) for q in questions]),
+            "knowledge_points": np.array(knowledge_points, dtype=np.uint32),
+            "knowledge_points_offsets": _ragged_offsets([len(q.knowledge_points) for q in questions]),
+            "page_number": np.array([q.page_number for q in questions], dtype=np.int32),
+            "line_number": np.array([q.line_number for q in questions], dtype=np.int32),
+        }
+        return cls(columns, pool)
+
+    def __len__(self) -> int:
+        return len(self.columns["score"])
+
+    def __getitem__(self, i: int) -> Question:
+        c = self.columns
+        opt_start, opt_stop = c["options_offsets"][i], c["options_offsets"][i + 1]
+        kp_start, kp_stop = c["knowledge_points_offsets"][i], c["knowledge_points_offsets"][i + 1]
+        return Question(
+            id=c["id"][i],
+            content=c["content"][i],
+            question_type=QUESTION_TYPES[int(c["question_type"][i])],
+            difficulty=Difficulty(int(c["difficulty"][i])),
+            score=float(c["score"][i]),
+            options=c["options"].slice(int(opt_start), int(opt_stop)),
+            answer=self.pool[int(c["answer"][i])],
+            explanation=c["explanation"][i],
+            knowledge_points=[self.pool[int(code)] for code in c["knowledge_points"][kp_start:kp_stop]],
+            page_number=int(c["page_number"][i]),
+            line_number=int(c["line_number"][i])
+        )
+
+    def __iter__(self) -> Iterator[Question]:
+        return (self[i] for i in range(len(self)))
+
+    def to_questions(self) -> List[Question]:
+        return list(self)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(c.nbytes for c in self.columns.values()) + sum(len(v) for v in self.pool.values)
+
+    def to_bytes(self) -> bytes:
+        flat = {}
+        for name, column in self.columns.items():
+            if isinstance(column, TextColumn):
+                flat.update(column.columns(name))
+            else:
+                flat[name] = column
+        return pack_columns("questions", {"pool": self.pool.values}, flat)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'QuestionBatch':
+        meta, flat = unpack_columns(data, "questions")
+        columns = {}
+        for name in ("id", "content", "explanation", "options"):
+            columns[name] = TextColumn.from_columns(flat, name)
+        for name in ("question_type", "difficulty", "score", "answer", "options_offsets", "knowledge_points",
+                     "knowledge_points_offsets", "page_number", "line_number"):
+            columns[name] = flat[name]
+        return cls(columns, StringPool(meta["pool"]))
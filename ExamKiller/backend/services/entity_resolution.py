@@ -0,0 +1,254 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from collections import Counter
+import re
+import time
+import unicodedata
+
+from .incremental import IMPORTANCE_RANK
+from .metrics import registry
+
+# 知识点归一：每次提取出的知识点先归一化名称（全半角、大小写、空白标点、括号注释、“的”、“定义/概念”后缀），
+# 再按字符二元组分块，只和共享二元组的已有名称比较 Dice 相似度，超过阈值即归入已有知识点并记为别名。
+# 定期全量压缩用并查集把相似的知识点合并为一个规范知识点，被合并的 id 记录重定向
+
+GENERIC_SUFFIXES = ("定义", "概念")
+PARTICLES = re.compile(r"[的之]")
+ANNOTATIONS = re.compile(r"[（(【\[][^）)】\]]*[）)】\]]")
+NON_WORD = re.compile(r"[\W_]+")
+
+registry.describe("knowledge_resolution_total", "知识点归一次数（matched 归入已有知识点，new 新建，merged 压缩时被合并）")
+registry.describe("knowledge_points", "规范知识点数")
+
+def normalize(name: str) -> str:
+    text = unicodedata.normalize("NFKC", name).lower()
+    text = NON_WORD.sub("", ANNOTATIONS.sub("", text))
+    stripped = PARTICLES.sub("", text)
+    for suffix in GENERIC_SUFFIXES:
+        if stripped.endswith(suffix) and len(stripped) - len(suffix) >= 2:
+            stripped = stripped[:-len(suffix)]
+            break
+    # 去掉虚词和后缀后过短（如“定义”本身）时保留原样
+    return stripped if len(stripped) >= 2 else text
+
+def ngrams(norm: str, n: int = 2) -> Set[str]:
+    return {norm[i:i + n] for i in range(len(norm) - n + 1)} or {norm}
+
+class _UnionFind:
+    def __init__(self):
+        self.parent: Dict[str, str] = {}
+
+    def find(self, item: str) -> str:
+        root = self.parent.setdefault(item, item)
+        while root != self.parent[root]:
+            root = self.parent[root]
+        # 路径压缩
+        while item != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a: str, b: str):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+
+class _BlockIndex:
+    # 二元组 -> 含该二元组的归一化名称；超过 max_block 的块（如“函数”“矩阵”这类高频二元组）不参与候选生成
+    def __init__(self, max_block: int):
+        self.max_block = max_block
+        self.blocks: Dict[str, Set[str]] = {}
+        self.sizes: Dict[str, int] = {}
+
+    def add(self, norm: str):
+        if norm in self.sizes:
+            return
+        grams = ngrams(norm)
+        self.sizes[norm] = len(grams)
+        for gram in grams:
+            self.blocks.setdefault(gram, set()).add(norm)
+
+    def candidates(self, norm: str) -> Dict[str, float]:
+        # 返回 候选名称 -> Dice 相似度；共享二元组数在遍历块时顺带累计，不再逐对重算
+        grams = ngrams(norm)
+        shared: Counter = Counter()
+        for gram in grams:
+            block = self.blocks.get(gram)
+            if block is not None and len(block) <= self.max_block:
+                shared.update(block)
+        shared.pop(norm, None)
+        return {other: 2 * count / (len(grams) + self.sizes[other]) for other, count in shared.items()}
+
+def merge_record(target: Dict, other: Dict) -> Dict:
+    # 取较高的重要程度，描述缺失时补上，跨学科关联与别名取并集，出现次数累加
+    if IMPORTANCE_RANK.get(other.get("importance"), 2) < IMPORTANCE_RANK.get(target.get("importance"), 2):
+        target["importance"] = other["importance"]
+    if not target.get("description") and other.get("description"):
+        target["description"] = other["description"]
+    domains = target.setdefault("cross_domain", [])
+    domains.extend(d for d in other.get("cross_domain", []) if d not in domains)
+    aliases = target.setdefault("aliases", [])
+    for alias in [other["name"]] + other.get("aliases", []):
+        if alias != target["name"] and alias not in aliases:
+            aliases.append(alias)
+    target["mentions"] = target.get("mentions", 1) + other.get("mentions", 1)
+    return target
+
+class KnowledgeResolver:
+    def __init__(self, store, knowledge, redirects, threshold: float = 0.8, max_block: int = 500):
+        # knowledge：知识点 id -> 规范知识点（含 aliases、mentions）；redirects：被合并的 id -> 合并到的 id
+        self.store = store
+        self.knowledge = knowledge
+        self.redirects = redirects
+        self.threshold = threshold
+        self.max_block = max_block
+        self.index = _BlockIndex(max_block)
+        # 归一化名称 -> 规范知识点 id；规范知识点 id -> 显示名
+        self.names: Dict[str, str] = {}
+        self.display: Dict[str, str] = {}
+        self.synced_at = 0.0
+        # 名称映射每变化一次（新知识点、新别名、改名或压缩）加 1，依赖 canonical_name 的物化结果据此判断是否过期
+        self.version = 0
+
+    def _index(self, point_id: str, record: Dict):
+        changed = self.display.get(point_id) != record["name"]
+        self.display[point_id] = record["name"]
+        for name in [record["name"]] + record.get("aliases", []):
+            norm = normalize(name)
+            if self.names.get(norm) != point_id:
+                changed = True
+                self.names[norm] = point_id
+                self.index.add(norm)
+        if changed:
+            self.version += 1
+
+    def sync(self):
+        # 增量同步其他 worker 新写入或合并后的知识点
+        now = time.time()
+        for point_id, record in self.knowledge.items_since(self.synced_at):
+            self._index(point_id, record)
+        self.synced_at = now
+
+    def match(self, name: str) -> Optional[str]:
+        norm = normalize(name)
+        point_id = self.names.get(norm)
+        if point_id is not None:
+            return point_id
+        scored = [(score, other) for other, score in self.index.candidates(norm).items() if score >= self.threshold]
+        if not scored:
+            return None
+        return self.names[max(scored)[1]]
+
+    def add(self, point: Dict, new_id: str) -> Dict:
+        # 插入时即归一：与已有知识点相似则并入（名称记为别名），否则以 new_id 新建；返回带规范 id 与名称的知识点
+        self.sync()
+        point_id = self.match(point["name"])
+        incoming = {"id": new_id, "name": point["name"], "importance": point.get("importance", "normal"),
+                    "description": point.get("description", ""), "cross_domain": point.get("cross_domain", []),
+                    "aliases": [], "mentions": 1}
+        if point_id is None:
+            point_id = new_id
+            record = self.knowledge.modify(point_id, lambda value: merge_record(value, incoming) if value else incoming)
+            registry.inc("knowledge_resolution_total", result="new")
+        else:
+            # 期间该知识点可能已被其他 worker 的压缩合并删除：此时以传入内容重建
+            record = self.knowledge.modify(
+                point_id, lambda value: merge_record(value, incoming) if value else dict(incoming, id=point_id)
+            )
+            registry.inc("knowledge_resolution_total", result="matched")
+        self._index(point_id, record)
+        return dict(point, id=point_id, name=record["name"])
+
+    def canonical_name(self, name: str) -> str:
+        # 只读查询：已有相似知识点时返回其显示名，否则原样返回（不新建知识点）
+        point_id = self.match(name)
+        return self.display.get(point_id, name) if point_id is not None else name
+
+    def canonical(self, point_id: str) -> str:
+        seen = set()
+        while point_id not in seen:
+            seen.add(point_id)
+            target = self.redirects.get(point_id)
+            if target is None:
+                return point_id
+            point_id = target["id"]
+        return point_id
+
+    def remap(self, points: Iterable[Dict]) -> List[Dict]:
+        # 分块缓存里的知识点可能已在压缩时被合并：换成规范 id 与名称
+        remapped = []
+        for point in points:
+            point_id = self.canonical(point["id"])
+            if point_id != point["id"]:
+                record = self.knowledge.get(point_id)
+                if record is not None:
+                    point = dict(point, id=point_id, name=record["name"])
+            remapped.append(point)
+        return remapped
+
+    def compact(self) -> Dict:
+        # 全量压缩：按名称（含别名）分块找相似对，并查集合并成簇，每簇保留出现最多（其次名称最短、最早）的知识点
+        start = time.perf_counter()
+        records = dict(self.knowledge.items())
+        owners: Dict[str, List[str]] = {}
+        for point_id, record in records.items():
+            for name in [record["name"]] + record.get("aliases", []):
+                owners.setdefault(normalize(name), []).append(point_id)
+
+        index = _BlockIndex(self.max_block)
+        for norm in owners:
+            index.add(norm)
+        clusters = _UnionFind()
+        compared = 0
+        for norm, ids in owners.items():
+            for other in ids[1:]:
+                clusters.union(ids[0], other)
+            for candidate, score in index.candidates(norm).items():
+                if candidate < norm:
+                    continue
+                compared += 1
+                if score >= self.threshold:
+                    clusters.union(ids[0], owners[candidate][0])
+
+        groups: Dict[str, List[str]] = {}
+        for point_id in records:
+            groups.setdefault(clusters.find(point_id), []).append(point_id)
+        puts: List[Tuple[str, str, Dict]] = []
+        deletes: List[Tuple[str, str]] = []
+        for members in groups.values():
+            if len(members) == 1:
+                continue
+            members.sort(key=lambda i: (-records[i].get("mentions", 1), len(records[i]["name"]), i))
+            target = dict(records[members[0]])
+            for other in members[1:]:
+                merge_record(target, records[other])
+            # 显示名取簇内最短的名称（通常不带“的”和括号注释），其余都作为别名
+            names = [target["name"]] + target["aliases"]
+            target["name"] = min(names, key=len)
+            target["aliases"] = [name for name in names if name != target["name"]]
+            for other in members[1:]:
+                puts.append((self.redirects.namespace, other, {"id": members[0], "name": target["name"]}))
+                deletes.append((self.knowledge.namespace, other))
+            puts.append((self.knowledge.namespace, members[0], target))
+        if puts:
+            self.store.put_many(puts, deletes)
+            registry.inc("knowledge_resolution_total", len(deletes), result="merged")
+
+        before, after = len(records), len(records) - len(deletes)
+        registry.set_gauge("knowledge_points", after)
+        # 合并后的规范知识点携带全部别名，重建本进程索引
+        self.index = _BlockIndex(self.max_block)
+        self.names = {}
+        self.display = {}
+        self.synced_at = 0.0
+        self.version += 1
+        self.sync()
+        return {
+            "points_before": before,
+            "points_after": after,
+            "merged": len(deletes),
+            "clusters": sum(1 for members in groups.values() if len(members) > 1),
+            "reduction": round(1 - after / before, 4) if before else 0.0,
+            "names": len(owners),
+            "compared_pairs": compared,
+            "all_pairs": len(owners) * (len(owners) - 1) // 2,
+            "seconds": round(time.perf_counter() - start, 4),
+        }
@@ -0,0 +1,303 @@
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from collections import Counter
+from itertools import chain, combinations
+import re
+import time
+
+import numpy as np
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+from .metrics import registry
+
+# 知识点图分析：PageRank 与度中心性用稀疏矩阵迭代计算（安装 scipy 时用 CSR 矩阵乘，否则用 np.bincount 做同样的稀疏乘法）；
+# KnowledgeStats 按课程、年份物化知识点在历年试卷与题库中的出现次数，以及同一试卷内知识点共现构成的图，
+# 通过 items_since 增量刷新，查询时只对变化的课程重算中心性
+
+YEAR = re.compile(r"(?:19|20)\d{2}")
+
+registry.describe("knowledge_stats_refresh_seconds", "知识点频次与中心性增量刷新耗时")
+registry.describe("knowledge_stats_documents", "已物化的试卷与题目数")
+
+class SparseGraph:
+    # n 个节点的带权有向图，以 (起点, 终点, 权重) 三元组保存
+    def __init__(self, n: int, sources: Sequence[int], targets: Sequence[int], weights: Optional[Sequence[float]] = None):
+        self.n = n
+        self.sources = np.asarray(sources, dtype=np.int64)
+        self.targets = np.asarray(targets, dtype=np.int64)
+        self.weights = np.ones(len(self.sources)) if weights is None else np.asarray(weights, dtype=np.float64)
+        self.out_weight = np.bincount(self.sources, weights=self.weights, minlength=n)
+
+    @classmethod
+    def undirected(cls, n: int, pairs: Dict[Tuple[int, int], float]) -> "SparseGraph":
+        # 无向边拆成两条方向相反的有向边
+        if not pairs:
+            return cls(n, [], [])
+        edges = np.fromiter(chain.from_iterable(pairs), dtype=np.int64, count=2 * len(pairs)).reshape(-1, 2)
+        weights = np.fromiter(pairs.values(), dtype=np.float64, count=len(pairs))
+        return cls(n, np.concatenate([edges[:, 0], edges[:, 1]]), np.concatenate([edges[:, 1], edges[:, 0]]),
+                   np.concatenate([weights, weights]))
+
+    def transition(self) -> Callable[[np.ndarray], np.ndarray]:
+        # 按出边权重归一化的转移矩阵 P（P[j, i] 为从 i 走到 j 的概率），返回 x -> P @ x
+        share = self.weights / np.maximum(self.out_weight[self.sources], 1e-12)
+        if sparse is not None:
+            matrix = sparse.csr_matrix((share, (self.targets, self.sources)), shape=(self.n, self.n))
+            return matrix.dot
+        return lambda x: np.bincount(self.targets, weights=share * x[self.sources], minlength=self.n)
+
+def pagerank(graph: SparseGraph, damping: float = 0.85, tol: float = 1e-10, max_iter: int = 100) -> np.ndarray:
+    n = graph.n
+    if n == 0:
+        return np.zeros(0)
+    step = graph.transition()
+    dangling = graph.out_weight == 0
+    rank = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        # 没有出边的节点把概率均匀分给所有节点
+        updated = damping * step(rank) + (damping * rank[dangling].sum() + 1.0 - damping) / n
+        converged = np.abs(updated - rank).sum() < tol
+        rank = updated
+        if converged:
+            break
+    return rank / rank.sum()
+
+def degree_centrality(graph: SparseGraph, distinct: bool = False) -> np.ndarray:
+    # 不计权重的度（出度与入度的邻居取并集，重复边只算一次），除以 n - 1；
+    # distinct 表示图由 SparseGraph.undirected 从互不重复、无自环的无向边构造，出度即度
+    n = graph.n
+    if n <= 1:
+        return np.zeros(n)
+    if distinct:
+        return np.bincount(graph.sources, minlength=n) / (n - 1)
+    # 邻接对编码为 起点 * n + 终点 的一维键再去重，比按行去重快一个数量级
+    keys = np.unique(np.concatenate([graph.sources * n + graph.targets, graph.targets * n + graph.sources]))
+    sources, targets = np.divmod(keys, n)
+    return np.bincount(sources[sources != targets], minlength=n) / (n - 1)
+
+def centrality(names: List[str], edges: Iterable[Tuple[str, str]]) -> Dict[str, Dict[str, float]]:
+    # 按名称给出的有向图（如 KnowledgeGraph 的关联边）的 PageRank 与度中心性
+    index = {name: i for i, name in enumerate(names)}
+    sources, targets = [], []
+    for source, target in edges:
+        if source in index and target in index:
+            sources.append(index[source])
+            targets.append(index[target])
+    graph = SparseGraph(len(names), sources, targets)
+    ranks, degrees = pagerank(graph), degree_centrality(graph)
+    return {name: {"pagerank": float(ranks[i]), "degree": float(degrees[i])} for i, name in enumerate(names)}
+
+def year_of(*values: Optional[str]) -> str:
+    # 依次取第一个含四位年份的字段（考试日期优先，其次创建时间），都没有时为空串
+    for value in values:
+        match = YEAR.search(value or "")
+        if match:
+            return match.group(0)
+    return ""
+
+class _CourseGraph:
+    # 单门课程的共现图：知识点名称 -> 下标，(小下标, 大下标) -> 共同出现的试卷数；中心性在有变化后的首次查询时重算
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.pairs: Counter = Counter()
+        self.dirty = True
+        self.scores: Dict[str, Tuple[float, float]] = {}
+
+    def update(self, names: Sequence[str], sign: int):
+        ids = []
+        for name in names:
+            if name not in self.index:
+                self.index[name] = len(self.names)
+                self.names.append(name)
+            ids.append(self.index[name])
+        for a, b in combinations(sorted(set(ids)), 2):
+            self.pairs[(a, b)] += sign
+            if self.pairs[(a, b)] <= 0:
+                del self.pairs[(a, b)]
+        self.dirty = True
+
+    def centrality(self) -> Dict[str, Tuple[float, float]]:
+        if self.dirty:
+            graph = SparseGraph.undirected(len(self.names), self.pairs)
+            ranks, degrees = pagerank(graph), degree_centrality(graph, distinct=True)
+            self.scores = {name: (float(ranks[i]), float(degrees[i])) for i, name in enumerate(self.names)}
+            self.dirty = False
+        return self.scores
+
+class KnowledgeStats:
+    def __init__(self, papers, questions, canonical: Optional[Callable[[str], str]] = None,
+                 names_version: Optional[Callable[[], int]] = None):
+        # papers、questions 为 dict 风格的共享存储集合；canonical 把知识点名称映射为规范名称（合并同义知识点），
+        # names_version 返回名称映射的版本号，变化后（学到新知识点、压缩合并）按新映射重建计数与共现图
+        self.collections = {"papers": papers, "questions": questions}
+        self.canonical = canonical or (lambda name: name)
+        self.names_version = names_version or (lambda: 0)
+        # 原始名称 -> 规范名称；同一名称在所有文档中只解析一次，映射版本变化时清空
+        self._canonical_names: Dict[str, str] = {}
+        self._names_version = self.names_version()
+        # (类别, 文档 id) -> (课程, 年份, 原始知识点名称)，文档更新或删除时据此撤销旧的贡献；
+        # 保存原始名称而不是规范名称，名称映射变化后可以重新归并
+        self.contributions: Dict[str, Dict[str, Tuple[str, str, Tuple[str, ...]]]] = {"papers": {}, "questions": {}}
+        # (类别, 课程, 年份) -> 知识点出现次数
+        self.counts: Dict[Tuple[str, str, str], Counter] = {}
+        self.graphs: Dict[str, _CourseGraph] = {}
+        self.synced_at = {"papers": 0.0, "questions": 0.0}
+        self.version = 0
+        # 查询参数 -> (物化版本, 结果)：没有新的写入时直接返回
+        self._cache: Dict[Tuple, Tuple[int, List[Dict]]] = {}
+
+    def _contribution(self, kind: str, doc: Dict) -> Tuple[str, str, Tuple[str, ...]]:
+        if kind == "papers":
+            raw = (doc.get("analysis") or {}).get("knowledge_points", [])
+            year = year_of(doc.get("exam_date"), doc.get("created_at"))
+        else:
+            raw = [doc["knowledge_point"]] if doc.get("knowledge_point") else []
+            year = year_of(doc.get("created_at"))
+        return doc.get("course") or "", year, tuple(dict.fromkeys(raw))
+
+    def _canonical(self, raw: Sequence[str]) -> List[str]:
+        names = []
+        for name in raw:
+            canonical = self._canonical_names.get(name)
+            if canonical is None:
+                canonical = self._canonical_names[name] = self.canonical(name)
+            if canonical not in names:
+                names.append(canonical)
+        return names
+
+    def _add(self, kind: str, entry: Tuple[str, str, Tuple[str, ...]], sign: int):
+        course, year, raw = entry
+        names = self._canonical(raw)
+        counter = self.counts.setdefault((kind, course, year), Counter())
+        for name in names:
+            counter[name] += sign
+            if counter[name] <= 0:
+                del counter[name]
+        if kind == "papers" and len(names) > 1:
+            self.graphs.setdefault(course, _CourseGraph()).update(names, sign)
+
+    def _recanonicalize(self):
+        # 名称映射变化后，已物化的计数与共现图可能把同一知识点记成多个名称：按新映射从原始名称全量重建
+        self._canonical_names = {}
+        self.counts = {}
+        self.graphs = {}
+        for kind, known in self.contributions.items():
+            for entry in known.values():
+                self._add(kind, entry, 1)
+        self.version += 1
+
+    def _apply(self, kind: str, doc_id: str, contribution: Optional[Tuple[str, str, Tuple[str, ...]]]):
+        previous = self.contributions[kind].pop(doc_id, None)
+        if previous == contribution:
+            if contribution is not None:
+                self.contributions[kind][doc_id] = contribution
+            return
+        for entry, sign in ((previous, -1), (contribution, 1)):
+            if entry is not None:
+                self._add(kind, entry, sign)
+        if contribution is not None:
+            self.contributions[kind][doc_id] = contribution
+        self.version += 1
+
+    def refresh(self) -> bool:
+        # 增量刷新：只处理上次刷新后写入的试卷与题目；items_since 看不到删除，
+        # 存储中的条目数少于已物化的文档数时再按键对账，撤销已删除文档的贡献
+        start = time.perf_counter()
+        version = self.version
+        names_version = self.names_version()
+        if names_version != self._names_version:
+            self._names_version = names_version
+            self._recanonicalize()
+        for kind, collection in self.collections.items():
+            now = time.time()
+            for doc_id, doc in collection.items_since(self.synced_at[kind]):
+                self._apply(kind, doc_id, self._contribution(kind, doc))
+            self.synced_at[kind] = now
+            known = self.contributions[kind]
+            if len(collection) < len(known):
+                live = set(collection.keys())
+                for doc_id in [doc_id for doc_id in known if doc_id not in live]:
+                    self._apply(kind, doc_id, None)
+        changed = self.version != version
+        if changed:
+            registry.observe("knowledge_stats_refresh_seconds", time.perf_counter() - start)
+            for kind, known in self.contributions.items():
+                registry.set_gauge("knowledge_stats_documents", len(known), kind=kind)
+        return changed
+
+    def remove(self, kind: str, doc_id: str):
+        # 本进程删除文档时立即撤销其贡献（其他 worker 在下次刷新对账时撤销）
+        self._apply(kind, doc_id, None)
+
+    def frequency(self, course: Optional[str] = None, year: Optional[str] = None, kind: str = "papers") -> Counter:
+        total: Counter = Counter()
+        for (entry_kind, entry_course, entry_year), counter in self.counts.items():
+            if entry_kind == kind and (course is None or entry_course == course) and (year is None or entry_year == year):
+                total.update(counter)
+        return total
+
+    def centrality(self, course: Optional[str] = None) -> Dict[str, Tuple[float, float]]:
+        # 指定课程时为该课程共现图上的 (PageRank, 度中心性)；不指定时各课程按图中节点数加权合并
+        if course is not None:
+            graph = self.graphs.get(course)
+            return graph.centrality() if graph is not None else {}
+        total = sum(len(graph.names) for graph in self.graphs.values())
+        merged: Dict[str, Tuple[float, float]] = {}
+        for graph in self.graphs.values():
+            share = len(graph.names) / total
+            for name, (rank, degree) in graph.centrality().items():
+                previous = merged.get(name, (0.0, 0.0))
+                merged[name] = (previous[0] + rank * share, max(previous[1], degree))
+        return merged
+
+    def courses(self) -> List[str]:
+        return sorted({course for _, course, _ in self.counts if course})
+
+    def years(self, course: Optional[str] = None) -> List[str]:
+        return sorted({year for _, entry_course, year in self.counts
+                       if year and (course is None or entry_course == course)})
+
+    def hot_topics(self, course: Optional[str] = None, year: Optional[str] = None, limit: int = 20,
+                   sort: str = "frequency") -> List[Dict]:
+        key = (course, year, limit, sort)
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
+        rows = self._rank(course, year, sort)[:limit]
+        self._cache[key] = (self.version, rows)
+        return rows
+
+    def _rank(self, course: Optional[str], year: Optional[str], sort: str) -> List[Dict]:
+        papers = self.frequency(course, year, "papers")
+        # 题库中的题目不区分课程：只按年份统计
+        questions = self.frequency(None, year, "questions")
+        scores = self.centrality(course)
+        by_year: Dict[str, Dict[str, int]] = {}
+        for (kind, entry_course, entry_year), counter in self.counts.items():
+            if kind == "papers" and (course is None or entry_course == course) and entry_year:
+                for name, count in counter.items():
+                    years = by_year.setdefault(name, {})
+                    years[entry_year] = years.get(entry_year, 0) + count
+        rows = []
+        names = set(papers)
+        if course is None:
+            names |= set(questions)
+        for name in names:
+            rank, degree = scores.get(name, (0.0, 0.0))
+            rows.append({
+                "name": name,
+                "papers": papers.get(name, 0),
+                "questions": questions.get(name, 0),
+                "pagerank": round(rank, 6),
+                "degree": round(degree, 4),
+                "years": dict(sorted(by_year.get(name, {}).items())),
+            })
+        if sort == "pagerank":
+            rows.sort(key=lambda row: (-row["pagerank"], -row["papers"], row["name"]))
+        else:
+            rows.sort(key=lambda row: (-row["papers"], -row["questions"], -row["pagerank"], row["name"]))
+        return rows
@@ -0,0 +1,137 @@
+from typing import Dict, List, Tuple
+from collections import deque
+import hashlib
+import json
+
+import numpy as np
+
+from .ai_generator import KnowledgeGraph
+from .metrics import registry, stage
+
+# 知识图谱本地布局：模型只返回知识点和关联关系，坐标在服务端计算。
+# 先按层次（核心知识点在上，关联的下位知识点逐层向下）给出初始位置，再用 Fruchterman-Reingold 力导向迭代微调；
+# 计算是确定性的，结果按图的内容哈希缓存，同一张图只布局一次
+
+registry.describe("graph_layout_total", "知识图谱布局次数（hit 命中缓存，miss 重新计算）")
+
+class GraphLayout:
+    def __init__(self, cache, width: int = 800, height: int = 500, margin: int = 50, iterations: int = 80):
+        # cache 为 dict 风格存储（如 store.collection("graph_layouts")），键为图的内容哈希；宽高与前端 SVG viewBox 一致
+        self.cache = cache
+        self.width = width
+        self.height = height
+        self.margin = margin
+        self.iterations = iterations
+
+    def graph_key(self, names: List[str], importance: List[str], links: List[Tuple[int, int]]) -> str:
+        content = json.dumps([names, importance, links, self.width, self.height], ensure_ascii=False)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()[:32]
+
+    def layout(self, graph: KnowledgeGraph) -> Dict:
+        names = list(graph.nodes)
+        index = {name: i for i, name in enumerate(names)}
+        importance = [graph.nodes[name]["importance"] for name in names]
+        links = [(index[source], index[target]) for source, target in graph.links()]
+
+        key = self.graph_key(names, importance, links)
+        cached = self.cache.get(key)
+        if cached is not None:
+            registry.inc("graph_layout_total", result="hit")
+            positions = cached["positions"]
+        else:
+            registry.inc("graph_layout_total", result="miss")
+            with stage("graph_layout"):
+                positions = self.compute(importance, links).tolist()
+            self.cache[key] = {"positions": positions}
+
+        return {
+            "nodes": [
+                {"id": f"n{i + 1}", "name": name, "importance": importance[i], "x": positions[i][0], "y": positions[i][1]}
+                for i, name in enumerate(names)
+            ],
+            "links": [{"source": f"n{s + 1}", "target": f"n{t + 1}"} for s, t in links],
+        }
+
+    def compute(self, importance: List[str], links: List[Tuple[int, int]]) -> np.ndarray:
+        n = len(importance)
+        if n == 0:
+            return np.zeros((0, 2), dtype=np.int64)
+        pos = self._hierarchy(importance, links)
+        if n > 1 and links:
+            pos = self._force_directed(pos, links)
+        return self._fit(pos)
+
+    def _hierarchy(self, importance: List[str], links: List[Tuple[int, int]]) -> np.ndarray:
+        n = len(importance)
+        children = [[] for _ in range(n)]
+        neighbors = [[] for _ in range(n)]
+        has_parent = [False] * n
+        for s, t in links:
+            children[s].append(t)
+            neighbors[s].append(t)
+            neighbors[t].append(s)
+            has_parent[t] = True
+
+        # 根：核心知识点优先，其次没有上位知识点的节点；剩余未到达的节点（环或孤立分量）各自另起一棵
+        order = [i for i in range(n) if importance[i] == "core"]
+        order += [i for i in range(n) if importance[i] != "core" and not has_parent[i]]
+        order += list(range(n))
+        depth = [-1] * n
+        for root in order:
+            if depth[root] >= 0:
+                continue
+            depth[root] = 0
+            queue = deque([root])
+            while queue:
+                node = queue.popleft()
+                # 先沿上下位方向展开，再补上反向关联的节点
+                for nxt in children[node] + neighbors[node]:
+                    if depth[nxt] < 0:
+                        depth[nxt] = depth[node] + 1
+                        queue.append(nxt)
+
+        layers: Dict[int, List[int]] = {}
+        for i, d in enumerate(depth):
+            layers.setdefault(d, []).append(i)
+        pos = np.zeros((n, 2), dtype=np.float64)
+        levels = max(layers) + 1
+        for d, members in layers.items():
+            for rank, i in enumerate(members):
+                pos[i] = ((rank + 0.5) / len(members) * self.width, (d + 0.5) / levels * self.height)
+        return pos
+
+    def _force_directed(self, pos: np.ndarray, links: List[Tuple[int, int]]) -> np.ndarray:
+        n = len(pos)
+        pos = pos.copy()
+        k = np.sqrt(self.width * self.height / n)
+        edges = np.asarray(links, dtype=np.int64)
+        center = np.array([self.width / 2, self.height / 2])
+        temperature = self.width / 10
+        cooling = temperature / (self.iterations + 1)
+        for _ in range(self.iterations):
+            delta = pos[:, None, :] - pos[None, :, :]
+            distance = np.maximum(np.linalg.norm(delta, axis=2), 0.01)
+            # 斥力 k²/d 作用于所有节点对，引力 d²/k 只作用于有边相连的节点
+            displacement = (delta * (k * k / distance ** 2)[:, :, None]).sum(axis=1)
+            edge_delta = pos[edges[:, 0]] - pos[edges[:, 1]]
+            edge_distance = np.maximum(np.linalg.norm(edge_delta, axis=1), 0.01)
+            pull = edge_delta * (edge_distance / k)[:, None]
+            np.add.at(displacement, edges[:, 0], -pull)
+            np.add.at(displacement, edges[:, 1], pull)
+            # 向画布中心的弱引力，避免孤立节点被斥力推到远处、把其余节点挤成一团
+            displacement += (center - pos) * (0.1 * np.linalg.norm(center - pos, axis=1) / k)[:, None]
+
+            length = np.maximum(np.linalg.norm(displacement, axis=1), 0.01)
+            pos += displacement / length[:, None] * np.minimum(length, temperature)[:, None]
+            np.clip(pos, 0, [self.width, self.height], out=pos)
+            temperature -= cooling
+        return pos
+
+    def _fit(self, pos: np.ndarray) -> np.ndarray:
+        # 缩放到画布内（保留边距），单个节点或某一维没有跨度时居中
+        low, high = pos.min(axis=0), pos.max(axis=0)
+        span = np.where(high - low > 1e-9, high - low, 1.0)
+        size = np.array([self.width, self.height], dtype=np.float64) - 2 * self.margin
+        fitted = np.where(high - low > 1e-9, (pos - low) / span * size + self.margin,
+                          np.array([self.width, self.height]) / 2)
+        return np.rint(fitted).astype(np.int64)
@@ -0,0 +1,97 @@
+from typing import Awaitable, Callable, Deque, Optional, TypeVar
+from collections import deque
+import asyncio
+import threading
+
+from .metrics import registry
+
+# 对冲请求：主请求在最近首字节延迟的某个分位数内仍未返回首字节时，再发一份相同请求，
+# 先完成的胜出，另一份取消。额外请求受预算限制（默认不超过主请求数的 5%）
+
+T = TypeVar("T")
+
+registry.describe("model_hedge_total", "对冲请求次数（issued 已发出，won 对冲胜出，lost 主请求胜出，no_budget 预算不足未发出）")
+
+class HedgeSignal:
+    # 单次尝试的进度：started 表示已拿到并发许可真正发出，first_byte 表示收到响应头
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.first_byte = asyncio.Event()
+
+class HedgePolicy:
+    def __init__(self, percentile: float = 0.95, budget: float = 0.05, min_samples: int = 20,
+                 window: int = 512, min_delay: float = 0.05, burst: float = 2.0):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.burst = burst
+        self._ttfb: Deque[float] = deque(maxlen=window)
+        # 令牌桶：每个主请求存入 budget 个令牌，每次对冲消耗 1 个，上限 burst
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def observe_ttfb(self, seconds: float):
+        with self._lock:
+            self._ttfb.append(seconds)
+
+    def delay(self) -> Optional[float]:
+        with self._lock:
+            if len(self._ttfb) < self.min_samples:
+                return None
+            ordered = sorted(self._ttfb)
+        return max(self.min_delay, ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))])
+
+    def _deposit(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.budget)
+
+    def _withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+    async def run(self, attempt: Callable[[HedgeSignal], Awaitable[T]]) -> T:
+        # attempt(signal) 发出一次请求，需在开始发送时 set started、收到响应头时 set first_byte
+        self._deposit()
+        primary_signal = HedgeSignal()
+        primary = asyncio.ensure_future(attempt(primary_signal))
+        # 外层 wait_for 超时或客户端断开时 run 会被取消，asyncio.wait 不会替我们取消子任务，
+        # 退出时统一取消仍在进行的尝试，避免遗留的上游请求继续占用并发许可
+        tasks = [primary]
+        try:
+            delay = self.delay()
+            if delay is None:
+                return await primary
+
+            # 计时从真正发出开始，排队等待并发许可的时间不算作上游慢
+            started = asyncio.ensure_future(primary_signal.started.wait())
+            tasks.append(started)
+            await asyncio.wait({primary, started}, return_when=asyncio.FIRST_COMPLETED)
+            first_byte = asyncio.ensure_future(primary_signal.first_byte.wait())
+            tasks.append(first_byte)
+            done, _ = await asyncio.wait({primary, first_byte}, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+            if done:
+                return await primary
+            if not self._withdraw():
+                registry.inc("model_hedge_total", result="no_budget")
+                return await primary
+
+            registry.inc("model_hedge_total", result="issued")
+            hedge = asyncio.ensure_future(attempt(HedgeSignal()))
+            tasks.append(hedge)
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        registry.inc("model_hedge_total", result="won" if task is hedge else "lost")
+                        return task.result()
+            # 两份都失败时以主请求的错误为准
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
@@ -0,0 +1,70 @@
+from typing import Dict, List
+import hashlib
+import re
+
+# 内容定义分块：块边界只取决于段落自身内容，在文中插入或修改一段只会影响它所在的那一块，
+# 其余块的哈希保持不变，可直接复用已缓存的提取结果
+
+CHUNK_TARGET_CHARS = 1200
+CHUNK_MAX_CHARS = 3000
+BOUNDARY_MASK = 0x3
+
+IMPORTANCE_RANK = {"core": 0, "important": 1, "normal": 2}
+
+def _paragraphs(text: str) -> List[str]:
+    paragraphs = [p.strip() for p in re.split(r'\n\s*\n', text) if p.strip()]
+    result = []
+    for paragraph in paragraphs:
+        if len(paragraph) <= CHUNK_MAX_CHARS:
+            result.append(paragraph)
+            continue
+        # 超长段落按句切开，保证单块不超过上限
+        piece = ""
+        for sentence in re.split(r'(?<=[。！？；\n])', paragraph):
+            if piece and len(piece) + len(sentence) > CHUNK_MAX_CHARS:
+                result.append(piece)
+                piece = ""
+            piece += sentence
+        if piece:
+            result.append(piece)
+    return result
+
+def split_chunks(text: str) -> List[str]:
+    chunks = []
+    current: List[str] = []
+    size = 0
+    for paragraph in _paragraphs(text):
+        if current and size + len(paragraph) > CHUNK_MAX_CHARS:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(paragraph)
+        size += len(paragraph)
+        digest = hashlib.md5(paragraph.encode()).digest()
+        if size >= CHUNK_TARGET_CHARS or digest[0] & BOUNDARY_MASK == 0:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def chunk_key(chunk: str, mode: str) -> str:
+    normalized = re.sub(r'\s+', ' ', chunk).strip()
+    return hashlib.sha256(f"{mode}\n{normalized}".encode()).hexdigest()
+
+def merge_points(chunk_results: List[List[Dict]]) -> List[Dict]:
+    # 同名知识点合并：取最高重要程度，合并相关知识点与跨学科关联
+    merged: Dict[str, Dict] = {}
+    for points in chunk_results:
+        for point in points:
+            name = point["name"]
+            if name not in merged:
+                merged[name] = dict(point)
+                continue
+            existing = merged[name]
+            if IMPORTANCE_RANK.get(point["importance"], 2) < IMPORTANCE_RANK.get(existing["importance"], 2):
+                existing["importance"] = point["importance"]
+            for field in ("related_points", "cross_domain"):
+                if field in point:
+                    values = existing.setdefault(field, [])
+                    values.extend(v for v in point[field] if v not in values)
+    return list(merged.values())
@@ -0,0 +1,404 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import datetime
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import time
+
+from .ai_generator import KnowledgeExtractor
+from .columnar import BlockBatch, QuestionBatch
+from .paper_analyzer import ContentBlock, OCREngine, Page, PaperParser, Question, QuestionExtractor
+from .store import STORE_PATH, SQLiteStore, new_id
+from .template_index import TemplateIndex
+
+# 历年试卷批量离线导入：遍历目录，解析、OCR、抽题与知识点提取分成三个多进程阶段，
+# 阶段之间用有界队列衔接（下游跟不上时上游自动阻塞，内存占用有上界）；主进程按批在一个事务内写入试卷、
+# 文件索引和进度记录，中断后重新运行同一目录会跳过已完成的文件
+# python -m services.ingestion /data/past-papers --course 高等数学
+
+STAGES = ("parse", "ocr", "extract")
+IMAGE_FORMATS = ("jpg", "jpeg", "png")
+YEAR_PATTERN = re.compile(r"(?<!\d)((?:19|20)\d{2})(?!\d)")
+
+def analyze_text(text: str, layout_info: Dict, total_pages: int, template_index: TemplateIndex,
+                 knowledge_extractor: KnowledgeExtractor, subject: Optional[str] = None) -> Tuple[Dict, List[Question]]:
+    # 版面模板索引抽题（命中已知模板时跳过通用检测）-> 规则提取知识点；返回分析摘要与抽出的题目
+    questions, template = template_index.extract(text, layout_info, subject)
+    names = []
+    for point in knowledge_extractor.extract(text, subject=subject):
+        if point.name not in names:
+            names.append(point.name)
+    distribution = {"easy": 0, "medium": 0, "hard": 0}
+    for q in questions:
+        distribution[q.difficulty.name.lower()] += 1
+    return {
+        "question_count": len(questions),
+        "knowledge_points": names[:20],
+        "difficulty_distribution": distribution,
+        "total_pages": total_pages,
+        "template": template,
+    }, questions
+
+def question_rows(questions: Iterable[Question]) -> List[Dict]:
+    # 试卷记录中保存的题目字段
+    return [
+        {
+            "id": q.id,
+            "content": q.content,
+            "type": q.question_type.value,
+            "difficulty": q.difficulty.name.lower(),
+            "score": q.score,
+            "options": q.options,
+            "answer": q.answer
+        }
+        for q in questions
+    ]
+
+def paper_analysis(text: str, layout_info: Dict, total_pages: int, template_index: TemplateIndex,
+                   knowledge_extractor: KnowledgeExtractor, subject: Optional[str] = None) -> Dict:
+    # 上传分析使用：分析摘要附带原文与题目列表
+    analysis, questions = analyze_text(text, layout_info, total_pages, template_index, knowledge_extractor, subject)
+    return {**analysis, "text": text, "questions": question_rows(questions)}
+
+class ParseStage:
+    def __init__(self, store_path: str):
+        self.parser = PaperParser()
+
+    def __call__(self, item: Dict) -> Dict:
+        digest = hashlib.sha256()
+        with open(item["path"], "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        structure = self.parser.parse(item["path"])
+        item["sha256"] = digest.hexdigest()
+        # 解析出的内容块以列式批量容器在进程间传递：整块缓冲区序列化，不逐个 pickle ContentBlock
+        item["blocks"] = BlockBatch.from_pages(structure.pages).to_bytes()
+        item["layout_info"] = structure.layouts[0] if structure.layouts else {}
+        item["total_pages"] = len(structure.pages)
+        return item
+
+class OCRStage:
+    def __init__(self, store_path: str):
+        self.engine = OCREngine()
+
+    def __call__(self, item: Dict) -> Dict:
+        # 扫描件识别出的文字块追加到最后一页之后；其他格式原样传给下一阶段
+        if item["path"].rsplit(".", 1)[-1].lower() in IMAGE_FORMATS:
+            # bounding_box 为 (x0, y0, x1, y1)
+            blocks = [
+                ContentBlock(block_type=result.block_type, content=result.text,
+                             position=(result.bounding_box[0], result.bounding_box[1]),
+                             size=(result.bounding_box[2] - result.bounding_box[0], result.bounding_box[3] - result.bounding_box[1]),
+                             confidence=result.confidence)
+                for result in self.engine.recognize(item["path"]) if result.text.strip()
+            ]
+            if blocks:
+                pages = BlockBatch.from_bytes(item["blocks"]).to_pages()
+                if pages:
+                    pages[-1].blocks.extend(blocks)
+                else:
+                    pages = [Page(page_number=1, width=0.0, height=0.0, header=None, footer=None, columns=1, blocks=blocks)]
+                item["blocks"] = BlockBatch.from_pages(pages).to_bytes()
+        return item
+
+class ExtractStage:
+    def __init__(self, store_path: str):
+        # 每个进程单独连接共享存储：新学到的版面模板对其他进程和在线服务同样可见
+        self.template_index = TemplateIndex(SQLiteStore(store_path).collection("templates"), extractor=QuestionExtractor())
+        self.knowledge_extractor = KnowledgeExtractor()
+
+    def __call__(self, item: Dict) -> Dict:
+        text = BlockBatch.from_bytes(item.pop("blocks")).text()
+        item["analysis"], questions = analyze_text(text, item.pop("layout_info"), item.pop("total_pages"),
+                                                   self.template_index, self.knowledge_extractor, item["course"] or None)
+        # 题目同样以列式容器传给写入端
+        item["questions"] = QuestionBatch.from_questions(questions).to_bytes()
+        return item
+
+STAGE_HANDLERS = {"parse": ParseStage, "ocr": OCRStage, "extract": ExtractStage}
+
+def _stage_worker(stage: str, store_path: str, inbox, outbox, reports):
+    # 出错的文件带上 error 继续向下游传递，由写入端记入进度；收到 None 表示上游已全部结束
+    busy, count = 0.0, 0
+    try:
+        try:
+            handler, failure = STAGE_HANDLERS[stage](store_path), None
+        except Exception as e:
+            # 初始化失败（如缺少模型文件）时进程不退出：照常取件，把文件标记为失败传给下游，
+            # 收尾的 None 与利用率报告照常流转，导入不会卡住；修复后用 --retry-failed 重试
+            print(f"{stage} 阶段初始化失败: {e}")
+            handler, failure = None, f"{stage}: 初始化失败: {e}"
+        while True:
+            item = inbox.get()
+            if item is None:
+                break
+            start = time.perf_counter()
+            if failure is not None and "error" not in item:
+                item["error"] = failure
+            elif "error" not in item:
+                try:
+                    item = handler(item)
+                except Exception as e:
+                    item["error"] = f"{stage}: {e}"
+            busy += time.perf_counter() - start
+            count += 1
+            outbox.put(item)
+    except KeyboardInterrupt:
+        pass
+    reports.put((stage, busy, count))
+
+class BulkIngester:
+    def __init__(self, store: SQLiteStore, root: str, workers: Optional[Dict[str, int]] = None,
+                 queue_size: int = 32, batch_size: int = 64, run: Optional[str] = None,
+                 course: Optional[str] = None, subject: Optional[str] = None, retry_failed: bool = False,
+                 report_interval: float = 5.0):
+        cpus = os.cpu_count() or 2
+        self.store = store
+        self.root = os.path.abspath(root)
+        self.workers = {"parse": max(1, cpus // 2), "ocr": 1, "extract": max(1, cpus // 2)}
+        self.workers.update(workers or {})
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        # 进度按运行名分开保存，默认取目录的绝对路径，同一目录重复运行即续传
+        self.run = run or hashlib.sha256(self.root.encode("utf-8")).hexdigest()[:12]
+        self.course = course
+        self.subject = subject
+        self.retry_failed = retry_failed
+        self.report_interval = report_interval
+        self.papers = store.collection("papers")
+        self.files = store.collection("files")
+        self.progress = store.collection(f"ingest:{self.run}")
+
+    def scan(self, formats: List[str]) -> Tuple[List[Dict], int]:
+        # 返回 (待处理文件, 按进度记录跳过的文件数)；大小或修改时间变化过的文件重新导入
+        done = dict(self.progress.items())
+        pending, skipped = [], 0
+        for directory, dirnames, filenames in os.walk(self.root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.rsplit(".", 1)[-1].lower() not in formats:
+                    continue
+                path = os.path.join(directory, filename)
+                relpath = os.path.relpath(path, self.root)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entry = done.get(relpath)
+                if (entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+                        and not (self.retry_failed and entry["status"] == "failed")):
+                    skipped += 1
+                    continue
+                pending.append(self._item(path, relpath, stat))
+        return pending, skipped
+
+    def _item(self, path: str, relpath: str, stat) -> Dict:
+        # 未指定课程时取顶层子目录名（如 <课程>/<年份>/试卷.pdf），路径中的四位年份作为考试日期
+        parts = relpath.split(os.sep)
+        year = YEAR_PATTERN.search(relpath)
+        return {
+            "path": path,
+            "relpath": relpath,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "course": self.course if self.course is not None else (parts[0] if len(parts) > 1 else ""),
+            "exam_date": year.group(1) if year else None,
+        }
+
+    def ingest(self) -> Dict:
+        started = time.perf_counter()
+        pending, skipped = self.scan(PaperParser().supported_formats)
+        totals = {"scanned": len(pending) + skipped, "skipped": skipped, "ingested": 0, "duplicates": 0, "failed": 0}
+        print(f"待导入 {len(pending)} 个文件，已完成跳过 {skipped} 个（进度记录 ingest:{self.run}）")
+
+        context = multiprocessing.get_context("spawn")
+        queues = [context.Queue(self.queue_size) for _ in range(len(STAGES) + 1)]
+        reports = context.Queue()
+        processes = {
+            stage: [context.Process(target=_stage_worker, args=(stage, self.store.path, queues[i], queues[i + 1], reports))
+                    for _ in range(self.workers[stage])]
+            for i, stage in enumerate(STAGES)
+        }
+        for workers in processes.values():
+            for process in workers:
+                process.start()
+        # 投递与收尾放在单独线程：主线程只负责消费最后一个队列并写入，避免有界队列互相等待
+        feeder = threading.Thread(target=self._feed, args=(pending, queues, processes), daemon=True)
+        feeder.start()
+
+        batch: List[Dict] = []
+        seen: Dict[str, str] = {}
+        write_seconds, batches = 0.0, 0
+        last_report = time.perf_counter()
+        interrupted, aborted = False, None
+        try:
+            while True:
+                try:
+                    item = queues[-1].get(timeout=1.0)
+                except queue.Empty:
+                    item = False
+                    # 阶段进程异常退出（被杀死、崩溃）时它取走的文件和收尾信号都不会再到达，中止导入而不是一直等待
+                    dead = [f"{stage}（退出码 {process.exitcode}）" for stage, workers in processes.items()
+                            for process in workers if process.exitcode not in (None, 0)]
+                    if dead:
+                        aborted = "、".join(dead)
+                        print(f"阶段进程异常退出，中止导入: {aborted}")
+                if item is None or aborted:
+                    break
+                if item:
+                    batch.append(item)
+                now = time.perf_counter()
+                if batch and (len(batch) >= self.batch_size or not item):
+                    start = time.perf_counter()
+                    self._write(batch, seen, totals)
+                    write_seconds += time.perf_counter() - start
+                    batches += 1
+                    batch = []
+                if now - last_report >= self.report_interval:
+                    last_report = now
+                    finished = totals["ingested"] + totals["duplicates"] + totals["failed"]
+                    print(f"  {finished}/{len(pending)} 文件，{finished / (now - started):.1f} 文件/秒")
+        except KeyboardInterrupt:
+            interrupted = True
+        finally:
+            # 中断时已完成分析的文件也写入，下次从尚未完成的文件继续
+            if batch:
+                self._write(batch, seen, totals)
+                batches += 1
+            # 中断或中止时队列里可能还有未被取走的文件和收尾信号，不等待其写完即可退出
+            for q in queues:
+                q.cancel_join_thread()
+            for workers in processes.values():
+                for process in workers:
+                    if process.is_alive():
+                        process.terminate()
+                    process.join()
+
+        wall = time.perf_counter() - started
+        stages = {stage: {"workers": self.workers[stage], "busy_seconds": 0.0, "files": 0} for stage in STAGES}
+        while True:
+            try:
+                stage, busy, count = reports.get(timeout=0.1)
+            except queue.Empty:
+                break
+            stages[stage]["busy_seconds"] += busy
+            stages[stage]["files"] += count
+        for stage, info in stages.items():
+            # 利用率 = 该阶段所有进程的处理耗时 / (进程数 × 总耗时)；接近 1 的阶段是瓶颈，应增加进程数
+            info["utilization"] = round(info["busy_seconds"] / (info["workers"] * wall), 4) if wall else 0.0
+            info["busy_seconds"] = round(info["busy_seconds"], 3)
+        stages["write"] = {"workers": 1, "busy_seconds": round(write_seconds, 3), "batches": batches,
+                           "utilization": round(write_seconds / wall, 4) if wall else 0.0}
+        processed = totals["ingested"] + totals["duplicates"] + totals["failed"]
+        return {
+            "run": self.run,
+            "root": self.root,
+            "interrupted": interrupted,
+            "aborted": aborted,
+            **totals,
+            "wall_seconds": round(wall, 3),
+            "files_per_second": round(processed / wall, 3) if wall else 0.0,
+            "stages": stages,
+        }
+
+    def _feed(self, pending: List[Dict], queues: List, processes: Dict[str, List]):
+        for item in pending:
+            queues[0].put(item)
+        # 逐级收尾：上一阶段的进程全部退出后，再通知下一阶段结束
+        for i, stage in enumerate(STAGES):
+            for _ in processes[stage]:
+                queues[i].put(None)
+            for process in processes[stage]:
+                process.join()
+        queues[-1].put(None)
+
+    def _write(self, batch: List[Dict], seen: Dict[str, str], totals: Dict[str, int]):
+        # 试卷、文件索引与进度记录在同一个事务内写入：进度里标记完成的文件一定已经入库
+        entries = []
+        for item in batch:
+            progress = {"size": item["size"], "mtime_ns": item["mtime_ns"], "finished_at": datetime.now().isoformat()}
+            if "error" in item:
+                totals["failed"] += 1
+                entries.append((self.progress.namespace, item["relpath"], {**progress, "status": "failed",
+                                                                           "error": item["error"]}))
+                continue
+            # 与上传一致按内容去重：本次运行中已出现过，或已登记且对应试卷仍存在
+            sha256 = item["sha256"]
+            existing = seen.get(sha256)
+            if existing is None:
+                existing = (self.files.get(sha256) or {}).get("paper_id")
+                if existing is not None and existing not in self.papers:
+                    existing = None
+            if existing is not None:
+                totals["duplicates"] += 1
+                entries.append((self.progress.namespace, item["relpath"], {**progress, "status": "duplicate",
+                                                                           "paper_id": existing}))
+                continue
+            paper_id = new_id()
+            seen[sha256] = paper_id
+            analysis = item["analysis"]
+            questions = question_rows(QuestionBatch.from_bytes(item["questions"]))
+            # external：文件留在归档目录原处，删除试卷时不删除源文件
+            file_info = {"paper_id": paper_id, "sha256": sha256, "path": item["path"], "size": item["size"],
+                         "filename": os.path.basename(item["path"]), "external": True}
+            paper = {
+                "id": paper_id,
+                "title": os.path.basename(item["path"]),
+                "subject": self.subject or "",
+                "course": item["course"],
+                "chapter": None,
+                "difficulty": 3.0,
+                "exam_date": item["exam_date"],
+                "status": "analyzed",
+                "created_at": datetime.now().isoformat(),
+                "questions": questions,
+                "analysis": analysis,
+                "file": file_info,
+            }
+            totals["ingested"] += 1
+            entries.append((self.papers.namespace, paper_id, paper))
+            entries.append((self.files.namespace, sha256, file_info))
+            entries.append((self.progress.namespace, item["relpath"], {**progress, "status": "done",
+                                                                       "paper_id": paper_id}))
+        self.store.put_many(entries)
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="历年试卷批量离线导入（可中断续传）")
+    parser.add_argument("root", help="试卷归档目录")
+    parser.add_argument("--course", help="课程名；不指定时取顶层子目录名")
+    parser.add_argument("--subject", help="学科名")
+    parser.add_argument("--store", default=STORE_PATH, help="共享存储路径（与在线服务的 STORE_PATH 一致）")
+    parser.add_argument("--run", help="进度记录名，默认由目录路径生成")
+    parser.add_argument("--parse-workers", type=int)
+    parser.add_argument("--ocr-workers", type=int)
+    parser.add_argument("--extract-workers", type=int)
+    parser.add_argument("--queue-size", type=int, default=32, help="阶段之间队列的容量")
+    parser.add_argument("--batch-size", type=int, default=64, help="每个写事务包含的文件数")
+    parser.add_argument("--retry-failed", action="store_true", help="重新导入上次失败的文件")
+    parser.add_argument("--output", help="把导入报告写成 JSON")
+    args = parser.parse_args(argv)
+
+    workers = {stage: count for stage, count in (("parse", args.parse_workers), ("ocr", args.ocr_workers),
+                                                 ("extract", args.extract_workers)) if count}
+    ingester = BulkIngester(SQLiteStore(args.store), args.root, workers, args.queue_size, args.batch_size, args.run,
+                            args.course, args.subject, args.retry_failed)
+    report = ingester.ingest()
+    if report["interrupted"]:
+        print("已中断：完成的文件已写入，重新运行同一命令即可从中断处继续")
+    if report["aborted"]:
+        print(f"已中止（{report['aborted']}）：完成的文件已写入，排查后重新运行同一命令即可继续")
+    print(f"导入 {report['ingested']}，重复 {report['duplicates']}，失败 {report['failed']}，跳过 {report['skipped']}；"
+          f"{report['files_per_second']:.2f} 文件/秒")
+    for stage, info in report["stages"].items():
+        print(f"  {stage:8s} 进程 {info['workers']}  利用率 {info['utilization'] * 100:5.1f}%  耗时 {info['busy_seconds']:.2f}s")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from collections import deque
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+from .metrics import registry
+
+# 关键词多模式匹配：重要程度、学科领域和题目难度的关键词编译进同一个 Aho-Corasick 自动机，
+# 对一段文本只做一次线性扫描即可得到全部命中（含相互重叠的关键词）及其类别，耗时与词典大小无关。
+# 各学科可在 KEYWORD_DIR 下放置自定义词典 <学科>.json，文件变化后自动重新编译，无需重启
+
+KEYWORD_DIR = os.getenv("KEYWORD_DIR", "./data/keywords")
+
+# 类别 -> 关键词；类别名为 "<分类>:<取值>"，condition 表示条件句（如果/当）
+BUILTIN_KEYWORDS: Dict[str, List[str]] = {
+    "importance:core": ["定义", "概念", "原理", "定理", "公式", "重要", "核心", "关键", "必须掌握", "重点", "主要", "基本"],
+    "importance:important": ["性质", "应用", "方法", "技巧", "常见", "需要注意", "容易出错", "经常考"],
+    "importance:normal": ["了解", "知道", "熟悉", "参考"],
+    "condition": ["如果", "当"],
+    "domain:math": ["极限", "导数", "积分", "函数", "数列", "级数", "矩阵"],
+    "domain:physics": ["力", "能", "热", "光", "电磁", "量子"],
+    "domain:chemistry": ["元素", "反应", "化学键", "溶液", "有机"],
+    "domain:computer": ["算法", "数据结构", "网络", "数据库", "编程"],
+    "difficulty:hard": ["证明", "计算", "综合", "应用"],
+    "difficulty:easy": ["定义", "概念", "基本", "简单"],
+}
+
+SUBJECT_NAME = re.compile(r"^[\w\-]{1,64}$")
+
+registry.describe("keyword_reload_total", "关键词自动机编译次数（按学科统计，含词典热更新）")
+
+class KeywordAutomaton:
+    def __init__(self, keywords: Dict[str, Iterable[str]], native: Optional[bool] = None):
+        # 关键词统一转小写匹配；同一关键词可属于多个类别（如“应用”既是重要程度也是难度指示）。
+        # native 为 None 时，安装了 pyahocorasick 就用其 C 实现扫描，否则用纯 Python 实现，两者结果一致
+        self.category_order: List[str] = []
+        entries: Dict[str, List[Tuple[str, str]]] = {}
+        for category, words in keywords.items():
+            if category not in self.category_order:
+                self.category_order.append(category)
+            for word in words:
+                word = word.lower()
+                if word and (word, category) not in entries.setdefault(word, []):
+                    entries[word].append((word, category))
+        content = json.dumps({c: sorted(set(w)) for c, w in keywords.items()}, ensure_ascii=False, sort_keys=True)
+        self.version = hashlib.sha256(content.encode("utf-8")).hexdigest()[:12]
+
+        self._native = None
+        if entries and (native or (native is None and ahocorasick is not None)):
+            self._native = ahocorasick.Automaton()
+            for word, outputs in entries.items():
+                self._native.add_word(word, tuple(outputs))
+            self._native.make_automaton()
+            return
+
+        self._goto: List[Dict[str, int]] = [{}]
+        self._outputs: List[List[Tuple[str, str]]] = [[]]
+        for word, outputs in entries.items():
+            self._add(word, outputs)
+        self._fail = [0] * len(self._goto)
+        self._build_failure_links()
+        self.alphabet = frozenset(ch for transitions in self._goto for ch in transitions)
+        # 扫描时按需补全的转移表（含沿失配指针回退后的结果），只记录字母表内的字符，规模有上界
+        self._delta: List[Dict[str, int]] = [dict(transitions) for transitions in self._goto]
+
+    def _add(self, word: str, outputs: List[Tuple[str, str]]):
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._outputs.append([])
+            state = nxt
+        self._outputs[state] = list(outputs)
+
+    def _build_failure_links(self):
+        # 按深度广度优先：失配指针指向当前前缀的最长真后缀状态，输出集合并入后缀状态的输出
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0) if state else 0
+                self._fail[nxt] = target
+                self._outputs[nxt] = self._outputs[nxt] + self._outputs[target]
+
+    def _transition(self, state: int, ch: str) -> int:
+        origin = state
+        while state and ch not in self._goto[state]:
+            state = self._fail[state]
+        nxt = self._goto[state].get(ch, 0)
+        self._delta[origin][ch] = nxt
+        return nxt
+
+    def _lowered(self, text: str) -> str:
+        lowered = text.lower()
+        # 个别字符转小写后长度会变（如 'İ'），此时按原文匹配，保证偏移与原文一致
+        return lowered if len(lowered) == len(text) else text
+
+    def finditer(self, text: str) -> List[Tuple[int, str, str]]:
+        # 返回 (起始偏移, 关键词, 类别)，按结束位置排序
+        lowered = self._lowered(text)
+        if self._native is not None:
+            return [(end - len(word) + 1, word, category)
+                    for end, outputs in self._native.iter(lowered) for word, category in outputs]
+        delta, outputs, alphabet = self._delta, self._outputs, self.alphabet
+        matches = []
+        state = 0
+        for i, ch in enumerate(lowered):
+            if ch not in alphabet:
+                state = 0
+                continue
+            nxt = delta[state].get(ch)
+            state = self._transition(state, ch) if nxt is None else nxt
+            if outputs[state]:
+                for word, category in outputs[state]:
+                    matches.append((i - len(word) + 1, word, category))
+        return matches
+
+    def categories(self, text: str) -> Dict[str, Set[str]]:
+        # 类别 -> 命中的不同关键词
+        return self.split_categories(text, "")[0]
+
+    def split_categories(self, text: str, separators: str) -> List[Dict[str, Set[str]]]:
+        # 整段文本一次扫描，遇到分隔符即开始新的一段，返回每段的 类别 -> 命中的不同关键词；
+        # 段数与 re.split(分隔符) 的结果一一对应，关键词不会跨越分隔符
+        lowered = self._lowered(text)
+        if self._native is not None:
+            parts = re.split(f"[{re.escape(separators)}]", lowered) if separators else [lowered]
+            segments = []
+            for part in parts:
+                found: Dict[str, Set[str]] = {}
+                for _, outputs in self._native.iter(part) if part else ():
+                    for word, category in outputs:
+                        found.setdefault(category, set()).add(word)
+                segments.append(found)
+            return segments
+
+        delta, outputs, alphabet = self._delta, self._outputs, self.alphabet
+        separators = frozenset(separators)
+        segments = [{}]
+        found = segments[0]
+        state = 0
+        for ch in lowered:
+            if ch in separators:
+                state = 0
+                found = {}
+                segments.append(found)
+                continue
+            if ch not in alphabet:
+                state = 0
+                continue
+            nxt = delta[state].get(ch)
+            state = self._transition(state, ch) if nxt is None else nxt
+            if outputs[state]:
+                for word, category in outputs[state]:
+                    words = found.get(category)
+                    if words is None:
+                        found[category] = {word}
+                    else:
+                        words.add(word)
+        return segments
+
+class KeywordRegistry:
+    def __init__(self, builtin: Dict[str, List[str]], directory: Optional[str] = None, check_interval: float = 2.0):
+        self.builtin = builtin
+        self.directory = directory
+        # 距上次检查不足 check_interval 秒时不再 stat 词典文件
+        self.check_interval = check_interval
+        # 学科（None 为仅内置词典）-> (文件修改时间, 上次检查时间, 自动机)
+        self._automata: Dict[Optional[str], Tuple[Optional[int], float, KeywordAutomaton]] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, subject: str) -> str:
+        if not SUBJECT_NAME.match(subject):
+            raise ValueError(f"学科名不合法: {subject}")
+        return os.path.join(self.directory, f"{subject}.json")
+
+    def _mtime(self, subject: Optional[str]) -> Optional[int]:
+        if subject is None or not self.directory:
+            return None
+        try:
+            return os.stat(self._path(subject)).st_mtime_ns
+        except (OSError, ValueError):
+            return None
+
+    def automaton(self, subject: Optional[str] = None) -> KeywordAutomaton:
+        now = time.monotonic()
+        entry = self._automata.get(subject)
+        if entry is not None and now - entry[1] < self.check_interval:
+            return entry[2]
+        mtime = self._mtime(subject)
+        if subject is not None and mtime is None:
+            # 没有自定义词典的学科（课程名可以是任意字符串）共用内置词典的自动机，不按学科各存一份
+            if entry is not None:
+                with self._lock:
+                    self._automata.pop(subject, None)
+            return self.automaton(None)
+        if entry is not None and entry[0] == mtime:
+            self._automata[subject] = (mtime, now, entry[2])
+            return entry[2]
+        with self._lock:
+            keywords, loaded = self._merged(subject, mtime)
+            automaton = KeywordAutomaton(keywords)
+            # 加载失败时记下 None 作为修改时间，下次检查与文件的修改时间不一致，会重新加载
+            self._automata[subject] = (mtime if loaded else None, now, automaton)
+        registry.inc("keyword_reload_total", subject=subject or "builtin")
+        return automaton
+
+    def version(self, subject: Optional[str] = None) -> str:
+        return self.automaton(subject).version
+
+    def _merged(self, subject: Optional[str], mtime: Optional[int]) -> Tuple[Dict[str, List[str]], bool]:
+        # 返回 (合并后的词典, 自定义词典是否加载成功)
+        merged = {category: list(words) for category, words in self.builtin.items()}
+        if mtime is None:
+            return merged, True
+        try:
+            with open(self._path(subject), encoding="utf-8") as f:
+                custom = json.load(f)
+        except (OSError, ValueError) as e:
+            # 词典文件损坏或正在写入时沿用内置词典，下次检查再重试
+            print(f"关键词词典加载失败 {subject}: {e}")
+            return merged, False
+        for category, words in custom.items():
+            merged.setdefault(category, []).extend(str(word) for word in words)
+        return merged, True
+
+    def save(self, subject: str, keywords: Dict[str, List[str]]):
+        # 原子替换词典文件；各 worker 在下次检查时发现修改时间变化并重新编译
+        path = self._path(subject)
+        os.makedirs(self.directory, exist_ok=True)
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(keywords, f, ensure_ascii=False, indent=2)
+        os.replace(temp, path)
+        self._automata.pop(subject, None)
+
+    def load(self, subject: str) -> Optional[Dict[str, List[str]]]:
+        try:
+            with open(self._path(subject), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def subjects(self) -> List[str]:
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith(".json"))
+
+keyword_registry = KeywordRegistry(BUILTIN_KEYWORDS, KEYWORD_DIR)
@@ -0,0 +1,180 @@
+from typing import Dict, List, Optional, Tuple
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import inspect
+import threading
+import time
+
+# 秒级分桶，覆盖从正则扫描到长时间模型调用的范围
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+_current_trace: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("current_trace", default=None)
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(key: LabelKey, extra: Optional[Dict[str, str]] = None) -> str:
+    items = list(key)
+    if extra:
+        items.extend(extra.items())
+    if not items:
+        return ""
+    body = ",".join(f'{k}="{v}"' for k, v in items)
+    return "{" + body + "}"
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, window: int = 2048):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+        self.samples.append(value)
+
+    def quantile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[idx]
+
+class MetricsRegistry:
+    def __init__(self, prefix: str = "examkiller"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def observe(self, name: str, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def quantiles(self, name: str, **labels) -> Dict[str, float]:
+        key = _label_key(labels)
+        with self._lock:
+            hist = self._histograms.get(name, {}).get(key)
+            if hist is None:
+                return {}
+            return {f"p{int(q * 100)}": hist.quantile(q) for q in QUANTILES}
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                full = f"{self.prefix}_{name}"
+                lines.append(f"# HELP {full} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {full} histogram")
+                for key, hist in series.items():
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{full}_bucket{_format_labels(key, {'le': repr(bound)})} {cumulative}")
+                    lines.append(f"{full}_bucket{_format_labels(key, {'le': '+Inf'})} {hist.count}")
+                    lines.append(f"{full}_sum{_format_labels(key)} {hist.total:.6f}")
+                    lines.append(f"{full}_count{_format_labels(key)} {hist.count}")
+                lines.append(f"# HELP {full}_quantile {self._help.get(name, name)}（最近样本分位数）")
+                lines.append(f"# TYPE {full}_quantile gauge")
+                for key, hist in series.items():
+                    for q in QUANTILES:
+                        lines.append(f"{full}_quantile{_format_labels(key, {'quantile': str(q)})} {hist.quantile(q):.6f}")
+            for name, series in sorted(self._counters.items()):
+                full = f"{self.prefix}_{name}"
+                lines.append(f"# HELP {full} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {full} counter")
+                for key, value in series.items():
+                    lines.append(f"{full}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self._gauges.items()):
+                full = f"{self.prefix}_{name}"
+                lines.append(f"# HELP {full} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {full} gauge")
+                for key, value in series.items():
+                    lines.append(f"{full}{_format_labels(key)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+registry.describe("http_request_seconds", "HTTP请求总耗时（秒）")
+registry.describe("stage_duration_seconds", "各处理阶段耗时（秒）")
+registry.describe("model_queue_wait_seconds", "模型调用排队等待时间（秒，按优先级类别 interactive/background/bulk）")
+registry.describe("model_ttfb_seconds", "模型调用首字节时间（秒）")
+registry.describe("model_call_seconds", "模型调用总耗时（秒）")
+registry.describe("model_tokens_total", "模型调用消耗的token数")
+registry.describe("model_cache_total", "模型响应缓存命中/未命中次数")
+registry.describe("knowledge_chunks_total", "增量知识点提取的分块缓存命中/未命中次数")
+
+def record_stage(stage: str, seconds: float, **labels):
+    registry.observe("stage_duration_seconds", seconds, stage=stage, **labels)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.append((stage, seconds))
+
+@contextmanager
+def stage(name: str, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start, **labels)
+
+def timed(name: str):
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def start_trace() -> List[Tuple[str, float]]:
+    trace: List[Tuple[str, float]] = []
+    _current_trace.set(trace)
+    return trace
+
+def format_server_timing(trace: List[Tuple[str, float]], total: Optional[float] = None) -> str:
+    # 同名阶段合并，输出标准 Server-Timing 头，浏览器开发者工具可直接展示
+    merged: Dict[str, float] = {}
+    for name, seconds in trace:
+        merged[name] = merged.get(name, 0.0) + seconds
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in merged.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
@@ -0,0 +1,118 @@
+from typing import Deque, Dict, List, Optional
+from collections import deque
+import threading
+import time
+
+from .metrics import registry
+
+# 按接口选择模型：每个接口配置一条模型链（首选在前），首选模型近期过慢或连续出错时
+# 直接跳到链中下一个；调用方在总延迟预算内依次尝试
+
+registry.describe("model_fallback_total", "模型调用失败或超时后切换到下一个模型的次数")
+
+class ModelHealth:
+    def __init__(self, window: int = 256):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.last_error_at = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def p(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class ModelSelector:
+    def __init__(self, chains: Dict[str, List[str]], budgets: Dict[str, float], default_budget: float = 60.0,
+                 max_consecutive_errors: int = 3, cooldown: float = 30.0, min_samples: int = 10,
+                 primary_share: float = 1.0):
+        # chains 中必须包含 "default"，未单独配置的接口使用它；
+        # primary_share 与调用方一致：链中非末位的模型最多使用预算的这一比例
+        self.chains = chains
+        self.primary_share = primary_share
+        self.budgets = budgets
+        self.default_budget = default_budget
+        self.max_consecutive_errors = max_consecutive_errors
+        self.cooldown = cooldown
+        self.min_samples = min_samples
+        self.health: Dict[str, ModelHealth] = {}
+        self._lock = threading.Lock()
+
+    def budget(self, endpoint: str) -> float:
+        return self.budgets.get(endpoint, self.default_budget)
+
+    def _health(self, model: str) -> ModelHealth:
+        if model not in self.health:
+            self.health[model] = ModelHealth()
+        return self.health[model]
+
+    def chain(self, endpoint: str) -> List[str]:
+        models = self.chains.get(endpoint) or self.chains["default"]
+        budget = self.budget(endpoint)
+        now = time.time()
+        healthy, degraded = [], []
+        with self._lock:
+            for model in models:
+                health = self._health(model)
+                # 熔断：连续出错后冷却一段时间；或近期 p90 已接近（达到 90%）分给它的那部分预算。
+                # 超时的调用按实际耗时计入延迟样本，否则被超时截断的 p90 永远到不了这条线
+                broken = health.consecutive_errors >= self.max_consecutive_errors and now - health.last_error_at < self.cooldown
+                slow = len(health.latencies) >= self.min_samples and health.p(0.9) >= 0.9 * budget * self.primary_share
+                (degraded if broken or slow else healthy).append(model)
+        # 不健康的模型放到链尾而不是移除，全部不健康时仍有模型可用
+        return healthy + degraded
+
+    def record(self, model: str, seconds: float, ok: bool, prompt_tokens: int = 0, completion_tokens: int = 0,
+               timed_out: bool = False):
+        with self._lock:
+            health = self._health(model)
+            health.calls += 1
+            health.prompt_tokens += prompt_tokens
+            health.completion_tokens += completion_tokens
+            if ok:
+                health.latencies.append(seconds)
+                health.consecutive_errors = 0
+            else:
+                if timed_out:
+                    health.latencies.append(seconds)
+                health.errors += 1
+                health.consecutive_errors += 1
+                health.last_error_at = time.time()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            models = {
+                model: {
+                    "calls": health.calls,
+                    "errors": health.errors,
+                    "error_rate": round(health.errors / health.calls, 4) if health.calls else 0.0,
+                    "p50": round(health.p(0.5), 4),
+                    "p95": round(health.p(0.95), 4),
+                    "prompt_tokens": health.prompt_tokens,
+                    "completion_tokens": health.completion_tokens,
+                }
+                for model, health in self.health.items()
+            }
+        return {
+            "endpoints": {
+                endpoint: {"chain": self.chain(endpoint), "budget": self.budget(endpoint)}
+                for endpoint in self.chains
+            },
+            "models": models,
+        }
+
+def parse_chains(spec: Optional[str], defaults: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    # 形如 "knowledge_extract=qwen-turbo,qwen-plus;exports_generate=qwen-max,qwen-plus" 的覆盖配置
+    chains = {endpoint: list(models) for endpoint, models in defaults.items()}
+    for item in (spec or "").split(";"):
+        if "=" not in item:
+            continue
+        endpoint, models = item.split("=", 1)
+        models = [m.strip() for m in models.split(",") if m.strip()]
+        if models:
+            chains[endpoint.strip()] = models
+    return chains
@@ -1,9 +1,20 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import List, Dict, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
 import hashlib
 import re
 
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from .keywords import KeywordRegistry, keyword_registry
+from .metrics import timed
+
 class QuestionType(Enum):
     CHOICE = "choice"
     FILL = "fill"
@@ -16,19 +27,22 @@ class Difficulty(Enum):
     MEDIUM = 2
     HARD = 3
 
-@dataclass
+# 大批量扫描会产生数百万个 OCRResult/ContentBlock：数据类统一用 __slots__ 去掉每个实例的 __dict__，
+# 需要整批存储或传输时转成 services.columnar 中的列式容器
+@dataclass(slots=True)
 class OCRResult:
     text: str
     confidence: float
     bounding_box: Tuple[float, float, float, float]
     block_type: str
 
-@dataclass
+@dataclass(slots=True)
 class PaperStructure:
     pages: List['Page']
     metadata: 'PaperMetadata'
+    layouts: List[Dict] = field(default_factory=list)
 
-@dataclass
+@dataclass(slots=True)
 class Page:
     page_number: int
     width: float
@@ -38,7 +52,7 @@ class Page:
     columns: int
     blocks: List['ContentBlock']
 
-@dataclass
+@dataclass(slots=True)
 class ContentBlock:
     block_type: str
     content: str
@@ -46,7 +60,7 @@ class ContentBlock:
     size: Tuple[float, float]
     confidence: float
 
-@dataclass
+@dataclass(slots=True)
 class PaperMetadata:
     title: str
     subject: str
@@ -57,7 +71,7 @@ class PaperMetadata:
     total_pages: int
     question_count: int
 
-@dataclass
+@dataclass(slots=True)
 class Question:
     id: str
     content: str
@@ -71,7 +85,7 @@ class Question:
     page_number: int
     line_number: int
 
-@dataclass
+@dataclass(slots=True)
 class KnowledgePoint:
     id: str
     name: str
@@ -85,8 +99,10 @@ class KnowledgePoint:
 
 class PaperParser:
     def __init__(self):
-        self.supported_formats = ['pdf', 'docx', 'jpg', 'jpeg', 'png']
+        self.supported_formats = ['pdf', 'docx', 'jpg', 'jpeg', 'png', 'txt']
+        self.layout_analyzer = LayoutAnalyzer()
     
+    @timed("paper_parse")
     def parse(self, file_path: str) -> PaperStructure:
         ext = file_path.split('.')[-1].lower()
         if ext not in self.supported_formats:
@@ -96,6 +112,8 @@ class PaperParser:
             return self._parse_pdf(file_path)
         elif ext == 'docx':
             return self._parse_docx(file_path)
+        elif ext == 'txt':
+            return self._parse_text(file_path)
         else:
             return self._parse_image(file_path)
     
@@ -127,8 +145,53 @@ class PaperParser:
         )
         return PaperStructure(pages=pages, metadata=metadata)
     
+    def _parse_text(self, file_path: str) -> PaperStructure:
+        # 纯文本试卷：每个非空行一个文本块，按单页 A4 排布
+        with open(file_path, encoding='utf-8', errors='replace') as f:
+            lines = [line.rstrip('\n') for line in f]
+        blocks = [
+            ContentBlock(block_type="text", content=line, position=(72.0, 72.0 + 14.0 * i), size=(450.0, 12.0), confidence=1.0)
+            for i, line in enumerate(lines) if line.strip()
+        ]
+        pages = [Page(page_number=1, width=595.0, height=842.0, header=None, footer=None, columns=1, blocks=blocks)]
+        metadata = PaperMetadata(
+            title=lines[0].strip() if lines else "解析的试卷",
+            subject="",
+            course="",
+            chapter=None,
+            exam_date=None,
+            difficulty=3.0,
+            total_pages=1,
+            question_count=0
+        )
+        return PaperStructure(pages=pages, metadata=metadata)
+
+    def build_pages(self, page_images: List, blocks_per_page: Optional[List[List['ContentBlock']]] = None,
+                    layouts: Optional[List[Dict]] = None) -> List['Page']:
+        if layouts is None:
+            layouts = self.layout_analyzer.analyze_document(page_images)
+        pages = []
+        for i, layout in enumerate(layouts):
+            width, height = layout["page_size"]
+            page = Page(
+                page_number=i + 1,
+                width=width,
+                height=height,
+                header=None,
+                footer=None,
+                columns=1,
+                blocks=blocks_per_page[i] if blocks_per_page else []
+            )
+            pages.append(self.layout_analyzer.apply_to_page(page, layout))
+        return pages
+
     def _parse_image(self, file_path: str) -> PaperStructure:
         pages = []
+        layouts = []
+        if Image is not None:
+            with Image.open(file_path) as image:
+                layouts = self.layout_analyzer.analyze_document([np.asarray(image.convert("L"))])
+            pages = self.build_pages([], layouts=layouts)
         metadata = PaperMetadata(
             title="解析的试卷",
             subject="",
@@ -139,12 +202,13 @@ class PaperParser:
             total_pages=1,
             question_count=0
         )
-        return PaperStructure(pages=pages, metadata=metadata)
+        return PaperStructure(pages=pages, metadata=metadata, layouts=layouts)
 
 class OCREngine:
     def __init__(self):
         self.engines = {}
     
+    @timed("ocr")
     def recognize(self, image_path: str) -> List[OCRResult]:
         results = []
         return results
@@ -153,49 +217,210 @@ class OCREngine:
         tables = []
         return tables
 
+# 版面分析的纯函数放在模块级，便于进程池序列化调用
+INK_THRESHOLD = 128
+BAND_GRID = (16, 128)
+
+def _to_gray(page_image) -> np.ndarray:
+    image = np.asarray(page_image)
+    if image.ndim == 3:
+        image = image[..., :3].mean(axis=2)
+    return image
+
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    padded = np.concatenate(([False], mask, [False])).astype(np.int8)
+    diff = np.diff(padded)
+    return np.flatnonzero(diff == 1), np.flatnonzero(diff == -1)
+
+def _band_signature(ink: np.ndarray, top: int, bottom: int) -> np.ndarray:
+    # 把页眉/页脚带缩放成固定网格，便于跨页一次性比较
+    rows, cols = BAND_GRID
+    band = ink[top:bottom]
+    if band.shape[0] < rows or band.shape[1] < cols:
+        return np.zeros(rows * cols, dtype=np.float32)
+    h = band.shape[0] // rows * rows
+    w = band.shape[1] // cols * cols
+    grid = band[:h, :w].reshape(rows, h // rows, cols, w // cols).mean(axis=(1, 3))
+    return grid.astype(np.float32).ravel()
+
+def _analyze_page_image(page_image, dpi: float, band_ratio: float) -> Dict:
+    gray = _to_gray(page_image)
+    height, width = gray.shape
+    ink = gray < INK_THRESHOLD
+    scale = 72.0 / dpi
+
+    row_profile = ink.sum(axis=1)
+    text_rows = row_profile > max(1, width * 0.002)
+    line_starts, line_ends = _runs(text_rows)
+
+    band_rows = int(height * band_ratio)
+    signatures = (_band_signature(ink, 0, band_rows), _band_signature(ink, height - band_rows, height))
+
+    if len(line_starts) == 0:
+        return {
+            "header": None, "footer": None, "columns": 1, "page_number": None,
+            "margin_top": 0.0, "margin_bottom": 0.0, "margin_left": 0.0, "margin_right": 0.0,
+            "line_spacing": 0.0, "font_size": 0.0, "header_band": None, "footer_band": None,
+            "content_box": None, "column_bounds": [], "page_size": (round(width * scale, 2), round(height * scale, 2)),
+            "_signatures": signatures,
+        }
+
+    heights = line_ends - line_starts
+    gaps = line_starts[1:] - line_ends[:-1]
+    typical_gap = float(np.median(gaps)) if len(gaps) else 0.0
+
+    # 页眉/页脚候选：位于页边带内、且与正文之间留有明显空白的首行/末行
+    header_band = None
+    if len(line_starts) > 1 and line_ends[0] <= band_rows and gaps[0] > max(1.5 * typical_gap, 2):
+        header_band = (int(line_starts[0]), int(line_ends[0]))
+    footer_band = None
+    if len(line_starts) > 1 and line_starts[-1] >= height - band_rows and gaps[-1] > max(1.5 * typical_gap, 2):
+        footer_band = (int(line_starts[-1]), int(line_ends[-1]))
+
+    body_top = header_band[1] if header_band else int(line_starts[0])
+    body_bottom = footer_band[0] if footer_band else int(line_ends[-1])
+    body = ink[body_top:body_bottom]
+    col_profile = body.sum(axis=0)
+    ink_cols = np.flatnonzero(col_profile)
+    left, right = (int(ink_cols[0]), int(ink_cols[-1]) + 1) if len(ink_cols) else (0, width)
+
+    # 正文区域内贯穿整页高度的空白竖条即为分栏间隔
+    blank = col_profile[left:right] == 0
+    gap_starts, gap_ends = _runs(blank)
+    min_gutter = max(3, int(width * 0.02))
+    gutters = [(left + s, left + e) for s, e in zip(gap_starts, gap_ends) if e - s >= min_gutter]
+    bounds = []
+    cursor = left
+    for g_start, g_end in gutters:
+        bounds.append((round(float(cursor * scale), 2), round(float(g_start * scale), 2)))
+        cursor = g_end
+    bounds.append((round(float(cursor * scale), 2), round(float(right * scale), 2)))
+
+    body_lines = (line_starts >= body_top) & (line_ends <= body_bottom)
+    body_heights = heights[body_lines] if body_lines.any() else heights
+    body_starts = line_starts[body_lines] if body_lines.any() else line_starts
+    pitch = float(np.median(np.diff(body_starts))) if len(body_starts) > 1 else float(body_heights[0])
+
+    return {
+        "header": None,
+        "footer": None,
+        "columns": len(bounds),
+        "page_number": None,
+        "margin_top": round(float(line_starts[0]) * scale, 2),
+        "margin_bottom": round(float(height - line_ends[-1]) * scale, 2),
+        "margin_left": round(left * scale, 2),
+        "margin_right": round((width - right) * scale, 2),
+        "line_spacing": round(pitch * scale, 2),
+        "font_size": round(float(np.median(body_heights)) * scale, 2),
+        "header_band": tuple(round(v * scale, 2) for v in header_band) if header_band else None,
+        "footer_band": tuple(round(v * scale, 2) for v in footer_band) if footer_band else None,
+        "content_box": tuple(round(v * scale, 2) for v in (left, body_top, right, body_bottom)),
+        "column_bounds": bounds,
+        "page_size": (round(width * scale, 2), round(height * scale, 2)),
+        "_signatures": signatures,
+    }
+
+def _analyze_batch(args) -> List[Dict]:
+    images, dpi, band_ratio = args
+    return [_analyze_page_image(image, dpi, band_ratio) for image in images]
+
+def _repeated(signatures: np.ndarray, threshold: float, min_share: float) -> np.ndarray:
+    # 所有页的带签名做一次余弦相似度矩阵，与足够多其他页几乎相同的带判定为重复页眉/页脚
+    norms = np.linalg.norm(signatures, axis=1)
+    has_ink = norms > 0
+    unit = signatures / np.where(has_ink, norms, 1.0)[:, None]
+    similar = (unit @ unit.T) >= threshold
+    matches = similar.sum(axis=1) - 1
+    needed = max(1, int(np.ceil(min_share * (len(signatures) - 1))))
+    return has_ink & (matches >= needed)
+
 class LayoutAnalyzer:
-    def __init__(self):
+    def __init__(self, dpi: float = 150.0, band_ratio: float = 0.1, workers: Optional[int] = None):
         self.header_patterns = []
         self.footer_patterns = []
         self.page_number_patterns = []
-    
+        self.dpi = dpi
+        self.band_ratio = band_ratio
+        self.workers = workers
+        self.batch_size = 8
+        self.repeat_threshold = 0.95
+        self.repeat_share = 0.5
+
     def analyze(self, page_image) -> Dict:
-        header = self._detect_header(page_image)
-        footer = self._detect_footer(page_image)
-        columns = self._detect_columns(page_image)
-        page_number = self._detect_page_number(page_image)
-        
-        return {
-            "header": header,
-            "footer": footer,
-            "columns": columns,
-            "page_number": page_number,
-            "margin_top": 72.0,
-            "margin_bottom": 72.0,
-            "margin_left": 72.0,
-            "margin_right": 72.0,
-            "line_spacing": 12.0,
-            "font_size": 12.0
-        }
-    
-    def _detect_header(self, page_image) -> Optional[str]:
-        return None
-    
-    def _detect_footer(self, page_image) -> Optional[str]:
-        return None
-    
-    def _detect_columns(self, page_image) -> int:
-        return 1
-    
-    def _detect_page_number(self, page_image) -> Optional[str]:
-        return None
-    
+        layout = _analyze_page_image(page_image, self.dpi, self.band_ratio)
+        layout.pop("_signatures")
+        return layout
+
+    @timed("layout_analyze")
+    def analyze_document(self, page_images: List) -> List[Dict]:
+        batches = [page_images[i:i + self.batch_size] for i in range(0, len(page_images), self.batch_size)]
+        args = [(batch, self.dpi, self.band_ratio) for batch in batches]
+        if len(batches) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                layouts = [layout for batch in pool.map(_analyze_batch, args) for layout in batch]
+        else:
+            layouts = [layout for arg in args for layout in _analyze_batch(arg)]
+
+        if len(layouts) > 1:
+            headers = _repeated(np.stack([l["_signatures"][0] for l in layouts]), self.repeat_threshold, self.repeat_share)
+            footers = _repeated(np.stack([l["_signatures"][1] for l in layouts]), self.repeat_threshold, self.repeat_share)
+        else:
+            headers = footers = np.zeros(len(layouts), dtype=bool)
+
+        for i, layout in enumerate(layouts):
+            layout.pop("_signatures")
+            layout["repeated_header"] = bool(headers[i]) and layout["header_band"] is not None
+            layout["repeated_footer"] = bool(footers[i]) and layout["footer_band"] is not None
+            # 页脚逐页变化（如页码）时不视为重复页脚，但仍记录其位置
+            if layout["footer_band"] is not None and not layout["repeated_footer"]:
+                layout["page_number_band"] = layout["footer_band"]
+        return layouts
+
+    def apply_to_page(self, page: 'Page', layout: Dict) -> 'Page':
+        # 版面结果写回 Page：页眉/页脚文字取落在对应带内的内容块
+        page.columns = layout["columns"]
+        page.header = self._band_text(page.blocks, layout.get("header_band"))
+        page.footer = self._band_text(page.blocks, layout.get("footer_band"))
+        return page
+
+    def _band_text(self, blocks: List['ContentBlock'], band: Optional[Tuple[float, float]]) -> Optional[str]:
+        if band is None:
+            return None
+        top, bottom = band
+        texts = [b.content for b in blocks if top - 2 <= b.position[1] <= bottom + 2]
+        return " ".join(texts) if texts else ""
+
     def generate_layout_signature(self, layout_info: Dict) -> str:
-        signature_str = f"{layout_info.get('columns', 1)}_{layout_info.get('font_size', 12)}"
+        # 量化后的版面特征：同一套模板的试卷即使扫描略有偏移也落在同一签名上
+        vector = self.layout_vector(layout_info)
+        signature_str = "_".join(str(int(round(v))) for v in vector)
         return hashlib.md5(signature_str.encode()).hexdigest()[:16]
 
+    def layout_vector(self, layout_info: Dict) -> List[float]:
+        bounds = layout_info.get('column_bounds') or []
+        column_widths = [right - left for left, right in bounds][:3]
+        column_widths += [0.0] * (3 - len(column_widths))
+        return [
+            float(layout_info.get('columns', 1)),
+            round(layout_info.get('font_size', 12) or 0),
+            round((layout_info.get('line_spacing', 12) or 0) / 2) * 2,
+            round((layout_info.get('margin_left', 72) or 0) / 10) * 10,
+            round((layout_info.get('margin_right', 72) or 0) / 10) * 10,
+            round((layout_info.get('margin_top', 72) or 0) / 10) * 10,
+            1.0 if layout_info.get('header_band') else 0.0,
+            1.0 if layout_info.get('footer_band') else 0.0,
+        ] + [round(w / 10) * 10 for w in column_widths]
+
+TEMPLATE_NUMBER_PATTERNS = [
+    r'^\d+[.、)]',
+    r'^第\s*\d+\s*题',
+    r'^[一二三四五六七八九十]+[、.]',
+]
+
 class QuestionExtractor:
-    def __init__(self):
+    def __init__(self, keywords: KeywordRegistry = None):
+        # 难度指示词（difficulty:hard / difficulty:easy）与知识点提取共用同一套可按学科热更新的关键词自动机
+        self.keywords = keywords or keyword_registry
         self.question_patterns = {
             QuestionType.CHOICE: [
                 r'^\d+[.、)]\s*.+\?\s*$',
@@ -215,7 +440,8 @@ class QuestionExtractor:
             ]
         }
     
-    def extract(self, text: str, layout_info: Dict) -> List[Question]:
+    @timed("question_extract")
+    def extract(self, text: str, layout_info: Dict, subject: Optional[str] = None) -> List[Question]:
         questions = []
         lines = text.split('\n')
         
@@ -232,7 +458,7 @@ class QuestionExtractor:
             if question_type or self._is_new_question(line, lines, line_num):
                 if current_question and question_buffer:
                     content = '\n'.join(question_buffer)
-                    question = self._create_question(content, current_question, line_num)
+                    question = self._create_question(content, current_question, line_num, subject)
                     questions.append(question)
                 
                 current_question = question_type if question_type else QuestionType.ESSAY
@@ -243,11 +469,100 @@ class QuestionExtractor:
         
         if current_question and question_buffer:
             content = '\n'.join(question_buffer)
-            question = self._create_question(content, current_question, len(lines))
+            question = self._create_question(content, current_question, len(lines), subject)
             questions.append(question)
         
         return questions
     
+    def learn_template(self, text: str, layout_info: Dict) -> Dict:
+        # 从一份已按通用流程解析的试卷中学习模板参数：题号格式、选项排布、答案位置
+        lines = [line.strip() for line in text.split('\n') if line.strip()]
+        number_counts = {
+            pattern: sum(1 for line in lines if re.match(pattern, line))
+            for pattern in TEMPLATE_NUMBER_PATTERNS
+        }
+        number_pattern = max(number_counts, key=number_counts.get)
+
+        option_lines = sum(1 for line in lines if re.match(r'^[A-D][.、．）)]', line))
+        inline_options = sum(1 for line in lines if len(re.findall(r'[A-D][.、．）)]', line)) >= 2)
+        if option_lines == 0 and inline_options == 0:
+            option_layout = "none"
+        else:
+            option_layout = "line" if option_lines >= inline_options else "inline"
+
+        answer_location = "none"
+        if any(line.startswith(('答案：', '答案:')) for line in lines):
+            answer_location = "inline"
+        tail = lines[int(len(lines) * 0.5):]
+        if any(re.match(r'^(参考答案|答案)[：:]?$', line) for line in tail):
+            answer_location = "end"
+
+        return {
+            "question_number_pattern": number_pattern,
+            "option_layout": option_layout,
+            "answer_location": answer_location,
+            "question_regions": layout_info.get('column_bounds', []),
+        }
+
+    @timed("question_extract_template")
+    def extract_with_template(self, text: str, params: Dict, subject: Optional[str] = None) -> List[Question]:
+        # 已知模板：只用模板的题号正则切题，不再逐行尝试全部题型正则
+        number = re.compile(params["question_number_pattern"])
+        lines = text.split('\n')
+        questions = []
+        buffer: List[str] = []
+        answer_key: Dict[int, str] = {}
+
+        for line_num, line in enumerate(lines):
+            line = line.strip()
+            if not line:
+                continue
+            if params["answer_location"] == "end" and re.match(r'^(参考答案|答案)[：:]?$', line):
+                answer_key = self._parse_answer_key(lines[line_num + 1:])
+                break
+            if number.match(line):
+                if buffer:
+                    questions.append(self._create_template_question(buffer, params, line_num, subject))
+                buffer = [line]
+            elif buffer:
+                buffer.append(line)
+        if buffer:
+            questions.append(self._create_template_question(buffer, params, len(lines), subject))
+
+        for i, question in enumerate(questions, 1):
+            if i in answer_key and not question.answer:
+                question.answer = answer_key[i]
+        return questions
+
+    def _create_template_question(self, buffer: List[str], params: Dict, line_num: int,
+                                  subject: Optional[str] = None) -> Question:
+        content = '\n'.join(buffer)
+        first = buffer[0]
+        if params["option_layout"] == "line" and any(re.match(r'^[A-D][.、．）)]', l) for l in buffer[1:]):
+            qtype = QuestionType.CHOICE
+        elif params["option_layout"] == "inline" and len(re.findall(r'[A-D][.、．）)]', content)) >= 2:
+            qtype = QuestionType.CHOICE
+        elif '____' in first:
+            qtype = QuestionType.FILL
+        elif '简述' in first or '论述' in first:
+            qtype = QuestionType.ESSAY
+        elif '判断' in first or re.search(r'[是否对错].*[?？]$', first):
+            qtype = QuestionType.JUDGE
+        else:
+            qtype = QuestionType.ESSAY
+        question = self._create_question(content, qtype, line_num, subject)
+        if qtype == QuestionType.CHOICE and params["option_layout"] == "inline":
+            question.options = [f"{m.group(1)}. {m.group(2).strip()}"
+                                for m in re.finditer(r'([A-D])[.、．）)]\s*([^A-D]+)', content)]
+        return question
+
+    def _parse_answer_key(self, lines: List[str]) -> Dict[int, str]:
+        answers = {}
+        for line in lines:
+            for number, answer in re.findall(r'(\d+)[.、:：\s]*([A-D]+|对|错|√|×)', line):
+                answers[int(number)] = answer
+        return answers
+
     def _detect_question_type(self, line: str) -> Optional[QuestionType]:
         for qtype, patterns in self.question_patterns.items():
             for pattern in patterns:
@@ -265,7 +580,7 @@ class QuestionExtractor:
         
         return has_question_number and prev_is_blank
     
-    def _create_question(self, content: str, qtype: QuestionType, line_num: int) -> Question:
+    def _create_question(self, content: str, qtype: QuestionType, line_num: int, subject: Optional[str] = None) -> Question:
         question_id = hashlib.md5(content.encode()).hexdigest()[:16]
         
         options = self._extract_options(content) if qtype == QuestionType.CHOICE else []
@@ -276,7 +591,7 @@ class QuestionExtractor:
             id=question_id,
             content=content,
             question_type=qtype,
-            difficulty=self._estimate_difficulty(content),
+            difficulty=self._estimate_difficulty(content, subject),
             score=score,
             options=options,
             answer=answer,
@@ -313,13 +628,11 @@ class QuestionExtractor:
         }
         return base_scores.get(qtype, 2.0)
     
-    def _estimate_difficulty(self, content: str) -> Difficulty:
-        complex_indicators = ['证明', '计算', '综合', '应用']
-        easy_indicators = ['定义', '概念', '基本', '简单']
-        
-        content_lower = content.lower()
-        complex_count = sum(1 for ind in complex_indicators if ind in content_lower)
-        easy_count = sum(1 for ind in easy_indicators if ind in content_lower)
+    def _estimate_difficulty(self, content: str, subject: Optional[str] = None) -> Difficulty:
+        # 按命中的不同指示词个数比较
+        found = self.keywords.automaton(subject).categories(content)
+        complex_count = len(found.get("difficulty:hard", ()))
+        easy_count = len(found.get("difficulty:easy", ()))
         
         if complex_count > easy_count:
             return Difficulty.HARD
@@ -0,0 +1,232 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import random
+import re
+import time
+
+import numpy as np
+
+from .metrics import registry
+
+# 组卷引擎：从题库按 (知识点, 题型, 难度) 索引挑题，满足总分、难度比例、题型与知识点覆盖约束，
+# 并排除近似重复题。全程本地计算，不调用模型
+
+DIFFICULTIES = ("easy", "medium", "hard")
+NEAR_DUPLICATE_BITS = 6
+
+registry.describe("assembly_seconds", "组卷耗时（秒）")
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def popcount64(values: np.ndarray) -> np.ndarray:
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+def _normalize(text: str) -> str:
+    return re.sub(r'[\s\d，。！？；：、,.!?;:()（）\[\]【】_]+', '', text)[:96]
+
+def simhash_batch(texts: List[str], ngram: int = 3) -> np.ndarray:
+    # 批量 SimHash：所有字符 n-gram 的哈希拼成一个数组，每一位用一次 bincount 累加，避免逐题逐位循环
+    owners = []
+    hashes = []
+    for i, text in enumerate(texts):
+        text = _normalize(text)
+        grams = [text[j:j + ngram] for j in range(max(1, len(text) - ngram + 1))]
+        owners.extend([i] * len(grams))
+        hashes.extend(hash(g) & 0xFFFFFFFFFFFFFFFF for g in grams)
+    owners = np.asarray(owners, dtype=np.int64)
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    result = np.zeros(len(texts), dtype=np.uint64)
+    for bit in range(64):
+        bits = ((hashes >> np.uint64(bit)) & np.uint64(1)).astype(np.float64)
+        votes = np.bincount(owners, weights=2.0 * bits - 1.0, minlength=len(texts))
+        result |= (votes > 0).astype(np.uint64) << np.uint64(bit)
+    return result
+
+class QuestionBank:
+    def __init__(self, canonical: Optional[Callable[[str], str]] = None):
+        # canonical 把题目的知识点名称映射为规范名称，同义知识点的题目落在同一索引下
+        self.canonical = canonical or (lambda name: name)
+        self.ids: List[str] = []
+        self.questions: List[Dict] = []
+        self.scores = np.zeros(0, dtype=np.float32)
+        self.fingerprints = np.zeros(0, dtype=np.uint64)
+        self.index: Dict[Tuple[str, str, str], List[int]] = {}
+        self.by_point: Dict[str, List[int]] = {}
+        self.row_of: Dict[str, int] = {}
+        self.synced_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add_many(self, questions: Iterable[Dict]):
+        new = [q for q in questions if q.get("id") not in self.row_of]
+        if not new:
+            return
+        start = len(self.ids)
+        fingerprints = simhash_batch([q.get("content", "") for q in new])
+        scores = np.fromiter((float(q.get("score", 2) or 0) for q in new), dtype=np.float32, count=len(new))
+        self.fingerprints = np.concatenate([self.fingerprints, fingerprints])
+        self.scores = np.concatenate([self.scores, scores])
+        for offset, q in enumerate(new):
+            row = start + offset
+            self.ids.append(q["id"])
+            self.questions.append(q)
+            self.row_of[q["id"]] = row
+            self._index_row(row, q)
+
+    def _index_row(self, row: int, q: Dict):
+        point = q.get("knowledge_point") or ""
+        point = self.canonical(point) if point else ""
+        self.index.setdefault((point, q.get("type", "choice"), q.get("difficulty", "medium")), []).append(row)
+        self.by_point.setdefault(point, []).append(row)
+
+    def reindex(self):
+        # 规范名称变化（知识点压缩合并）后按新的名称重建索引，题目与指纹数组不变
+        self.index, self.by_point = {}, {}
+        for row, q in enumerate(self.questions):
+            self._index_row(row, q)
+
+    def sync(self, collection):
+        # 增量同步共享存储中其他 worker 新写入的题目
+        now = time.time()
+        self.add_many(value for _, value in collection.items_since(self.synced_at))
+        self.synced_at = now
+
+    def candidates(self, point: str, qtype: str, difficulty: str) -> List[int]:
+        return self.index.get((point, qtype, difficulty), [])
+
+class PaperAssembler:
+    def __init__(self, bank: QuestionBank, near_duplicate_bits: int = NEAR_DUPLICATE_BITS):
+        self.bank = bank
+        self.near_duplicate_bits = near_duplicate_bits
+
+    def canonical(self, point: Optional[str]) -> str:
+        # 题库索引按规范名称建立，查候选与统计覆盖前都先换成规范名称
+        return self.bank.canonical(point) if point else ""
+
+    def assemble(
+        self,
+        question_count: int,
+        difficulty_ratio: Dict[str, float],
+        question_types: List[str],
+        knowledge_points: Optional[List[str]] = None,
+        total_score: Optional[float] = None,
+        exclude_ids: Iterable[str] = (),
+        seed: Optional[int] = None
+    ) -> Dict:
+        start = time.perf_counter()
+        rng = random.Random(seed)
+        requested = list(knowledge_points or self.bank.by_point.keys())
+        # 同义知识点换成同一个规范名称后去重，避免同一知识点在轮转中占两个位置
+        points = list(dict.fromkeys(self.canonical(p) for p in requested))
+        targets = self.difficulty_targets(question_count, difficulty_ratio)
+        excluded = {self.bank.row_of[i] for i in exclude_ids if i in self.bank.row_of}
+
+        selected: List[int] = []
+        selected_prints = np.zeros(0, dtype=np.uint64)
+        remaining = dict(targets)
+        type_cursor = 0
+        misses = 0
+        point_cursor = 0
+
+        # 贪心：知识点轮转保证覆盖，每个位置取缺口最大的难度，题型轮转，候选里随机取一道非近似重复的题
+        while len(selected) < question_count and misses < len(points) * len(DIFFICULTIES):
+            point = points[point_cursor % len(points)] if points else ""
+            point_cursor += 1
+            picked = None
+            for difficulty in sorted(DIFFICULTIES, key=lambda d: -remaining[d]):
+                for t in range(len(question_types)):
+                    qtype = question_types[(type_cursor + t) % len(question_types)]
+                    picked = self._pick(self.bank.candidates(point, qtype, difficulty), excluded, selected_prints, rng)
+                    if picked is not None:
+                        type_cursor += t + 1
+                        remaining[difficulty] -= 1
+                        break
+                if picked is not None:
+                    break
+            if picked is None:
+                misses += 1
+                continue
+            misses = 0
+            selected.append(picked)
+            excluded.add(picked)
+            selected_prints = np.append(selected_prints, self.bank.fingerprints[picked])
+
+        if total_score is not None:
+            self._adjust_score(selected, total_score, question_types, excluded)
+
+        elapsed = time.perf_counter() - start
+        registry.observe("assembly_seconds", elapsed)
+        questions = [self.bank.questions[row] for row in selected]
+        distribution = {d: sum(1 for q in questions if q.get("difficulty") == d) for d in DIFFICULTIES}
+        covered = {self.canonical(q.get("knowledge_point")) for q in questions}
+        return {
+            "questions": questions,
+            "total_score": float(self.bank.scores[selected].sum()) if selected else 0.0,
+            "difficulty_distribution": distribution,
+            "difficulty_targets": targets,
+            "covered_points": sorted(p for p in covered if p),
+            # 缺失的知识点按请求中的名称返回
+            "missing_points": [p for p in requested if self.canonical(p) not in covered],
+            "shortfall": question_count - len(questions),
+            "elapsed_ms": round(elapsed * 1000, 3),
+        }
+
+    def difficulty_targets(self, count: int, ratio: Dict[str, float]) -> Dict[str, int]:
+        total = sum(ratio.get(d, 0) for d in DIFFICULTIES) or 1
+        exact = {d: count * ratio.get(d, 0) / total for d in DIFFICULTIES}
+        targets = {d: int(exact[d]) for d in DIFFICULTIES}
+        # 最大余数法，保证各难度题数之和等于总题数
+        for d in sorted(DIFFICULTIES, key=lambda d: exact[d] - targets[d], reverse=True)[:count - sum(targets.values())]:
+            targets[d] += 1
+        return targets
+
+    def _is_near_duplicate(self, row: int, selected_prints: np.ndarray) -> bool:
+        if len(selected_prints) == 0:
+            return False
+        distances = popcount64(selected_prints ^ self.bank.fingerprints[row])
+        return bool((distances <= self.near_duplicate_bits).any())
+
+    def _pick(self, candidates: List[int], excluded: set, selected_prints: np.ndarray, rng: random.Random) -> Optional[int]:
+        if not candidates:
+            return None
+        # 随机起点顺序扫描，期望常数次即可命中可用题目
+        offset = rng.randrange(len(candidates))
+        for i in range(min(len(candidates), 64)):
+            row = candidates[(offset + i) % len(candidates)]
+            if row not in excluded and not self._is_near_duplicate(row, selected_prints):
+                return row
+        return None
+
+    def _adjust_score(self, selected: List[int], total_score: float, question_types: List[str], excluded: set, max_rounds: int = 3):
+        # 局部替换：在同知识点、同难度、允许题型的候选中找能把总分拉近目标的题，多轮直到无改进
+        scores = self.bank.scores
+        for _ in range(max_rounds):
+            improved = False
+            for i in range(len(selected)):
+                gap = total_score - float(scores[selected].sum())
+                if abs(gap) < 1e-6:
+                    return
+                row = selected[i]
+                q = self.bank.questions[row]
+                pool = [c for qtype in question_types
+                        for c in self.bank.candidates(self.canonical(q.get("knowledge_point")), qtype, q.get("difficulty", "medium"))]
+                if not pool:
+                    continue
+                pool = np.asarray(pool, dtype=np.int64)
+                residual = np.abs(gap - (scores[pool] - scores[row]))
+                useful = np.flatnonzero(residual < abs(gap) - 1e-6)
+                if not len(useful):
+                    continue
+                others = self.bank.fingerprints[[r for r in selected if r != row]]
+                # 按剩余差距从小到大尝试，跳过已选与近似重复的题
+                for candidate in pool[useful[np.argsort(residual[useful], kind="stable")][:64]]:
+                    candidate = int(candidate)
+                    if candidate in excluded or self._is_near_duplicate(candidate, others):
+                        continue
+                    excluded.add(candidate)
+                    selected[i] = candidate
+                    improved = True
+                    break
+            if not improved:
+                return
@@ -0,0 +1,190 @@
+from typing import AsyncIterator, Dict, List, Optional
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./data/profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+# 共享任务队列中按此比例抽样剖析后台任务（0 为关闭），同类任务的采样累加到同一份剖析记录
+PROFILE_JOB_RATE = float(os.getenv("PROFILE_JOB_RATE", "0"))
+
+# 空闲线程（线程池等待任务、锁等待）的栈顶函数，采样时跳过以免淹没真实热点
+IDLE_LEAVES = {("threading.py", "wait"), ("queue.py", "get"), ("thread.py", "_worker")}
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+class SamplingProfiler:
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.started_at = 0.0
+        self.duration = 0.0
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+                if leaf in IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def top_frames(self, limit: int = 10) -> List[Dict]:
+        # 按叶子函数（自身耗时）汇总，直接看出时间落在正则、JSON 解析还是网络等待
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [{"frame": frame, "samples": count, "ratio": round(count / total, 4)}
+                for frame, count in leaves.most_common(limit)]
+
+def new_profile_id(method: str, path: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{method.lower()}_{slug}"
+
+def save_profile(profiler: SamplingProfiler, profile_id: str, method: str, path: str):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.folded"), "w", encoding="utf-8") as f:
+        f.write(profiler.collapsed())
+    meta = {
+        "id": profile_id,
+        "method": method,
+        "path": path,
+        "created_at": datetime.now().isoformat(),
+        "duration": round(profiler.duration, 4),
+        "samples": profiler.samples,
+        "interval": profiler.interval,
+        "top_frames": profiler.top_frames(),
+    }
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    _prune()
+
+def _prune():
+    metas = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith(".json"))
+    for name in metas[:-PROFILE_KEEP] if len(metas) > PROFILE_KEEP else []:
+        base = name[:-len(".json")]
+        for ext in (".json", ".folded"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, base + ext))
+            except FileNotFoundError:
+                pass
+
+def list_profiles(limit: int = 20) -> List[Dict]:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    metas = sorted((name for name in os.listdir(PROFILE_DIR) if name.endswith(".json")), reverse=True)
+    profiles = []
+    for name in metas[:limit]:
+        with open(os.path.join(PROFILE_DIR, name), encoding="utf-8") as f:
+            profiles.append(json.load(f))
+    return profiles
+
+def load_profile(profile_id: str) -> Optional[str]:
+    if not re.fullmatch(r"[A-Za-z0-9_]+", profile_id):
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.folded")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+class JobProfiler:
+    # 后台任务（试卷分析、预计算）不经过请求中间件：按 rate 抽样剖析任务执行期间的全部线程，
+    # 折叠栈以 "job:<任务类型>" 为根帧累加到每类任务一份的剖析记录（id 为 job_<任务类型>），与请求剖析一起列出
+    def __init__(self, rate: float = PROFILE_JOB_RATE, interval: float = PROFILE_INTERVAL):
+        self.rate = rate
+        self.interval = interval
+        self.aggregates: Dict[str, SamplingProfiler] = {}
+
+    @asynccontextmanager
+    async def profile(self, kind: str) -> AsyncIterator[None]:
+        if self.rate <= 0 or random.random() >= self.rate:
+            yield
+            return
+        profiler = SamplingProfiler(self.interval)
+        profiler.start()
+        try:
+            yield
+        finally:
+            await asyncio.to_thread(profiler.stop)
+            aggregate = self.aggregates.setdefault(kind, SamplingProfiler(self.interval))
+            root = f"job:{kind}"
+            for stack, count in profiler.stacks.items():
+                aggregate.stacks[f"{root};{stack}"] += count
+            aggregate.samples += profiler.samples
+            aggregate.duration += profiler.duration
+            label = re.sub(r"[^A-Za-z0-9]+", "_", kind)
+            await asyncio.to_thread(save_profile, aggregate, f"job_{label}", "JOB", kind)
+
+class ProfilingMiddleware:
+    # 纯 ASGI 中间件：包裹整个请求处理（到响应发送完毕为止）；共享任务队列中的后台任务由 JobProfiler 单独剖析
+    def __init__(self, app, admin_token: Optional[str]):
+        self.app = app
+        self.admin_token = admin_token
+
+    def _requested(self, scope) -> bool:
+        if not self.admin_token:
+            return False
+        headers = dict(scope.get("headers") or [])
+        query = scope.get("query_string", b"").decode()
+        flagged = headers.get(b"x-profile") == b"1" or re.search(r"(^|&)profile=1(&|$)", query) is not None
+        token = headers.get(b"x-admin-token", b"").decode()
+        return flagged and token == self.admin_token
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        method, path = scope.get("method", "GET"), scope.get("path", "/")
+        profiler = SamplingProfiler()
+        profile_id = new_profile_id(method, path)
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", []).append((b"x-profile-id", profile_id.encode()))
+            await send(message)
+
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            # 等待采样线程退出和写文件都放到线程池，不阻塞事件循环
+            await asyncio.to_thread(profiler.stop)
+            await asyncio.to_thread(save_profile, profiler, profile_id, method, path)
@@ -0,0 +1,100 @@
+from typing import Dict, Iterable, List, Optional
+
+from .metrics import registry
+from .paper_assembly import DIFFICULTIES, PaperAssembler
+
+# 检索优先出题：先按 (知识点, 题型, 难度) 从题库取题，只把缺口交给模型生成；
+# 每个用户已做过的题不再重复下发
+
+registry.describe("question_retrieval_total", "检索出题的题目数（hit 为题库命中，miss 为需模型补齐）")
+registry.describe("model_calls_saved_total", "题库完全覆盖、省去的模型调用次数")
+
+class QuestionRetriever:
+    def __init__(self, assembler: PaperAssembler, served, stats, max_served: int = 5000):
+        # served、stats 为 dict 风格存储：served 以用户 ID 为键记录已下发题目，stats 累计命中情况（多 worker 共享）
+        self.assembler = assembler
+        self.served = served
+        self.stats_store = stats
+        self.max_served = max_served
+
+    def retrieve(
+        self,
+        user_id: str,
+        question_count: int,
+        difficulty_ratio: Dict[str, float],
+        question_types: List[str],
+        knowledge_points: List[str]
+    ) -> Dict:
+        targets = self.assembler.difficulty_targets(question_count, difficulty_ratio)
+        if knowledge_points:
+            served_ids = self.served.get(user_id, {}).get("ids", [])
+            result = self.assembler.assemble(
+                question_count, difficulty_ratio, question_types, knowledge_points, exclude_ids=served_ids
+            )
+            questions = result["questions"]
+        else:
+            questions = []
+
+        # 缺口按难度拆分：组卷在某一难度不足时会用其他难度补位，总缺口以实际题数为准
+        found = {d: sum(1 for q in questions if q.get("difficulty") == d) for d in DIFFICULTIES}
+        deficit = {d: max(0, targets[d] - found[d]) for d in DIFFICULTIES}
+        excess = sum(deficit.values()) - (question_count - len(questions))
+        for d in sorted(DIFFICULTIES, key=lambda d: deficit[d]):
+            trim = min(excess, deficit[d])
+            deficit[d] -= trim
+            excess -= trim
+
+        shortfall = question_count - len(questions)
+        registry.inc("question_retrieval_total", len(questions), result="hit")
+        registry.inc("question_retrieval_total", shortfall, result="miss")
+        if shortfall == 0:
+            registry.inc("model_calls_saved_total")
+        self._record(question_count, len(questions), shortfall == 0)
+        return {
+            "questions": questions,
+            "deficit": deficit,
+            "shortfall": shortfall,
+            "hit_ratio": round(len(questions) / question_count, 4) if question_count else 0.0,
+            "model_call_saved": shortfall == 0,
+        }
+
+    def mark_served(self, user_id: str, question_ids: Iterable[str]):
+        question_ids = list(question_ids)
+        if not question_ids:
+            return
+
+        def append(value: Dict) -> Dict:
+            value["ids"] = (value.get("ids", []) + question_ids)[-self.max_served:]
+            return value
+
+        self.served.modify(user_id, append, {"ids": []})
+
+    def any_served(self, user_id: str, question_ids: Iterable[str]) -> bool:
+        served_ids = set(self.served.get(user_id, {}).get("ids", []))
+        return any(q_id in served_ids for q_id in question_ids)
+
+    def _record(self, requested: int, retrieved: int, saved: bool):
+        def accumulate(value: Dict) -> Dict:
+            value["requests"] = value.get("requests", 0) + 1
+            value["requested"] = value.get("requested", 0) + requested
+            value["retrieved"] = value.get("retrieved", 0) + retrieved
+            value["model_calls_saved"] = value.get("model_calls_saved", 0) + int(saved)
+            return value
+
+        self.stats_store.modify("global", accumulate)
+
+    def stats(self, user_id: Optional[str] = None) -> Dict:
+        value = self.stats_store.get("global", {})
+        requests = value.get("requests", 0)
+        requested = value.get("requested", 0)
+        stats = {
+            "requests": requests,
+            "requested_questions": requested,
+            "retrieved_questions": value.get("retrieved", 0),
+            "hit_ratio": round(value.get("retrieved", 0) / requested, 4) if requested else 0.0,
+            "model_calls_saved": value.get("model_calls_saved", 0),
+            "model_call_savings": round(value.get("model_calls_saved", 0) / requests, 4) if requests else 0.0,
+        }
+        if user_id is not None:
+            stats["served_to_user"] = len(self.served.get(user_id, {}).get("ids", []))
+        return stats
@@ -0,0 +1,140 @@
+from typing import Any, Optional
+import asyncio
+import gzip
+import hashlib
+import json
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from .metrics import registry
+
+# 大响应的编码与传输：orjson 序列化（未安装时回退标准库 json）、按 Accept-Encoding 协商 br/gzip 压缩、
+# 列表和图谱接口带 ETag，内容未变时对 If-None-Match 返回 304
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+# 超过该大小的响应体放到线程中压缩，避免阻塞事件循环
+THREAD_COMPRESS_BYTES = 256 * 1024
+
+registry.describe("response_compressed_total", "按编码统计的压缩响应次数")
+registry.describe("response_not_modified_total", "ETag 命中返回 304 的次数")
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # 压缩不改变 ETag 的语义，弱校验比较即可
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+def cached_json(request: Request, content: Any) -> Response:
+    # 直接序列化为字节：跳过 FastAPI 的 jsonable_encoder，ETag 取自响应体本身
+    body = dumps(content)
+    etag = etag_for(body)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        registry.inc("response_not_modified_total", path=request.url.path)
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+def accepted_encodings(accept_encoding: str) -> dict:
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip()] = quality
+    return accepted
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = accepted_encodings(accept_encoding)
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def compress(encoding: str, body: bytes, gzip_level: int = 6, brotli_quality: int = 4) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level)
+
+class CompressionMiddleware:
+    # 纯 ASGI 中间件：只压缩一次性发送的文本类响应体；流式响应（SSE、文件下载）原样透传
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if start_message is not None and message["type"] != "http.response.body":
+                # 如 http.response.pathsend（零拷贝发送文件）：不压缩，先补发响应头
+                start, start_message = start_message, None
+                await send(start)
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            headers = MutableHeaders(scope=start)
+            body = message.get("body", b"")
+            if headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES) and "content-encoding" not in headers:
+                headers.add_vary_header("Accept-Encoding")
+                if not message.get("more_body", False) and len(body) >= self.minimum_size:
+                    if len(body) >= THREAD_COMPRESS_BYTES:
+                        body = await asyncio.to_thread(compress, encoding, body, self.gzip_level, self.brotli_quality)
+                    else:
+                        body = compress(encoding, body, self.gzip_level, self.brotli_quality)
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(body))
+                    message = {**message, "body": body}
+                    registry.inc("response_compressed_total", encoding=encoding)
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,128 @@
+from typing import Deque, Optional, Tuple
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from .metrics import registry
+
+# 分级路由：按输入长度、规则引擎把握、用户等级和当前上游延迟，逐请求（或逐块）选择规则引擎或模型。
+# 每次决策及其耗时、成本写入 JSONL 日志，用于离线调参
+
+ROUTING_LOG = os.getenv("ROUTING_LOG", "./data/routing.jsonl")
+# 日志按大小轮转，保留 ROUTING_LOG_BACKUPS 个历史文件
+ROUTING_LOG_MAX_BYTES = int(os.getenv("ROUTING_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+ROUTING_LOG_BACKUPS = int(os.getenv("ROUTING_LOG_BACKUPS", "3"))
+
+# 各等级的阈值：规则把握高于 min_rule_confidence 即走规则；上游 p90 超过 latency_budget 时退到规则
+TIER_POLICIES = {
+    "free": {"min_rule_confidence": 0.6, "latency_budget": 8.0, "max_model_chars": 20000},
+    "pro": {"min_rule_confidence": 0.85, "latency_budget": 20.0, "max_model_chars": 100000},
+}
+
+registry.describe("route_total", "规则引擎/模型路由决策次数")
+registry.describe("route_seconds", "按路由统计的处理耗时（秒）")
+
+@dataclass
+class RouteDecision:
+    kind: str
+    route: str
+    reason: str
+    tier: str
+    input_chars: int
+    rule_confidence: float
+    upstream_p90: float
+    decided_at: float = field(default_factory=time.time)
+
+class ModelRouter:
+    def __init__(self, short_input_chars: int = 300, latency_window: float = 300.0, log_path: Optional[str] = ROUTING_LOG):
+        self.short_input_chars = short_input_chars
+        self.latency_window = latency_window
+        self.log_path = log_path
+        self._latencies: Deque[Tuple[float, float]] = deque(maxlen=512)
+        self._lock = threading.Lock()
+        self._logger: Optional[logging.Logger] = None
+        self._listener: Optional[QueueListener] = None
+        if log_path:
+            if os.path.dirname(log_path):
+                os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            # record 在事件循环上调用：只把行放进内存队列，由后台线程写盘和轮转
+            handler = RotatingFileHandler(log_path, maxBytes=ROUTING_LOG_MAX_BYTES,
+                                          backupCount=ROUTING_LOG_BACKUPS, encoding="utf-8", delay=True)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+            self._logger = logging.getLogger(f"examkiller.routing.{id(self)}")
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            self._logger.addHandler(QueueHandler(log_queue))
+            self._listener = QueueListener(log_queue, handler)
+        self._listening = False
+
+    def close(self):
+        # 停止后台写线程，写完队列中剩余的日志行；之后再有 record 会重新启动
+        with self._lock:
+            if self._listener is not None and self._listening:
+                self._listener.stop()
+                self._listening = False
+                for handler in self._listener.handlers:
+                    handler.flush()
+
+    def upstream_p90(self) -> float:
+        # 只看最近 latency_window 秒内的模型调用；样本过期后回到 0，避免一次慢请求让路由永久偏向规则
+        cutoff = time.time() - self.latency_window
+        with self._lock:
+            while self._latencies and self._latencies[0][0] < cutoff:
+                self._latencies.popleft()
+            samples = sorted(value for _, value in self._latencies)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(0.9 * len(samples)))]
+
+    def route(self, kind: str, text: str, rule_confidence: float, tier: str = "free", has_model: bool = True) -> RouteDecision:
+        policy = TIER_POLICIES.get(tier, TIER_POLICIES["free"])
+        p90 = self.upstream_p90()
+        length = len(text)
+
+        if not has_model:
+            route, reason = "rules", "no_model"
+        elif length <= self.short_input_chars and rule_confidence >= policy["min_rule_confidence"] * 0.5:
+            route, reason = "rules", "short_input"
+        elif rule_confidence >= policy["min_rule_confidence"]:
+            route, reason = "rules", "rules_confident"
+        elif p90 > policy["latency_budget"]:
+            route, reason = "rules", "upstream_slow"
+        elif length > policy["max_model_chars"]:
+            route, reason = "rules", "tier_limit"
+        else:
+            route, reason = "model", "low_rule_confidence"
+
+        decision = RouteDecision(kind, route, reason, tier, length, round(rule_confidence, 4), round(p90, 4))
+        registry.inc("route_total", kind=kind, route=route, reason=reason)
+        return decision
+
+    def record(self, decision: RouteDecision, elapsed: float, output_items: int, output_chars: int = 0, fallback: bool = False):
+        if decision.route == "model":
+            with self._lock:
+                self._latencies.append((time.time(), elapsed))
+        registry.observe("route_seconds", elapsed, kind=decision.kind, route=decision.route)
+        if self._logger is None:
+            return
+        if not self._listening:
+            with self._lock:
+                if not self._listening:
+                    self._listener.start()
+                    self._listening = True
+        entry = asdict(decision)
+        entry.update({
+            "elapsed": round(elapsed, 6),
+            "output_items": output_items,
+            # 中文输入下 1 字符约 1 token，规则路由不产生模型成本
+            "estimated_tokens": decision.input_chars + output_chars if decision.route == "model" else 0,
+            "fallback": fallback,
+        })
+        self._logger.info(json.dumps(entry, ensure_ascii=False))
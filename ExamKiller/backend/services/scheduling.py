@@ -0,0 +1,239 @@
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from datetime import date
+import asyncio
+import itertools
+import time
+
+from .metrics import registry
+
+# 模型调用调度：所有模型请求在发出前按优先级类别排队，空闲并发槽位总是先给交互类请求；
+# 同一类别内按用户做加权公平排队（虚拟开始时间），单个重度用户的大批量导出不会挤占其他用户；
+# 每个用户还受并发数和每日 token 配额限制。后台、批量类别各有槽位上限，
+# 交互请求最近的排队等待 p95 超过目标时，后台与批量类别收缩到 1 个槽位，把并发让给交互请求
+
+PRIORITY_CLASSES = ("interactive", "background", "bulk")
+
+# 用户等级对应的调度参数：weight 为公平排队权重，concurrency 为同时进行的模型调用数，
+# daily_tokens 为每日 token 配额（0 表示不限）；users 中的 scheduling 字段可逐项覆盖
+TIER_POLICIES: Dict[str, Dict[str, float]] = {
+    "free": {"weight": 1.0, "concurrency": 2, "daily_tokens": 200000},
+    "pro": {"weight": 4.0, "concurrency": 4, "daily_tokens": 2000000},
+    # 匿名默认用户（前端不传 user_id 时的所有请求及后台任务）汇集了多人的调用，限额放宽，
+    # 但仍是有限值：其并发数留出槽位给登录用户，每日配额兜住失控的批量调用
+    "anonymous": {"weight": 2.0, "concurrency": 6, "daily_tokens": 5000000},
+}
+
+registry.describe("model_queue_depth", "模型调用调度队列中等待的请求数（按优先级类别）")
+registry.describe("model_quota_rejected_total", "因每日 token 配额用完被拒绝的模型调用")
+
+_binding: ContextVar[Optional[Tuple[str, Optional[str]]]] = ContextVar("model_binding", default=None)
+
+def _quantile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class SchedulerError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class _Waiter:
+    __slots__ = ("user_id", "priority", "concurrency", "start", "finish", "seq", "future")
+
+    def __init__(self, user_id: str, priority: str, concurrency: int, start: float, finish: float, seq: int):
+        self.user_id = user_id
+        self.priority = priority
+        self.concurrency = concurrency
+        self.start = start
+        self.finish = finish
+        self.seq = seq
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+class ModelScheduler:
+    def __init__(self, slots: int, users, usage, class_limits: Optional[Dict[str, int]] = None,
+                 wait_target: float = 2.0, endpoint_priorities: Optional[Dict[str, str]] = None,
+                 default_user: str = "demo", window: int = 512, window_seconds: float = 60.0):
+        # users、usage 为 dict 风格存储：users 即用户表（读取 tier 与 scheduling 字段），
+        # usage 以 "<用户>:<日期>" 为键累计 token 用量（多 worker 共享，配额按所有进程合计）
+        self.slots = slots
+        self.users = users
+        self.usage = usage
+        self.class_limits = {"interactive": slots, "background": max(1, slots // 2), "bulk": max(1, slots // 4)}
+        self.class_limits.update(class_limits or {})
+        self.wait_target = wait_target
+        self.endpoint_priorities = endpoint_priorities or {}
+        self.default_user = default_user
+        self.window_seconds = window_seconds
+        self.active = 0
+        self.active_by_class = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self.active_by_user: Dict[str, int] = {}
+        self._queues: Dict[str, List[_Waiter]] = {c: [] for c in PRIORITY_CLASSES}
+        # 每个类别的虚拟时间，以及 (类别, 用户) 上一个请求的虚拟结束时间
+        self._virtual = dict.fromkeys(PRIORITY_CLASSES, 0.0)
+        self._finish: Dict[Tuple[str, str], float] = {}
+        # 最近的 (完成排队的时刻, 等待秒数)
+        self._waits: Dict[str, Deque[Tuple[float, float]]] = {c: deque(maxlen=window) for c in PRIORITY_CLASSES}
+        self._seq = itertools.count()
+
+    @contextmanager
+    def bound(self, user_id: str, priority: Optional[str] = None) -> Iterator[None]:
+        # 在此范围内（含其中创建的子任务）发出的模型调用记在该用户名下；priority 为空时按接口默认类别
+        token = _binding.set((user_id, priority))
+        try:
+            yield
+        finally:
+            _binding.reset(token)
+
+    def current(self, endpoint: str) -> Tuple[str, str]:
+        user_id, priority = _binding.get() or (self.default_user, None)
+        return user_id, priority or self.endpoint_priorities.get(endpoint, "interactive")
+
+    def policy(self, user_id: str) -> Dict[str, float]:
+        user = self.users.get(user_id) or {}
+        # 未设置等级时，匿名默认用户用 anonymous 等级，其他用户用 free 等级
+        default_tier = "anonymous" if user_id == self.default_user else "free"
+        policy = dict(TIER_POLICIES.get(user.get("tier", default_tier), TIER_POLICIES["free"]))
+        policy.update(user.get("scheduling") or {})
+        return policy
+
+    def _usage_key(self, user_id: str) -> str:
+        return f"{user_id}:{date.today().isoformat()}"
+
+    def tokens_used(self, user_id: str) -> int:
+        return (self.usage.get(self._usage_key(user_id)) or {}).get("tokens", 0)
+
+    def check_quota(self, user_id: str):
+        limit = self.policy(user_id)["daily_tokens"]
+        if limit and self.tokens_used(user_id) >= limit:
+            registry.inc("model_quota_rejected_total")
+            raise SchedulerError(429, f"今日模型调用额度已用完（{int(limit)} tokens），请明天再试")
+
+    def record_usage(self, user_id: str, tokens: int):
+        def accumulate(value: Dict) -> Dict:
+            value["tokens"] = value.get("tokens", 0) + tokens
+            value["requests"] = value.get("requests", 0) + 1
+            return value
+
+        self.usage.modify(self._usage_key(user_id), accumulate, {"tokens": 0, "requests": 0})
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, priority: str, cost: float):
+        # cost 为请求的估算 token 数，按用户权重折算成虚拟时间：权重越高、请求越小，越早轮到
+        if priority not in self._queues:
+            raise ValueError(f"未知的优先级类别: {priority}")
+        policy = self.policy(user_id)
+        queued_at = time.perf_counter()
+        key = (priority, user_id)
+        start = max(self._virtual[priority], self._finish.get(key, 0.0))
+        waiter = _Waiter(user_id, priority, int(policy["concurrency"]), start,
+                         start + cost / max(policy["weight"], 1e-6), next(self._seq))
+        self._finish[key] = waiter.finish
+        self._queues[priority].append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 刚分到槽位的同时被取消（超出延迟预算或对冲落败）
+                self._release(waiter)
+            else:
+                self._queues[priority].remove(waiter)
+                self._gauge(priority)
+            raise
+
+        now = time.perf_counter()
+        wait = now - queued_at
+        self._waits[priority].append((now, wait))
+        registry.observe("model_queue_wait_seconds", wait, priority=priority)
+        try:
+            yield wait
+        finally:
+            self._release(waiter)
+
+    def _limit(self, priority: str) -> int:
+        limit = self.class_limits[priority]
+        if priority != "interactive" and self.wait_target > 0 and self.wait_p95("interactive") > self.wait_target:
+            return min(limit, 1)
+        return limit
+
+    def _next(self) -> Optional[_Waiter]:
+        for priority in PRIORITY_CLASSES:
+            queue = self._queues[priority]
+            if not queue or self.active_by_class[priority] >= self._limit(priority):
+                continue
+            eligible = [w for w in queue
+                        if not w.future.done() and self.active_by_user.get(w.user_id, 0) < w.concurrency]
+            if eligible:
+                return min(eligible, key=lambda w: (w.finish, w.seq))
+        return None
+
+    def _dispatch(self):
+        while self.active < self.slots:
+            waiter = self._next()
+            if waiter is None:
+                break
+            self._queues[waiter.priority].remove(waiter)
+            self._virtual[waiter.priority] = max(self._virtual[waiter.priority], waiter.start)
+            self.active += 1
+            self.active_by_class[waiter.priority] += 1
+            self.active_by_user[waiter.user_id] = self.active_by_user.get(waiter.user_id, 0) + 1
+            waiter.future.set_result(None)
+        for priority in PRIORITY_CLASSES:
+            self._gauge(priority)
+
+    def _release(self, waiter: _Waiter):
+        self.active -= 1
+        self.active_by_class[waiter.priority] -= 1
+        remaining = self.active_by_user[waiter.user_id] - 1
+        if remaining:
+            self.active_by_user[waiter.user_id] = remaining
+        else:
+            del self.active_by_user[waiter.user_id]
+        # 虚拟结束时间已落后于类别虚拟时间的记录不再影响排队，及时清理
+        key = (waiter.priority, waiter.user_id)
+        if self._finish.get(key, 0.0) <= self._virtual[waiter.priority]:
+            self._finish.pop(key, None)
+        self._dispatch()
+
+    def _gauge(self, priority: str):
+        registry.set_gauge("model_queue_depth", len(self._queues[priority]), priority=priority)
+
+    def _recent_waits(self, priority: str) -> List[float]:
+        # 只看最近 window_seconds 内的样本，高峰过去后后台与批量类别自动恢复槽位上限
+        cutoff = time.perf_counter() - self.window_seconds
+        return sorted(wait for at, wait in self._waits[priority] if at >= cutoff)
+
+    def wait_p95(self, priority: str) -> float:
+        return _quantile(self._recent_waits(priority), 0.95)
+
+    def stats(self) -> Dict:
+        classes = {}
+        for priority in PRIORITY_CLASSES:
+            recent = self._recent_waits(priority)
+            classes[priority] = {
+                "limit": self._limit(priority),
+                "active": self.active_by_class[priority],
+                "queued": len(self._queues[priority]),
+                "samples": len(recent),
+                "wait_p50": _quantile(recent, 0.5),
+                "wait_p95": _quantile(recent, 0.95),
+            }
+        users: Dict[str, Dict[str, int]] = {}
+        for priority, queue in self._queues.items():
+            for waiter in queue:
+                users.setdefault(waiter.user_id, {"active": 0, "queued": 0})["queued"] += 1
+        for user_id, active in self.active_by_user.items():
+            users.setdefault(user_id, {"active": 0, "queued": 0})["active"] = active
+        return {
+            "slots": self.slots,
+            "active": self.active,
+            "wait_target": self.wait_target,
+            "over_target": self.wait_target > 0 and classes["interactive"]["wait_p95"] > self.wait_target,
+            "classes": classes,
+            "users": users,
+        }
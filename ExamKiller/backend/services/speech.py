@@ -0,0 +1,281 @@
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
+import os
+import re
+import shutil
+import struct
+import threading
+import time
+
+import numpy as np
+
+try:
+    from vosk import KaldiRecognizer, Model, SetLogLevel
+except ImportError:
+    KaldiRecognizer = Model = SetLogLevel = None
+
+from .metrics import registry
+
+# 离线流式语音识别：本地 Vosk（Kaldi）模型，纯 CPU。音频分块送入，每块返回部分结果，
+# 说话停顿处产出整句结果，因此延迟跟随说话进度而不是整段录音长度。
+# 解码、重采样和识别都在线程池中执行（Vosk 的 C 扩展调用期间释放 GIL），事件循环只做收发
+
+TARGET_RATE = 16000
+PCM_FORMATS = ("pcm_s16le", "pcm_f32le", "wav")
+# 压缩容器（浏览器 MediaRecorder 的 webm/ogg 等）需要本机安装 ffmpeg 转码
+FFMPEG_FORMATS = ("webm", "ogg", "mp3", "m4a", "aac", "flac")
+
+registry.describe("voice_rtf", "语音识别实时率（处理耗时 / 音频时长，小于 1 表示快于实时）")
+registry.describe("voice_audio_seconds", "识别的音频时长（秒）")
+registry.describe("voice_sessions", "当前进行中的识别会话数")
+registry.describe("voice_rejected_total", "因并发会话数已满被拒绝的识别请求")
+
+class SpeechError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class Resampler:
+    # 流式重采样：降采样前先做加窗 sinc 低通防混叠，再线性插值；跨块保留滤波器尾部与插值相位
+    def __init__(self, source_rate: int, target_rate: int = TARGET_RATE, taps: int = 63):
+        self.ratio = source_rate / target_rate
+        self.kernel: Optional[np.ndarray] = None
+        if self.ratio > 1:
+            n = np.arange(taps) - (taps - 1) / 2
+            cutoff = 0.5 / self.ratio
+            kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+            self.kernel = (kernel / kernel.sum()).astype(np.float32)
+        self._tail = np.zeros(taps - 1 if self.kernel is not None else 0, dtype=np.float32)
+        self._last = np.zeros(0, dtype=np.float32)
+        self._pos = 0.0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        if self.ratio == 1:
+            return samples
+        if self.kernel is not None:
+            buffered = np.concatenate([self._tail, samples])
+            self._tail = buffered[len(buffered) - len(self._tail):]
+            samples = np.convolve(buffered, self.kernel, mode="valid").astype(np.float32)
+        # _last 为上一块的最后一个样本，插值位置相对于它计算
+        stream = np.concatenate([self._last, samples])
+        if len(stream) < 2:
+            self._last = stream
+            return np.zeros(0, dtype=np.float32)
+        positions = np.arange(self._pos, len(stream) - 1, self.ratio)
+        output = np.interp(positions, np.arange(len(stream)), stream).astype(np.float32)
+        next_pos = positions[-1] + self.ratio if len(positions) else self._pos
+        self._pos = next_pos - (len(stream) - 1)
+        self._last = stream[-1:]
+        return output
+
+def _parse_wav_header(data: bytes) -> Optional[Tuple[int, int, int, int]]:
+    # 返回 (data 块起始偏移, 采样率, 声道数, 位深)；头部尚未收全时返回 None
+    if len(data) < 12:
+        return None
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise SpeechError(415, "不是有效的 WAV 文件")
+    offset, fmt = 12, None
+    while offset + 8 <= len(data):
+        chunk_id, size = data[offset:offset + 4], struct.unpack_from("<I", data, offset + 4)[0]
+        if chunk_id == b"fmt ":
+            if offset + 8 + 16 > len(data):
+                return None
+            audio_format, channels, rate = struct.unpack_from("<HHI", data, offset + 8)
+            bits = struct.unpack_from("<H", data, offset + 22)[0]
+            if audio_format != 1 or bits != 16:
+                raise SpeechError(415, "WAV 仅支持 16 位 PCM")
+            fmt = (rate, channels, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise SpeechError(415, "WAV 缺少 fmt 块")
+            return (offset + 8,) + fmt
+        offset += 8 + size + (size & 1)
+    return None
+
+def _join_cjk(text: str) -> str:
+    # Vosk 中文模型按词输出并以空格分隔，汉字之间的空格去掉
+    return re.sub(r"(?<=[一-鿿]) (?=[一-鿿])", "", text).strip()
+
+class TranscriptionSession:
+    def __init__(self, service: 'SpeechService', fmt: str, sample_rate: int, channels: int):
+        self.service = service
+        self.format = fmt
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.recognizer = KaldiRecognizer(service.model, TARGET_RATE)
+        self.events: asyncio.Queue = asyncio.Queue()
+        self.segments: List[str] = []
+        self.audio_seconds = 0.0
+        self.busy_seconds = 0.0
+        self._last_partial = ""
+        self._pending = b""
+        self._header_done = fmt != "wav"
+        self._resampler = Resampler(sample_rate) if fmt in ("pcm_s16le", "pcm_f32le") else None
+        self._ffmpeg: Optional[asyncio.subprocess.Process] = None
+        self._pump: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self.format in FFMPEG_FORMATS:
+            self._ffmpeg = await asyncio.create_subprocess_exec(
+                self.service.ffmpeg, "-loglevel", "error", "-i", "pipe:0", "-f", "s16le", "-ac", "1",
+                "-ar", str(TARGET_RATE), "pipe:1",
+                stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+            )
+            self._pump = asyncio.create_task(self._pump_ffmpeg())
+
+    async def _pump_ffmpeg(self):
+        while True:
+            # 0.25 秒一块（16kHz 16 位单声道），部分结果的刷新粒度
+            chunk = await self._ffmpeg.stdout.read(8000)
+            if not chunk:
+                break
+            await self._emit(await self._run(self._accept, chunk))
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.service.pool, func, *args)
+
+    async def _emit(self, events: List[Dict]):
+        for event in events:
+            await self.events.put(event)
+
+    async def feed(self, data: bytes):
+        if self._ffmpeg is not None:
+            self._ffmpeg.stdin.write(data)
+            await self._ffmpeg.stdin.drain()
+            return
+        await self._emit(await self._run(self._decode_and_accept, data))
+
+    def _decode_and_accept(self, data: bytes) -> List[Dict]:
+        start = time.perf_counter()
+        data = self._pending + data
+        if not self._header_done:
+            header = _parse_wav_header(data)
+            if header is None:
+                self._pending = data
+                return []
+            offset, self.sample_rate, self.channels, _ = header
+            self._resampler = Resampler(self.sample_rate)
+            self._header_done = True
+            data = data[offset:]
+        itemsize = 4 if self.format == "pcm_f32le" else 2
+        frame = itemsize * self.channels
+        usable = len(data) - len(data) % frame
+        data, self._pending = data[:usable], data[usable:]
+        if self.format == "pcm_f32le":
+            samples = np.frombuffer(data, dtype="<f4")
+        else:
+            samples = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        samples = self._resampler.process(samples)
+        pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+        self.busy_seconds += time.perf_counter() - start
+        return self._accept(pcm)
+
+    def _accept(self, pcm: bytes) -> List[Dict]:
+        if not pcm:
+            return []
+        start = time.perf_counter()
+        events = []
+        if self.recognizer.AcceptWaveform(pcm):
+            text = _join_cjk(json.loads(self.recognizer.Result()).get("text", ""))
+            if text:
+                self.segments.append(text)
+                events.append({"type": "final", "text": text})
+            self._last_partial = ""
+        else:
+            partial = _join_cjk(json.loads(self.recognizer.PartialResult()).get("partial", ""))
+            if partial and partial != self._last_partial:
+                self._last_partial = partial
+                events.append({"type": "partial", "text": partial})
+        self.audio_seconds += len(pcm) / 2 / TARGET_RATE
+        self.busy_seconds += time.perf_counter() - start
+        return events
+
+    def _final(self) -> List[Dict]:
+        start = time.perf_counter()
+        text = _join_cjk(json.loads(self.recognizer.FinalResult()).get("text", ""))
+        self.busy_seconds += time.perf_counter() - start
+        if not text:
+            return []
+        self.segments.append(text)
+        return [{"type": "final", "text": text}]
+
+    async def finish(self) -> Dict:
+        if self._ffmpeg is not None:
+            self._ffmpeg.stdin.close()
+            await self._pump
+            await self._ffmpeg.wait()
+        await self._emit(await self._run(self._final))
+        rtf = self.busy_seconds / self.audio_seconds if self.audio_seconds else 0.0
+        if self.audio_seconds:
+            registry.observe("voice_rtf", rtf)
+            registry.inc("voice_audio_seconds", self.audio_seconds)
+        done = {
+            "type": "done",
+            "text": _join_cjk(" ".join(self.segments)),
+            "audio_seconds": round(self.audio_seconds, 3),
+            "processing_seconds": round(self.busy_seconds, 3),
+            "rtf": round(rtf, 4),
+        }
+        await self.events.put(done)
+        return done
+
+    def abort(self):
+        if self._pump is not None:
+            self._pump.cancel()
+        if self._ffmpeg is not None and self._ffmpeg.returncode is None:
+            self._ffmpeg.kill()
+
+class SpeechService:
+    def __init__(self, model_path: Optional[str], max_sessions: int = 4, workers: Optional[int] = None):
+        self.model_path = model_path
+        self.max_sessions = max_sessions
+        self.pool = ThreadPoolExecutor(max_workers=workers or max_sessions, thread_name_prefix="speech")
+        self.ffmpeg = shutil.which("ffmpeg")
+        self.model = None
+        self.active = 0
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return Model is not None and bool(self.model_path) and os.path.isdir(self.model_path)
+
+    def _load(self):
+        with self._lock:
+            if self.model is None:
+                SetLogLevel(-1)
+                self.model = Model(self.model_path)
+
+    async def open(self, fmt: str, sample_rate: int = TARGET_RATE, channels: int = 1) -> TranscriptionSession:
+        if not self.available:
+            raise SpeechError(503, "未配置本地语音模型（VOSK_MODEL_PATH）")
+        if fmt not in PCM_FORMATS + FFMPEG_FORMATS:
+            raise SpeechError(415, f"不支持的音频格式: {fmt}")
+        if fmt in FFMPEG_FORMATS and self.ffmpeg is None:
+            raise SpeechError(415, f"{fmt} 需要安装 ffmpeg，或改用 pcm_s16le/pcm_f32le/wav")
+        if not 8000 <= sample_rate <= 192000 or not 1 <= channels <= 8:
+            raise SpeechError(400, "采样率或声道数不合法")
+        # 会话数检查与占位在同一个事件循环步骤内完成，不需要加锁
+        if self.active >= self.max_sessions:
+            registry.inc("voice_rejected_total")
+            raise SpeechError(429, "语音识别会话已满，请稍后再试")
+        self.active += 1
+        registry.set_gauge("voice_sessions", self.active)
+        try:
+            if self.model is None:
+                # 首次使用时加载模型（数秒），放到线程池里避免阻塞事件循环
+                await asyncio.get_running_loop().run_in_executor(self.pool, self._load)
+            session = TranscriptionSession(self, fmt, sample_rate, channels)
+            await session.start()
+        except Exception:
+            self.release()
+            raise
+        return session
+
+    def release(self):
+        self.active -= 1
+        registry.set_gauge("voice_sessions", self.active)
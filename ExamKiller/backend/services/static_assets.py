@@ -0,0 +1,137 @@
+from typing import Dict, Optional
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+
+from .metrics import registry
+from .responses import COMPRESSIBLE_TYPES, accepted_encodings, brotli, etag_matches
+
+# 前端静态资源管线：启动时给 assets/ 下的文件按内容哈希加指纹（styles.css -> styles.<hash>.css），
+# 改写 index.html 中的引用，并预先生成最高压缩级别的 .br/.gz 变体。
+# 带指纹的资源内容永不变化，可长期缓存；index.html 只短期缓存并用 ETag 重新验证
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+INDEX_CACHE = "public, max-age=60, must-revalidate"
+# 未带指纹的旧地址（如直接打开旧页面）仍可访问，但需要每次验证
+LEGACY_CACHE = "no-cache"
+
+registry.describe("static_response_total", "静态资源响应次数（按编码与是否 304 统计）")
+
+ASSET_REF = re.compile(r'((?:src|href)=["\'])/?(assets/[^"\'?#]+)(["\'])')
+
+class StaticFile:
+    def __init__(self, path: str, media_type: str, digest: str, cache_control: str):
+        self.path = path
+        self.media_type = media_type
+        self.digest = digest
+        self.cache_control = cache_control
+        # 编码 -> 预压缩文件路径；只保存压缩后确实更小的变体
+        self.variants: Dict[str, str] = {}
+
+    def etag(self, encoding: Optional[str]) -> str:
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+def _write_atomic(path: str, data: bytes):
+    # 多个 worker 同时启动时各自构建，内容相同，原子替换即可
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, "wb") as f:
+        f.write(data)
+    os.replace(temp, path)
+
+class StaticAssets:
+    def __init__(self, root: str, build_dir: str, asset_dir: str = "assets", index: str = "index.html",
+                 min_compress_bytes: int = 256):
+        self.root = root
+        self.build_dir = build_dir
+        self.asset_dir = asset_dir
+        self.index = index
+        self.min_compress_bytes = min_compress_bytes
+        # 源路径 -> 带指纹路径，如 assets/css/styles.css -> assets/css/styles.1a2b3c4d5e.css
+        self.manifest: Dict[str, str] = {}
+        self.files: Dict[str, StaticFile] = {}
+
+    def build(self):
+        self.manifest, self.files = {}, {}
+        written = set()
+        source_dir = os.path.join(self.root, self.asset_dir)
+        for dirpath, _, filenames in os.walk(source_dir):
+            for filename in sorted(filenames):
+                source = os.path.join(dirpath, filename)
+                rel = os.path.relpath(source, self.root).replace(os.sep, "/")
+                with open(source, "rb") as f:
+                    data = f.read()
+                digest = hashlib.sha256(data).hexdigest()[:10]
+                base, ext = os.path.splitext(rel)
+                fingerprinted = f"{base}.{digest}{ext}"
+                media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                immutable = self._emit(fingerprinted, data, media_type, digest, IMMUTABLE_CACHE, written)
+                legacy = StaticFile(immutable.path, media_type, digest, LEGACY_CACHE)
+                legacy.variants = immutable.variants
+                self.manifest[rel] = fingerprinted
+                self.files[fingerprinted] = immutable
+                self.files[rel] = legacy
+
+        index_path = os.path.join(self.root, self.index)
+        if os.path.exists(index_path):
+            with open(index_path, encoding="utf-8") as f:
+                html = ASSET_REF.sub(self._rewrite, f.read()).encode("utf-8")
+            digest = hashlib.sha256(html).hexdigest()[:10]
+            self.files[self.index] = self._emit(self.index, html, "text/html; charset=utf-8", digest, INDEX_CACHE, written)
+        self._prune(written)
+
+    def _rewrite(self, match) -> str:
+        target = self.manifest.get(match.group(2))
+        if target is None:
+            return match.group(0)
+        return f"{match.group(1)}/{target}{match.group(3)}"
+
+    def _emit(self, name: str, data: bytes, media_type: str, digest: str, cache_control: str, written: set) -> StaticFile:
+        path = os.path.join(self.build_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomic(path, data)
+        written.add(os.path.abspath(path))
+        static = StaticFile(path, media_type, digest, cache_control)
+        if len(data) < self.min_compress_bytes or not media_type.startswith(COMPRESSIBLE_TYPES):
+            return static
+        variants = {"gzip": gzip.compress(data, compresslevel=9)}
+        if brotli is not None:
+            variants["br"] = brotli.compress(data, quality=11)
+        for encoding, compressed in variants.items():
+            if len(compressed) >= len(data) * 0.9:
+                continue
+            variant_path = f"{path}.{'br' if encoding == 'br' else 'gz'}"
+            _write_atomic(variant_path, compressed)
+            written.add(os.path.abspath(variant_path))
+            static.variants[encoding] = variant_path
+        return static
+
+    def _prune(self, written: set):
+        # 清理旧版本指纹文件，构建目录只保留本次产物
+        for dirpath, _, filenames in os.walk(self.build_dir):
+            for filename in filenames:
+                path = os.path.abspath(os.path.join(dirpath, filename))
+                if path not in written and not filename.endswith(".tmp"):
+                    os.remove(path)
+
+    def response(self, name: str, headers: Headers) -> Optional[Response]:
+        static = self.files.get(name)
+        if static is None:
+            return None
+        accepted = accepted_encodings(headers.get("accept-encoding", ""))
+        encoding = next((enc for enc in ("br", "gzip")
+                         if enc in static.variants and accepted.get(enc, accepted.get("*", 0.0)) > 0), None)
+        etag = static.etag(encoding)
+        response_headers = {"Cache-Control": static.cache_control, "ETag": etag, "Vary": "Accept-Encoding"}
+        if etag_matches(headers.get("if-none-match"), etag):
+            registry.inc("static_response_total", encoding=encoding or "identity", status="304")
+            return Response(status_code=304, headers=response_headers)
+        registry.inc("static_response_total", encoding=encoding or "identity", status="200")
+        if encoding:
+            response_headers["Content-Encoding"] = encoding
+        # FileResponse 在服务器支持 http.response.pathsend 扩展时直接交给服务器零拷贝发送（sendfile），否则分块读取
+        return FileResponse(static.variants.get(encoding, static.path), media_type=static.media_type, headers=response_headers)
@@ -0,0 +1,292 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import uuid
+
+STORE_PATH = os.getenv("STORE_PATH", "./data/examkiller.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, id);
+"""
+
+def new_id() -> str:
+    # UUIDv7 风格：48 位毫秒时间戳 + 随机位。多进程并发生成不冲突，且按时间有序，写入 SQLite 主键索引时局部性更好
+    value = (int(time.time() * 1000) << 80) | secrets.randbits(80)
+    value = (value & ~(0xF << 76)) | (0x7 << 76)
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)
+    return str(uuid.UUID(int=value))
+
+class SQLiteStore:
+    def __init__(self, path: str = STORE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # 每个线程一个连接；WAL 模式下多个 worker 进程可并发读、串行写
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def transaction(self) -> "Transaction":
+        return Transaction(self.connection())
+
+    def collection(self, namespace: str) -> "Collection":
+        return Collection(self, namespace)
+
+    def put_many(self, entries: Iterable[Tuple[str, str, Dict]], deletes: Iterable[Tuple[str, str]] = ()):
+        # 跨多个集合的 (namespace, key, value) 写入与 (namespace, key) 删除在同一个写事务内完成，要么全部生效要么全部不生效
+        now = time.time()
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO kv (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                [(namespace, key, json.dumps(value, ensure_ascii=False), now) for namespace, key, value in entries],
+            )
+            conn.executemany("DELETE FROM kv WHERE namespace = ? AND key = ?", list(deletes))
+
+class Transaction:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+class Collection:
+    # 与原先模块级 dict 接口一致的持久化集合，值以 JSON 存储
+    def __init__(self, store: SQLiteStore, namespace: str):
+        self.store = store
+        self.namespace = namespace
+
+    def __getitem__(self, key: str) -> Dict:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        row = self.store.connection().execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def __setitem__(self, key: str, value: Dict):
+        self.store.connection().execute(
+            "INSERT OR REPLACE INTO kv (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+            (self.namespace, key, json.dumps(value, ensure_ascii=False), time.time()),
+        )
+
+    def __delitem__(self, key: str):
+        cursor = self.store.connection().execute(
+            "DELETE FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key)
+        )
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        return self.store.connection().execute(
+            "SELECT 1 FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key)
+        ).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self.store.connection().execute(
+            "SELECT COUNT(*) FROM kv WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+    def items(self) -> Iterator[Tuple[str, Dict]]:
+        rows = self.store.connection().execute(
+            "SELECT key, value FROM kv WHERE namespace = ? ORDER BY key", (self.namespace,)
+        ).fetchall()
+        return ((key, json.loads(value)) for key, value in rows)
+
+    def items_since(self, timestamp: float) -> List[Tuple[str, Dict]]:
+        rows = self.store.connection().execute(
+            "SELECT key, value FROM kv WHERE namespace = ? AND updated_at > ? ORDER BY updated_at",
+            (self.namespace, timestamp),
+        ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def keys(self) -> List[str]:
+        return [key for key, _ in self.items()]
+
+    def values(self) -> List[Dict]:
+        return [value for _, value in self.items()]
+
+    def setdefault(self, key: str, default: Dict) -> Dict:
+        with self.store.transaction() as conn:
+            row = conn.execute(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key)
+            ).fetchone()
+            if row:
+                return json.loads(row[0])
+            conn.execute(
+                "INSERT INTO kv (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(default, ensure_ascii=False), time.time()),
+            )
+            return default
+
+    def update(self, key: str, **fields) -> Optional[Dict]:
+        # 读-改-写放在同一个写事务内，避免多个 worker 互相覆盖字段
+        with self.store.transaction() as conn:
+            row = conn.execute(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key)
+            ).fetchone()
+            if row is None:
+                return None
+            value = json.loads(row[0])
+            value.update(fields)
+            conn.execute(
+                "UPDATE kv SET value = ?, updated_at = ? WHERE namespace = ? AND key = ?",
+                (json.dumps(value, ensure_ascii=False), time.time(), self.namespace, key),
+            )
+            return value
+
+    def modify(self, key: str, func, default: Optional[Dict] = None) -> Dict:
+        # 在写事务内对单个值执行 func(value) -> value，适合跨进程的计数累加
+        with self.store.transaction() as conn:
+            row = conn.execute(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key)
+            ).fetchone()
+            value = func(json.loads(row[0]) if row else (default if default is not None else {}))
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value, ensure_ascii=False), time.time()),
+            )
+            return value
+
+    def put_many(self, items: Iterable[Tuple[str, Dict]]):
+        now = time.time()
+        with self.store.transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO kv (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                [(self.namespace, key, json.dumps(value, ensure_ascii=False), now) for key, value in items],
+            )
+
+class ResponseCache:
+    def __init__(self, store: SQLiteStore, ttl: float):
+        self.store = store
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[str]:
+        if self.ttl <= 0:
+            return None
+        row = self.store.connection().execute(
+            "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+    def set(self, key: str, value: str):
+        if self.ttl <= 0:
+            return
+        self.store.connection().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + self.ttl),
+        )
+
+    def purge_expired(self) -> int:
+        return self.store.connection().execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),)).rowcount
+
+class JobQueue:
+    # 基于 SQLite 的跨进程任务队列：priority 越小越先执行，同优先级按入队顺序
+    def __init__(self, store: SQLiteStore):
+        self.store = store
+
+    def enqueue(self, kind: str, payload: Dict, priority: int = 0) -> int:
+        cursor = self.store.connection().execute(
+            "INSERT INTO jobs (kind, payload, priority, created_at) VALUES (?, ?, ?, ?)",
+            (kind, json.dumps(payload, ensure_ascii=False), priority, time.time()),
+        )
+        return cursor.lastrowid
+
+    def claim(self, worker: str) -> Optional[Dict]:
+        with self.store.transaction() as conn:
+            row = conn.execute(
+                "SELECT id, kind, payload, attempts, created_at FROM jobs "
+                "WHERE status = 'queued' ORDER BY priority, id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                (worker, time.time(), row[0]),
+            )
+        return {"id": row[0], "kind": row[1], "payload": json.loads(row[2]), "attempts": row[3] + 1, "created_at": row[4]}
+
+    def complete(self, job_id: int):
+        self.store.connection().execute(
+            "UPDATE jobs SET status = 'done', finished_at = ? WHERE id = ?", (time.time(), job_id)
+        )
+
+    def fail(self, job_id: int, error: str, retry: bool = False):
+        if retry:
+            # 重新入队并降低一级优先级，排到同优先级的其他任务之后，避免立即反复重试
+            self.store.connection().execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, error = ?, priority = priority + 1 WHERE id = ?",
+                (error, job_id),
+            )
+            return
+        self.store.connection().execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?", (error, time.time(), job_id)
+        )
+
+    def cancel(self, kind: str, field: str, value: Any) -> int:
+        # 取消尚未被领取的任务（如来源已被删除）；已在执行的任务由处理函数自行检查来源是否仍存在
+        return self.store.connection().execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? "
+            "WHERE status = 'queued' AND kind = ? AND json_extract(payload, ?) = ?",
+            (time.time(), kind, f"$.{field}", value),
+        ).rowcount
+
+    def requeue_stale(self, timeout: float) -> int:
+        # worker 进程崩溃后遗留的 running 任务重新入队
+        return self.store.connection().execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND started_at < ?",
+            (time.time() - timeout,),
+        ).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        rows = self.store.connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
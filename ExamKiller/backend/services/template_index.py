@@ -0,0 +1,129 @@
+from typing import Dict, List, Optional, Tuple
+import time
+
+import numpy as np
+
+from .metrics import registry
+from .paper_analyzer import LayoutAnalyzer, Question, QuestionExtractor
+
+# 版面模板索引：学校每年沿用少数几套试卷模板，按版面签名聚类并保存每套模板学到的抽取参数，
+# 新试卷命中已知模板时跳过通用题型检测，直接用模板抽取器
+
+registry.describe("template_match_total", "试卷模板索引命中/未命中次数")
+registry.describe("template_time_saved_seconds", "模板抽取相对通用抽取节省的累计时间（秒）")
+
+class TemplateIndex:
+    def __init__(self, templates, layout_analyzer: LayoutAnalyzer = None, extractor: QuestionExtractor = None,
+                 max_distance: float = 12.0, min_questions: int = 3):
+        # templates 为 dict 风格存储（如 store.collection("templates")），键为版面签名
+        self.templates = templates
+        self.layout_analyzer = layout_analyzer or LayoutAnalyzer()
+        self.extractor = extractor or QuestionExtractor()
+        self.max_distance = max_distance
+        self.min_questions = min_questions
+        self._vectors: Optional[Tuple[List[str], np.ndarray]] = None
+
+    def match(self, layout_info: Dict) -> Optional[Tuple[str, Dict]]:
+        signature = self.layout_analyzer.generate_layout_signature(layout_info)
+        template = self.templates.get(signature)
+        if template is not None:
+            return signature, template
+
+        # 签名不完全一致时，在所有模板向量中找最近的一个
+        keys, matrix = self._template_vectors()
+        if not keys:
+            return None
+        vector = np.asarray(self.layout_analyzer.layout_vector(layout_info), dtype=np.float32)
+        distances = np.linalg.norm(matrix - vector, axis=1)
+        best = int(np.argmin(distances))
+        if distances[best] > self.max_distance:
+            return None
+        return keys[best], self.templates.get(keys[best])
+
+    def _template_vectors(self) -> Tuple[List[str], np.ndarray]:
+        # 其他 worker 可能已学到新模板，数量变化时重建向量矩阵
+        if self._vectors is None or len(self._vectors[0]) != len(self.templates):
+            keys, vectors = [], []
+            for key, template in self.templates.items():
+                keys.append(key)
+                vectors.append(template["vector"])
+            self._vectors = (keys, np.asarray(vectors, dtype=np.float32))
+        return self._vectors
+
+    def extract(self, text: str, layout_info: Dict, subject: Optional[str] = None) -> Tuple[List[Question], Dict]:
+        if not layout_info:
+            # txt/pdf/docx 等没有版面分析结果的试卷签名全都相同，套用模板会误用其他试卷学到的参数：直接通用抽取
+            registry.inc("template_match_total", result="skipped")
+            start = time.perf_counter()
+            questions = self.extractor.extract(text, layout_info, subject)
+            return questions, {"template": None, "matched": False, "seconds": time.perf_counter() - start,
+                               "saved_seconds": 0.0}
+
+        matched = self.match(layout_info)
+        if matched is not None:
+            signature, template = matched
+            start = time.perf_counter()
+            questions = self.extractor.extract_with_template(text, template["params"], subject)
+            elapsed = time.perf_counter() - start
+            if len(questions) >= self.min_questions:
+                saved = max(0.0, template["generic_seconds"] - elapsed)
+                registry.inc("template_match_total", result="hit")
+                registry.inc("template_time_saved_seconds", saved)
+                self._record_hit(signature, saved)
+                return questions, {"template": signature, "matched": True, "seconds": elapsed, "saved_seconds": saved}
+
+        registry.inc("template_match_total", result="miss")
+        start = time.perf_counter()
+        questions = self.extractor.extract(text, layout_info, subject)
+        elapsed = time.perf_counter() - start
+        signature = self.learn(text, layout_info, elapsed) if len(questions) >= self.min_questions else None
+        return questions, {"template": signature, "matched": False, "seconds": elapsed, "saved_seconds": 0.0}
+
+    def learn(self, text: str, layout_info: Dict, generic_seconds: float) -> str:
+        signature = self.layout_analyzer.generate_layout_signature(layout_info)
+        # 学习抽取参数较慢，放在写事务之外；期间其他 worker 已学到同一模板时只累加未命中次数
+        learned = None if signature in self.templates else {
+            "signature": signature,
+            "vector": self.layout_analyzer.layout_vector(layout_info),
+            "params": self.extractor.learn_template(text, layout_info),
+            "generic_seconds": generic_seconds,
+            "hits": 0,
+            "misses": 0,
+            "saved_seconds": 0.0,
+        }
+
+        def count_miss(template: Dict) -> Dict:
+            template = template or learned
+            template["misses"] += 1
+            return template
+
+        self.templates.modify(signature, count_miss)
+        if learned is not None:
+            self._vectors = None
+        return signature
+
+    def _record_hit(self, signature: str, saved: float):
+        def count_hit(template: Dict) -> Dict:
+            template["hits"] += 1
+            template["saved_seconds"] += saved
+            return template
+
+        # 模板不会被删除：存在性检查之后再在写事务内累加
+        if signature in self.templates:
+            self.templates.modify(signature, count_hit)
+
+    def stats(self) -> Dict:
+        templates = list(self.templates.values())
+        hits = sum(t["hits"] for t in templates)
+        misses = sum(t["misses"] for t in templates)
+        return {
+            "templates": len(templates),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "saved_seconds": round(sum(t["saved_seconds"] for t in templates), 4),
+            "top": sorted(
+                ({"signature": t["signature"], "hits": t["hits"], "params": t["params"]} for t in templates),
+                key=lambda t: t["hits"], reverse=True,
+            )[:10],
+        }
@@ -0,0 +1,164 @@
+from typing import AsyncIterator, Dict, List, Optional
+import hashlib
+import os
+
+import aiofiles
+
+try:
+    from python_multipart.exceptions import MultipartParseError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:
+    from multipart.exceptions import MultipartParseError
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from .metrics import registry
+from .store import new_id
+
+# 流式 multipart 上传：边接收边写盘、边计算 SHA-256，超过大小上限立即中止；
+# 文件按内容寻址存放在 UPLOAD_DIR/<sha256 前两位>/<sha256>.<扩展名>，相同内容只保存一份
+
+registry.describe("upload_dedup_total", "文件上传按内容去重结果（new 新文件，duplicate 复用已有分析）")
+
+class UploadError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class StoredUpload:
+    def __init__(self, sha256: str, size: int, path: str, filename: str, fields: Dict[str, str]):
+        self.sha256 = sha256
+        self.size = size
+        self.path = path
+        self.filename = filename
+        self.fields = fields
+
+def content_path(upload_dir: str, sha256: str, ext: str) -> str:
+    return os.path.join(upload_dir, sha256[:2], f"{sha256}.{ext}")
+
+class _PartCollector:
+    # MultipartParser 的回调是同步的：这里只把数据放进缓冲区，由外层协程异步写盘
+    def __init__(self, file_field: str):
+        self.file_field = file_field
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.file_chunks: List[bytes] = []
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: Dict[bytes, bytes] = {}
+        self._name: Optional[str] = None
+        self._is_file = False
+        self._value: List[bytes] = []
+        self.files_seen = 0
+        # 文件部分收到结束边界、整个报文收到结尾边界后才算完整，截断的请求体不能被当作成功上传
+        self.file_complete = False
+        self.finished = False
+
+    def callbacks(self) -> Dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_end": self.on_end,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+        self._value = []
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._name = options.get(b"name", b"").decode("utf-8", "replace")
+        self._is_file = self._name == self.file_field and b"filename" in options
+        if self._is_file:
+            self.files_seen += 1
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._is_file:
+            if self.files_seen == 1:
+                self.file_chunks.append(data[start:end])
+        else:
+            self._value.append(data[start:end])
+
+    def on_part_end(self):
+        if self._is_file:
+            if self.files_seen == 1:
+                self.file_complete = True
+        elif self._name:
+            self.fields[self._name] = b"".join(self._value).decode("utf-8", "replace")
+
+    def on_end(self):
+        self.finished = True
+
+async def receive_upload(
+    chunks: AsyncIterator[bytes],
+    content_type: str,
+    upload_dir: str,
+    max_bytes: int,
+    allowed_extensions: List[str],
+    file_field: str = "file"
+) -> StoredUpload:
+    content_type, params = parse_options_header(content_type)
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadError(415, "需要 multipart/form-data 上传")
+
+    collector = _PartCollector(file_field)
+    parser = MultipartParser(params[b"boundary"], collector.callbacks())
+    digest = hashlib.sha256()
+    size = 0
+    os.makedirs(upload_dir, exist_ok=True)
+    temp_path = os.path.join(upload_dir, f".upload-{new_id()}")
+    try:
+        async with aiofiles.open(temp_path, "wb") as f:
+            async for chunk in chunks:
+                parser.write(chunk)
+                if not collector.file_chunks:
+                    continue
+                data = b"".join(collector.file_chunks)
+                collector.file_chunks.clear()
+                size += len(data)
+                if size > max_bytes:
+                    raise UploadError(413, f"文件超过大小上限 {max_bytes} 字节")
+                digest.update(data)
+                await f.write(data)
+            parser.finalize()
+
+        if not collector.finished:
+            raise UploadError(400, "上传请求体不完整")
+        if collector.filename is None or not collector.file_complete:
+            raise UploadError(400, f"缺少文件字段 {file_field}")
+        ext = collector.filename.rsplit(".", 1)[-1].lower() if "." in collector.filename else ""
+        if ext not in allowed_extensions:
+            raise UploadError(415, f"不支持的文件格式: {ext}")
+        if size == 0:
+            raise UploadError(400, "文件为空")
+
+        sha256 = digest.hexdigest()
+        path = content_path(upload_dir, sha256, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, path)
+        return StoredUpload(sha256, size, path, collector.filename, collector.fields)
+    except MultipartParseError:
+        raise UploadError(400, "multipart 请求体格式错误")
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
@@ -0,0 +1,37 @@
+from services.paper_assembly import PaperAssembler, QuestionBank
+
+# 同义知识点：题目和请求可以用别名，题库索引与覆盖统计都按规范名称
+ALIASES = {"函数的极限": "函数极限", "极限": "函数极限"}
+
+def canonical(name: str) -> str:
+    return ALIASES.get(name, name)
+
+def make_bank() -> QuestionBank:
+    bank = QuestionBank(canonical)
+    bank.add_many([
+        {"id": "q1", "content": "求 x 趋于 0 时 sin x / x 的极限", "knowledge_point": "函数的极限",
+         "type": "choice", "difficulty": "easy", "score": 2},
+        {"id": "q2", "content": "利用夹逼准则证明数列收敛并求其极限值", "knowledge_point": "极限",
+         "type": "choice", "difficulty": "easy", "score": 5},
+        {"id": "q3", "content": "求曲线 y = x^3 在点 (1, 1) 处的切线方程", "knowledge_point": "导数",
+         "type": "choice", "difficulty": "easy", "score": 3},
+    ])
+    return bank
+
+def test_assemble_with_aliased_point():
+    result = PaperAssembler(make_bank()).assemble(1, {"easy": 1.0}, ["choice"], knowledge_points=["极限"], seed=1)
+    assert [q["id"] for q in result["questions"]] in (["q1"], ["q2"])
+    assert result["covered_points"] == ["函数极限"]
+    assert result["missing_points"] == []
+
+def test_missing_points_keep_requested_names():
+    result = PaperAssembler(make_bank()).assemble(2, {"easy": 1.0}, ["choice"],
+                                                   knowledge_points=["函数的极限", "定积分"], seed=1)
+    assert result["missing_points"] == ["定积分"]
+
+def test_adjust_score_uses_canonical_point():
+    # seed=1 时初选 q1（2 分）；调分按规范名称查候选，换成同知识点下别名不同的 q2（5 分）
+    result = PaperAssembler(make_bank()).assemble(1, {"easy": 1.0}, ["choice"], knowledge_points=["函数的极限"],
+                                                  total_score=5, seed=1)
+    assert result["total_score"] == 5.0
+    assert [q["id"] for q in result["questions"]] == ["q2"]